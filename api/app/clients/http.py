@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+import importlib.util
+import random
+
+import httpx
+
+from ..config import settings
+
+# HTTP/2 включается, только если установлен пакет h2 (httpx[http2]).
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+# Ответы, после которых запрос безопасно повторить: сервис перегружен или перезапускается.
+RETRY_STATUSES = {429, 502, 503, 504}
+# Ошибки до получения ответа; ReadTimeout не повторяем, чтобы не удваивать долгие вызовы.
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.PoolTimeout)
+
+
+def backoff_delay(attempt: int, base: float) -> float:
+    """Full jitter: случайная пауза до base·2^attempt, чтобы повторы не шли волной."""
+    return random.uniform(0, base * 2**attempt)
+
+
+def _limits(max_concurrency: int) -> httpx.Limits:
+    return httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+
+
+class AsyncServiceClient:
+    """Async-клиент сервиса (reranker, LLM) с keep-alive пулом, лимитом параллельных вызовов и повторами."""
+
+    def __init__(self, timeout: float, max_concurrency: int, retries: int | None = None, backoff_seconds: float | None = None):
+        self._retries = settings.http_retries if retries is None else retries
+        self._backoff = settings.http_backoff_seconds if backoff_seconds is None else backoff_seconds
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(timeout=timeout, limits=_limits(max_concurrency), http2=HTTP2_AVAILABLE)
+
+    async def post_json(self, url: str, payload: dict) -> dict:
+        attempt = 0
+        while True:
+            try:
+                async with self._slots:
+                    response = await self._client.post(url, json=payload)
+                if response.status_code not in RETRY_STATUSES or attempt >= self._retries:
+                    response.raise_for_status()
+                    return response.json()
+            except RETRY_ERRORS:
+                if attempt >= self._retries:
+                    raise
+            await asyncio.sleep(backoff_delay(attempt, self._backoff))
+            attempt += 1
+
+    @asynccontextmanager
+    async def stream(self, url: str, payload: dict):
+        """Потоковый POST без повторов: часть ответа уже могла уйти клиенту.
+
+        Выход из контекста (в т.ч. по отмене задачи) закрывает соединение, и сервис видит обрыв.
+        """
+        async with self._slots:
+            async with self._client.stream("POST", url, json=payload) as response:
+                response.raise_for_status()
+                yield response
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+_async_clients: dict[str, AsyncServiceClient] = {}
+
+
+def async_service_client(name: str, timeout: float, max_concurrency: int) -> AsyncServiceClient:
+    # Вызывается из event loop приложения, поэтому блокировка не нужна.
+    if name not in _async_clients:
+        _async_clients[name] = AsyncServiceClient(timeout, max_concurrency)
+    return _async_clients[name]
+
+
+async def close_clients() -> None:
+    for client in _async_clients.values():
+        await client.aclose()
+    _async_clients.clear()
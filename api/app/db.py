@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from .config import settings
@@ -6,6 +8,15 @@ from .config import settings
 engine = create_engine(settings.postgres_dsn, pool_pre_ping=True)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
+# Async-путь чата: тот же DSN с драйвером asyncpg.
+async_engine = create_async_engine(
+    make_url(settings.postgres_dsn).set(drivername="postgresql+asyncpg"),
+    pool_pre_ping=True,
+    pool_size=settings.async_db_pool_size,
+    max_overflow=settings.async_db_pool_size,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
 
 def get_db():
     db = SessionLocal()
@@ -1,12 +1,31 @@
+from contextlib import asynccontextmanager
+import logging
 from pathlib import Path
 
 from fastapi import FastAPI
 from fastapi.responses import FileResponse
 
+from .clients.http import close_clients
 from .config import settings
+from .db import async_engine
 from .routers.v1 import router as v1_router
+from .services.embeddings import warm_up_embedder
 
-app = FastAPI(title=settings.app_name)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.embedding_warmup:
+        # uvicorn не принимает соединения до конца startup, поэтому healthcheck проходит уже с прогретой моделью.
+        try:
+            await warm_up_embedder()
+        except Exception as exc:
+            logging.getLogger("uvicorn.error").warning("Прогрев эмбеддера не удался: %s", exc)
+    yield
+    await close_clients()
+    await async_engine.dispose()
+
+
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
 app.include_router(v1_router)
 
 
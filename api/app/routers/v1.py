@@ -2,8 +2,8 @@ from pathlib import Path
 import shutil
 
 from celery import Celery
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi import APIRouter, Depends, File, HTTPException, Response, UploadFile
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
@@ -11,6 +11,9 @@ from ..config import settings
 from ..db import get_db
 from ..schemas import ChatRequest, ChatResponse, JobOut, UploadResponse
 from ..services.chat import ChatService
+from ..services.embeddings import query_batcher, query_cache
+from ..services.progress import with_live_progress
+from ..services.rerank import cascade_stats
 from ..services.security import ensure_safe_path
 
 router = APIRouter(prefix="/v1")
@@ -28,6 +31,7 @@ def public_config():
         "rrf_k": settings.rrf_k,
         "final_top_n": settings.final_top_n,
         "rerank_top_n": settings.rerank_top_n,
+        "rerank_mode": settings.rerank_mode,
         "context_top_m": settings.context_top_m,
     }
 
@@ -64,24 +68,53 @@ def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
     return UploadResponse(document_id=doc, job_id=job_id)
 
 
+@router.get("/metrics")
+def metrics():
+    return {
+        "query_embedding_cache": query_cache.describe(),
+        "query_embedding_batches": query_batcher.describe(),
+        "rerank_cascade": cascade_stats.describe(),
+    }
+
+
 @router.get("/jobs/{job_id}", response_model=JobOut)
 def get_job(job_id: int, db: Session = Depends(get_db)):
     job = db.execute(text("SELECT * FROM jobs WHERE id=:id"), {"id": job_id}).mappings().first()
     if not job:
         raise HTTPException(status_code=404, detail="Job не найден")
+    # Текущее состояние — из Redis (воркер пишет его без лишних транзакций), история шагов — из Postgres.
+    job = with_live_progress([job])[0]
     steps = db.execute(text("SELECT step_name, status, progress, message FROM job_steps WHERE job_id=:job_id ORDER BY id"), {"job_id": job_id}).mappings().all()
-    return {**job, "steps": steps}
+    children = db.execute(text("SELECT id, status, current_step, progress, message FROM jobs WHERE parent_job_id=:job_id ORDER BY id"), {"job_id": job_id}).mappings().all()
+    return {**job, "steps": steps, "children": with_live_progress(children)}
 
 
 @router.get("/jobs")
 def list_jobs(db: Session = Depends(get_db)):
-    return db.execute(text("SELECT id, status, current_step, progress, queue_position, file_name, file_size_mb FROM jobs WHERE status IN ('queued','running') ORDER BY queue_position NULLS LAST, created_at"))\
+    jobs = with_live_progress(
+        db.execute(text("SELECT id, status, current_step, progress, queue_position, file_name, file_size_mb FROM jobs WHERE status IN ('queued','running') ORDER BY created_at"))
         .mappings().all()
+    )
+    # Позиция в очереди GPU живет в Redis; сортировка устойчива, поэтому внутри равных позиций порядок по created_at.
+    return sorted(jobs, key=lambda job: (job["queue_position"] is None, job["queue_position"] or 0))
 
 
 @router.post("/chat", response_model=ChatResponse)
-def chat(payload: ChatRequest, db: Session = Depends(get_db)):
-    return ChatService(db).ask(payload, settings)
+async def chat(payload: ChatRequest, response: Response):
+    service = ChatService()
+    result = await service.ask(payload, settings)
+    if settings.chat_timings_header or settings.debug_logs:
+        response.headers["X-RAG-Timings"] = service.timings.header()
+    return result
+
+
+@router.post("/chat/stream")
+async def chat_stream(payload: ChatRequest):
+    return StreamingResponse(
+        ChatService().stream(payload, settings),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/sources")
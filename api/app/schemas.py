@@ -14,6 +14,14 @@ class JobStepOut(BaseModel):
     message: str | None
 
 
+class JobChildOut(BaseModel):
+    id: int
+    status: str
+    current_step: str | None
+    progress: int
+    message: str | None
+
+
 class JobOut(BaseModel):
     id: int
     status: str
@@ -21,7 +29,9 @@ class JobOut(BaseModel):
     progress: int
     message: str | None
     created_at: datetime
+    parent_job_id: int | None = None
     steps: list[JobStepOut]
+    children: list[JobChildOut] = []
 
 
 class ChatRequest(BaseModel):
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Executor
+from typing import Callable
+
+import numpy as np
+
+from ..config import settings
+
+EmbedFn = Callable[[list[str]], np.ndarray]
+
+
+class EmbeddingBatcher:
+    """Склеивает одновременные запросы эмбеддинга в один батч ONNX.
+
+    Первый запрос открывает окно `max_wait_ms`; батч уходит в executor по истечении окна или как только
+    набралось `max_batch` текстов. Одинаковые тексты внутри батча считаются один раз. Батчи выполняются
+    в пуле потоков параллельно, пока в нем есть свободные потоки.
+    """
+
+    def __init__(
+        self,
+        embed: EmbedFn,
+        executor: Executor | None = None,
+        max_batch: int | None = None,
+        max_wait_ms: float | None = None,
+    ):
+        self._embed = embed
+        self._executor = executor
+        self._max_batch = max_batch or settings.embedding_batch_max_size
+        self._max_wait = (settings.embedding_batch_max_wait_ms if max_wait_ms is None else max_wait_ms) / 1000
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        # Сильные ссылки на запущенные батчи: event loop держит задачи слабо, и GC мог бы снять их на лету.
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.texts = 0
+
+    async def embed(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[: self._max_batch], self._pending[self._max_batch :]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self._max_wait, self._flush)
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        unique = list(dict.fromkeys(text for text, _ in batch))
+        self.batches += 1
+        self.texts += len(batch)
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(self._executor, self._embed, unique)
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        rows = dict(zip(unique, vectors))
+        for text, future in batch:
+            # Отмененный клиентом запрос просто не получает результат.
+            if not future.done():
+                future.set_result(rows[text])
+
+    def describe(self) -> dict:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self._max_batch,
+            "max_wait_ms": self._max_wait * 1000,
+        }
@@ -1,17 +1,25 @@
 from __future__ import annotations
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import lru_cache
+import threading
 
 import numpy as np
 import onnxruntime as ort
+from redis.asyncio import Redis
 from transformers import AutoTokenizer
 
 from ..config import settings
+from .embedding_batcher import EmbeddingBatcher
+from .query_cache import QueryEmbeddingCache, normalize_query
 
 
 @dataclass
 class EmbeddingBatch:
-    embeddings: list[list[float]]
+    # Матрица (n, dim) float32, C-contiguous, строки L2-нормированы.
+    embeddings: np.ndarray
 
 
 class OnnxEmbeddingModel:
@@ -24,7 +32,7 @@ class OnnxEmbeddingModel:
 
     def embed_texts(self, texts: list[str]) -> EmbeddingBatch:
         if not texts:
-            return EmbeddingBatch(embeddings=[])
+            return EmbeddingBatch(embeddings=np.empty((0, settings.embedding_dim), dtype=np.float32))
         tokens = self._tokenizer(
             texts,
             padding=True,
@@ -35,39 +43,83 @@ class OnnxEmbeddingModel:
         feeds = {name: tokens[name] for name in self._input_names if name in tokens}
         outputs = self._session.run(None, feeds)
         embeddings = self._select_embeddings(outputs, tokens)
-        normalized = [self._normalize(vec) for vec in embeddings]
-        return EmbeddingBatch(embeddings=normalized)
+        return EmbeddingBatch(embeddings=self._normalize(embeddings))
 
-    def _select_embeddings(self, outputs: list[np.ndarray], tokens) -> list[list[float]]:
+    def _select_embeddings(self, outputs: list[np.ndarray], tokens) -> np.ndarray:
         if not outputs:
             raise RuntimeError("ONNX модель не вернула выходы")
         output = outputs[0]
         if output.ndim == 2:
-            return output.astype(np.float32).tolist()
+            return np.array(output, dtype=np.float32, order="C")
         if output.ndim == 3:
             mask = tokens.get("attention_mask")
             if mask is None:
                 raise RuntimeError("Не найдена attention_mask для mean pooling")
             mask = mask.astype(np.float32)
-            summed = (output * mask[:, :, None]).sum(axis=1)
-            counts = np.clip(mask.sum(axis=1, keepdims=True), 1.0, None)
-            pooled = summed / counts
-            return pooled.astype(np.float32).tolist()
+            # einsum суммирует по токенам без промежуточного тензора (batch, seq, dim).
+            pooled = np.einsum("bsd,bs->bd", output.astype(np.float32, copy=False), mask)
+            pooled /= np.clip(mask.sum(axis=1, keepdims=True), 1.0, None)
+            return pooled
         raise RuntimeError(f"Неожиданная размерность выходов ONNX: {output.ndim}")
 
-    def _normalize(self, vec: list[float]) -> list[float]:
-        array = np.array(vec, dtype=np.float32)
-        norm = np.linalg.norm(array)
-        if norm == 0:
-            return array.tolist()
-        return (array / norm).tolist()
+    def _normalize(self, embeddings: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embeddings /= norms
+        return embeddings
+
+
+def to_pgvector_text(vectors: np.ndarray) -> list[str]:
+    """Текстовые литералы pgvector (`[x1,...,xn]`) для строк матрицы."""
+    template = _vector_template(vectors.shape[1])
+    return [template % tuple(row) for row in vectors.tolist()]
+
+
+@lru_cache(maxsize=4)
+def _vector_template(dim: int) -> str:
+    return "[" + ",".join(["%.7g"] * dim) + "]"
 
 
 _EMBEDDER: OnnxEmbeddingModel | None = None
+_EMBEDDER_LOCK = threading.Lock()
 
 
 def get_embedder() -> OnnxEmbeddingModel:
     global _EMBEDDER
-    if _EMBEDDER is None:
-        _EMBEDDER = OnnxEmbeddingModel(settings.embedding_model_path)
+    # Несколько потоков executor могут прийти сюда одновременно при первом запросе.
+    with _EMBEDDER_LOCK:
+        if _EMBEDDER is None:
+            _EMBEDDER = OnnxEmbeddingModel(settings.embedding_model_path)
     return _EMBEDDER
+
+
+_EMBEDDING_EXECUTOR = ThreadPoolExecutor(max_workers=settings.embedding_threads, thread_name_prefix="embed")
+query_cache = QueryEmbeddingCache(redis=Redis.from_url(settings.redis_url) if settings.query_cache_redis else None)
+
+
+def _embed_many(queries: list[str]) -> np.ndarray:
+    return get_embedder().embed_texts(queries).embeddings
+
+
+# ONNX-инференс уходит в свой пул потоков: event loop и общий threadpool FastAPI не блокируются.
+query_batcher = EmbeddingBatcher(_embed_many, _EMBEDDING_EXECUTOR)
+
+
+async def embed_query_vector(query: str) -> np.ndarray:
+    """Эмбеддинг запроса (float32, L2-норма 1) через кэш; промахи одновременных чатов считаются общим батчем."""
+    key = normalize_query(query)
+    vector = await query_cache.get(key)
+    if vector is None:
+        vector = await query_batcher.embed(key)
+        await query_cache.put(key, vector)
+    return vector
+
+
+async def embed_query_async(query: str) -> str:
+    """Эмбеддинг запроса поиска в виде литерала pgvector."""
+    return to_pgvector_text((await embed_query_vector(query))[None, :])[0]
+
+
+async def warm_up_embedder() -> None:
+    """Загружает ONNX-сессию и токенизатор и делает пробный прогон до приема запросов."""
+    await asyncio.get_running_loop().run_in_executor(_EMBEDDING_EXECUTOR, _embed_many, ["warm-up"])
@@ -0,0 +1,44 @@
+from redis import Redis, RedisError
+
+from ..config import settings
+
+redis_client = Redis.from_url(settings.redis_url, decode_responses=True)
+
+# Формат ключа совпадает с worker/app/progress.py.
+PROGRESS_KEY = "job_progress:{job_id}"
+
+
+def live_progress(job_ids: list[int]) -> dict[int, dict]:
+    """Живой прогресс jobs из Redis (status/current_step/progress/message, queue_position); без Redis — пустой результат."""
+    if not job_ids:
+        return {}
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hgetall(PROGRESS_KEY.format(job_id=job_id))
+        states = pipe.execute()
+    except RedisError:
+        return {}
+    live = {}
+    for job_id, state in zip(job_ids, states):
+        if not state:
+            continue
+        live[job_id] = {}
+        # Позицию в очереди GPU воркер пишет отдельно и может успеть раньше первого шага.
+        if "queue_position" in state:
+            live[job_id]["queue_position"] = int(state["queue_position"]) if state["queue_position"] else None
+        if "status" in state:
+            live[job_id].update(
+                status=state["status"],
+                current_step=state["step"] or None,
+                progress=int(state["progress"]),
+                message=state["message"] or None,
+            )
+    return live
+
+
+def with_live_progress(rows) -> list[dict]:
+    """Накладывает живой прогресс из Redis на строки jobs из Postgres."""
+    rows = [dict(row) for row in rows]
+    live = live_progress([row["id"] for row in rows])
+    return [{**row, **live.get(row["id"], {})} for row in rows]
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from redis import RedisError
+from redis.asyncio import Redis
+
+from ..config import settings
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Ключ кэша и текст для эмбеддинга: NFC и схлопнутые пробелы, как у чанков в воркере."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", query)).strip()
+
+
+@dataclass
+class QueryCacheStats:
+    hits: int = 0
+    redis_hits: int = 0
+    misses: int = 0
+
+    def describe(self) -> dict:
+        total = self.hits + self.redis_hits + self.misses
+        return {
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.redis_hits) / total, 4) if total else 0.0,
+        }
+
+
+class QueryEmbeddingCache:
+    """LRU с TTL для эмбеддингов запросов; при `query_cache_redis` второй уровень в Redis общий для реплик API.
+
+    Значения — строки float32 (dim,); в Redis лежат сырыми байтами под ключом модели и sha256 запроса.
+    """
+
+    def __init__(self, max_items: int | None = None, ttl_seconds: int | None = None, redis: Redis | None = None):
+        self._max_items = max_items or settings.query_cache_max_items
+        self._ttl = ttl_seconds or settings.query_cache_ttl_seconds
+        self._redis = redis
+        self._items: OrderedDict[str, tuple[float, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_id = f"{settings.embedding_model_path}:{settings.embedding_max_tokens}"
+        self.stats = QueryCacheStats()
+
+    def _redis_key(self, key: str) -> str:
+        digest = hashlib.sha256(f"{self._model_id}\n{key}".encode("utf-8")).hexdigest()
+        return f"query_embedding:{digest}"
+
+    def get_local(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, vector = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            self.stats.hits += 1
+            return vector
+
+    def put_local(self, key: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._items[key] = (time.monotonic() + self._ttl, vector)
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_items:
+                self._items.popitem(last=False)
+
+    async def get(self, key: str) -> np.ndarray | None:
+        vector = self.get_local(key)
+        if vector is not None:
+            return vector
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(self._redis_key(key))
+            except RedisError:
+                raw = None
+            if raw:
+                vector = np.frombuffer(raw, dtype=np.float32)
+                self.put_local(key, vector)
+                self.stats.redis_hits += 1
+                return vector
+        self.stats.misses += 1
+        return None
+
+    async def put(self, key: str, vector: np.ndarray) -> None:
+        self.put_local(key, vector)
+        if self._redis is not None:
+            try:
+                await self._redis.set(self._redis_key(key), vector.astype(np.float32).tobytes(), ex=self._ttl)
+            except RedisError:
+                pass
+
+    def describe(self) -> dict:
+        return {**self.stats.describe(), "size": len(self._items), "max_items": self._max_items, "redis": self._redis is not None}
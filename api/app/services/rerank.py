@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+
+@dataclass
+class CascadePlan:
+    # Порядок кандидатов по dense_score (индексы в списке чанков).
+    order: list[int]
+    # Неоднозначная верхушка для тяжелого reranker; пусто — лидер очевиден, вторая ступень не нужна.
+    heavy: list[int]
+
+
+@dataclass
+class CascadeStats:
+    queries: int = 0
+    heavy_skipped: int = 0
+    passages_sent: int = 0
+
+    def describe(self) -> dict:
+        return {
+            "queries": self.queries,
+            "heavy_skipped": self.heavy_skipped,
+            "skip_rate": round(self.heavy_skipped / self.queries, 4) if self.queries else 0.0,
+            "avg_passages_sent": round(self.passages_sent / self.queries, 2) if self.queries else 0.0,
+        }
+
+
+cascade_stats = CascadeStats()
+
+
+def plan_cascade(dense_scores: list[float | None], top_k: int, margin: float) -> CascadePlan | None:
+    """Первая ступень каскада: сортировка по косинусу и решение, нужен ли тяжелый reranker.
+
+    None — у части кандидатов нет dense_score, каскад неприменим.
+    """
+    if not dense_scores or any(score is None for score in dense_scores):
+        return None
+    order = sorted(range(len(dense_scores)), key=lambda idx: dense_scores[idx], reverse=True)
+    if len(order) == 1 or dense_scores[order[0]] - dense_scores[order[1]] >= margin:
+        return CascadePlan(order=order, heavy=[])
+    return CascadePlan(order=order, heavy=order[:top_k])
+
+
+def apply_heavy_order(plan: CascadePlan, heavy_order: list[int]) -> list[int]:
+    """Итоговый порядок: верхушка по оценкам тяжелой модели (позиции в `plan.heavy`), дальше хвост по косинусу."""
+    head = [plan.heavy[pos] for pos in heavy_order if pos < len(plan.heavy)]
+    # Кандидаты, которых reranker не вернул (top_n меньше среза), остаются в порядке косинуса.
+    head += [idx for idx in plan.heavy if idx not in head]
+    return head + plan.order[len(plan.heavy) :]
@@ -1,20 +1,77 @@
+import asyncio
 from collections import defaultdict
+
 from sqlalchemy import text
 
-from .embeddings import get_embedder
+from ..config import settings
+from ..db import AsyncSessionLocal
+from .embeddings import embed_query_async
+from .timings import Timings
+
+
+# Оба набора кандидатов и RRF в одном запросе; content/meta читаются только для final_top_n победителей.
+# dense_score — косинус к запросу по сохраненным эмбеддингам, первая ступень каскадного rerank;
+# title/relative_path документа идут в той же строке для цитат без отдельных запросов.
+_FUSED_SQL = """
+    WITH bm25 AS (
+        SELECT c.id, ROW_NUMBER() OVER (ORDER BY paradedb.score(c.id) DESC) AS rank
+        FROM chunks c
+        JOIN documents d ON d.id = c.document_id
+        WHERE {where} AND c.content @@@ :query
+        ORDER BY paradedb.score(c.id) DESC
+        LIMIT :bm25_top_k
+    ),
+    vec AS (
+        SELECT c.id, ROW_NUMBER() OVER (ORDER BY c.embedding <=> CAST(:embedding AS vector)) AS rank
+        FROM chunks c
+        JOIN documents d ON d.id = c.document_id
+        WHERE {where}
+        ORDER BY c.embedding <=> CAST(:embedding AS vector)
+        LIMIT :vector_top_k
+    ),
+    fused AS (
+        SELECT id, SUM(1.0 / (:rrf_k + rank)) AS score
+        FROM (SELECT id, rank FROM bm25 UNION ALL SELECT id, rank FROM vec) hits
+        GROUP BY id
+        ORDER BY score DESC, id
+        LIMIT :final_top_n
+    )
+    SELECT c.id, c.document_id, c.content, c.meta->>'page_or_sheet' AS page_or_sheet, f.score,
+           1 - (c.embedding <=> CAST(:embedding AS vector)) AS dense_score,
+           d.title, d.relative_path
+    FROM fused f
+    JOIN chunks c ON c.id = f.id
+    JOIN documents d ON d.id = c.document_id
+    ORDER BY f.score DESC, c.id
+"""
 
 
 class RetrievalService:
-    def __init__(self, db):
-        self.db = db
+    """Гибридный поиск BM25 + вектор с RRF.
+
+    По умолчанию (`retrieval_fused_sql`) оба поиска и слияние идут одним запросом после эмбеддинга
+    запроса. Запасной режим — два запроса в отдельных сессиях параллельно (BM25 стартует сразу,
+    векторный — как только готов эмбеддинг) и RRF в Python.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, fused: bool | None = None):
+        self.session_factory = session_factory
+        self.fused = settings.retrieval_fused_sql if fused is None else fused
+
+    async def _fetch(self, sql, params: dict) -> list:
+        async with self.session_factory() as session:
+            return (await session.execute(sql, params)).mappings().all()
 
-    def _embed_query(self, query: str) -> str:
-        embedder = get_embedder()
-        batch = embedder.embed_texts([query])
-        vec = batch.embeddings[0]
-        return "[" + ",".join(f"{x:.6f}" for x in vec) + "]"
+    async def _timed_fetch(self, sql, params: dict, timings: Timings, stage: str) -> list:
+        with timings.measure(stage):
+            return await self._fetch(sql, params)
 
-    def hybrid_search(
+    async def _vector_rows(self, sql, query: str, params: dict, timings: Timings) -> list:
+        with timings.measure("embed"):
+            embedding = await embed_query_async(query)
+        return await self._timed_fetch(sql, {**params, "embedding": embedding}, timings, "vector")
+
+    async def hybrid_search(
         self,
         query: str,
         mode: str,
@@ -25,7 +82,10 @@ class RetrievalService:
         vector_top_k: int,
         rrf_k: int,
         final_top_n: int,
+        timings: Timings | None = None,
     ):
+        """Кандидаты для rerank; время стадий (embed, bm25, vector, fuse или search для общего SQL) пишется в `timings`."""
+        timings = timings or Timings()
         filters = ["d.deleted_at IS NULL"]
         params = {"query": query, "bm25_top_k": bm25_top_k, "vector_top_k": vector_top_k, "rrf_k": rrf_k}
 
@@ -38,11 +98,22 @@ class RetrievalService:
         if subpath:
             cleaned = subpath.strip().lstrip("/")
             filters.append("d.relative_path ILIKE :subpath")
-            params["subpath"] = f\"{cleaned}%\"
+            params["subpath"] = f"{cleaned}%"
 
         where_clause = " AND ".join(filters)
+        if self.fused:
+            with timings.measure("embed"):
+                embedding = await embed_query_async(query)
+            return await self._timed_fetch(
+                text(_FUSED_SQL.format(where=where_clause)),
+                {**params, "embedding": embedding, "final_top_n": final_top_n},
+                timings,
+                "search",
+            )
+
         bm25_sql = text(f"""
             SELECT c.id, c.document_id, c.content, c.meta->>'page_or_sheet' AS page_or_sheet,
+                   d.title, d.relative_path,
                    ROW_NUMBER() OVER (ORDER BY paradedb.score(c.id) DESC) AS rank
             FROM chunks c
             JOIN documents d ON d.id = c.document_id
@@ -50,8 +121,11 @@ class RetrievalService:
             ORDER BY paradedb.score(c.id) DESC
             LIMIT :bm25_top_k
         """)
+        # dense_score есть только у векторных кандидатов; каскад без него переходит к полному rerank.
         vector_sql = text(f"""
             SELECT c.id, c.document_id, c.content, c.meta->>'page_or_sheet' AS page_or_sheet,
+                   1 - (c.embedding <=> CAST(:embedding AS vector)) AS dense_score,
+                   d.title, d.relative_path,
                    ROW_NUMBER() OVER (ORDER BY c.embedding <=> CAST(:embedding AS vector)) AS rank
             FROM chunks c
             JOIN documents d ON d.id = c.document_id
@@ -60,19 +134,24 @@ class RetrievalService:
             LIMIT :vector_top_k
         """)
 
-        params["embedding"] = self._embed_query(query)
-        bm25_rows = self.db.execute(bm25_sql, params).mappings().all()
-        vec_rows = self.db.execute(vector_sql, params).mappings().all()
-
-        scored: dict[int, float] = defaultdict(float)
-        rows_by_id = {}
-        for row in bm25_rows:
-            rows_by_id[row["id"]] = row
-            scored[row["id"]] += 1.0 / (rrf_k + row["rank"])
-        for row in vec_rows:
-            rows_by_id[row["id"]] = row
-            scored[row["id"]] += 1.0 / (rrf_k + row["rank"])
-
-        ranked = sorted(scored.items(), key=lambda x: x[1], reverse=True)[:final_top_n]
-        chunk_ids = [chunk_id for chunk_id, _ in ranked]
-        return [rows_by_id[cid] for cid in chunk_ids]
+        bm25_rows, vec_rows = await asyncio.gather(
+            self._timed_fetch(bm25_sql, params, timings, "bm25"), self._vector_rows(vector_sql, query, params, timings)
+        )
+        with timings.measure("fuse"):
+            return rrf_fuse(bm25_rows, vec_rows, rrf_k, final_top_n)
+
+
+def rrf_fuse(bm25_rows: list, vec_rows: list, rrf_k: int, final_top_n: int) -> list:
+    """Reciprocal Rank Fusion на стороне Python (режим `retrieval_fused_sql=False`)."""
+    scored: dict[int, float] = defaultdict(float)
+    rows_by_id = {}
+    for row in bm25_rows:
+        rows_by_id[row["id"]] = row
+        scored[row["id"]] += 1.0 / (rrf_k + row["rank"])
+    for row in vec_rows:
+        rows_by_id[row["id"]] = row
+        scored[row["id"]] += 1.0 / (rrf_k + row["rank"])
+
+    ranked = sorted(scored.items(), key=lambda x: x[1], reverse=True)[:final_top_n]
+    chunk_ids = [chunk_id for chunk_id, _ in ranked]
+    return [rows_by_id[cid] for cid in chunk_ids]
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import time
+from typing import Iterator
+
+
+class Timings:
+    """Разбивка времени запроса чата по стадиям для отладочного заголовка `X-RAG-Timings`."""
+
+    def __init__(self):
+        self._stages: dict[str, float] = {}
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stages[stage] = self._stages.get(stage, 0.0) + time.perf_counter() - started
+
+    def header(self) -> str:
+        """`embed=12.3, bm25=4.0, ...` в миллисекундах в порядке стадий."""
+        return ", ".join(f"{stage}={seconds * 1000:.1f}" for stage, seconds in self._stages.items())
@@ -0,0 +1,77 @@
+"""Бенчмарк микробатчинга эмбеддингов запросов на модели BGE-M3 (ONNX).
+
+Запускает 1/8/32 одновременных корутин, каждая последовательно запрашивает эмбеддинги уникальных
+вопросов (кэш не участвует). Сравнивает прежний путь — батч из одного запроса на вызов — с
+`EmbeddingBatcher` и печатает пропускную способность и средний размер батча.
+
+    python api/benchmarks/bench_query_batching.py --requests 256 --threads 2 --max-wait-ms 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "api"))
+
+from app.services.embedding_batcher import EmbeddingBatcher  # noqa: E402
+from app.services.embeddings import get_embedder  # noqa: E402
+
+QUESTIONS = [
+    "Какие сроки хранения документов",
+    "Кто утверждает регламент закупок",
+    "Порядок согласования договора",
+    "Требования к отчетности по проекту",
+]
+
+
+async def _run(embed, concurrency: int, requests: int) -> float:
+    counter = iter(range(requests))
+
+    async def caller() -> None:
+        for idx in counter:
+            await embed(f"{QUESTIONS[idx % len(QUESTIONS)]} №{idx}?")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - start)
+
+
+async def _bench(args) -> None:
+    model = get_embedder()
+    executor = ThreadPoolExecutor(args.threads, thread_name_prefix="embed")
+    loop = asyncio.get_running_loop()
+    embed_many = lambda texts: model.embed_texts(texts).embeddings  # noqa: E731
+    embed_many(["warm-up"])
+
+    async def single(text: str):
+        return (await loop.run_in_executor(executor, embed_many, [text]))[0]
+
+    for concurrency in args.concurrency:
+        batcher = EmbeddingBatcher(embed_many, executor, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+        plain = await _run(single, concurrency, args.requests)
+        batched = await _run(batcher.embed, concurrency, args.requests)
+        print(
+            f"параллельно {concurrency:>3}: по одному {plain:7.1f} запр/с, "
+            f"микробатч {batched:7.1f} запр/с (средний батч {batcher.describe()['avg_batch']})"
+        )
+    executor.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 8, 32])
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    asyncio.run(_bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
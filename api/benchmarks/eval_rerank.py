@@ -0,0 +1,95 @@
+"""Оценка режимов rerank (full / cascade / dense) на размеченном наборе вопросов: качество и задержка.
+
+Набор — JSONL, по строке на вопрос:
+
+    {"question": "...", "relevant_document_ids": [12, 40], "mode": "nas", "source_ids": [1]}
+
+Для каждого вопроса поиск выполняется один раз, затем кандидаты упорядочиваются каждым режимом.
+Печатает hit@m и MRR@m по документам в первых `context_top_m` фрагментах, p50/p95 задержки
+стадии rerank и долю вопросов, где тяжелый reranker не вызывался. Нужны Postgres и сервис reranker
+из настроек API.
+
+    python api/benchmarks/eval_rerank.py --queries eval/queries.jsonl --margin 0.05 0.08 0.12
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from pathlib import Path
+import sys
+import time
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "api"))
+
+from app.config import settings  # noqa: E402
+from app.services.chat import ChatService  # noqa: E402
+from app.services.rerank import cascade_stats  # noqa: E402
+from app.services.retrieval import RetrievalService  # noqa: E402
+
+
+def _reciprocal_rank(document_ids: list[int], relevant: set[int]) -> float:
+    for position, document_id in enumerate(document_ids, start=1):
+        if document_id in relevant:
+            return 1.0 / position
+    return 0.0
+
+
+async def _evaluate(args) -> None:
+    labeled = [json.loads(line) for line in Path(args.queries).read_text(encoding="utf-8").splitlines() if line.strip()]
+    retrieval = RetrievalService()
+    candidates = []
+    for item in labeled:
+        chunks = await retrieval.hybrid_search(
+            query=item["question"],
+            mode=item.get("mode", "nas"),
+            source_ids=item.get("source_ids", []),
+            temp_document_id=None,
+            subpath=item.get("subpath"),
+            bm25_top_k=settings.bm25_top_k,
+            vector_top_k=settings.vector_top_k,
+            rrf_k=settings.rrf_k,
+            final_top_n=settings.final_top_n,
+        )
+        candidates.append([dict(row) for row in chunks])
+
+    variants = [("full", None), ("dense", None)] + [("cascade", margin) for margin in args.margin]
+    print(f"вопросов: {len(labeled)}, context_top_m={settings.context_top_m}")
+    for mode, margin in variants:
+        update = {"rerank_mode": mode}
+        if margin is not None:
+            update["rerank_cascade_margin"] = margin
+        cfg = settings.model_copy(update=update)
+        chat = ChatService()
+        skipped_before = cascade_stats.heavy_skipped
+        latencies, hits, reciprocal = [], [], []
+        for item, chunks in zip(labeled, candidates):
+            started = time.perf_counter()
+            ranked = await chat._rerank_chunks(item["question"], chunks, cfg)
+            latencies.append(time.perf_counter() - started)
+            document_ids = [row["document_id"] for row in ranked[: settings.context_top_m]]
+            relevant = set(item["relevant_document_ids"])
+            hits.append(bool(relevant.intersection(document_ids)))
+            reciprocal.append(_reciprocal_rank(document_ids, relevant))
+        p50, p95 = np.percentile(np.array(latencies) * 1000, [50, 95])
+        name = mode if margin is None else f"cascade margin={margin}"
+        skipped = cascade_stats.heavy_skipped - skipped_before if mode != "full" else 0
+        print(
+            f"{name:<24} hit@m {np.mean(hits):.3f}  MRR@m {np.mean(reciprocal):.3f}  "
+            f"rerank p50 {p50:.0f} ms, p95 {p95:.0f} ms  без тяжелой модели {skipped}/{len(labeled)}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", required=True)
+    parser.add_argument("--margin", type=float, nargs="*", default=[settings.rerank_cascade_margin])
+    asyncio.run(_evaluate(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Нагрузочный тест /v1/chat: RPS и перцентили задержки при N одновременных чатах.
+
+Шлет `--requests` запросов с `--concurrency` параллельными клиентами на запущенный API и печатает
+RPS, p50/p95/p99 и число ошибок. Для сравнения реализаций запустите скрипт против API до и после
+изменения с одинаковыми вопросами и данными.
+
+    python api/benchmarks/load_chat.py --url http://localhost:8000 --concurrency 50 --requests 1000 --mode nas
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+QUESTIONS = [
+    "Какие сроки хранения документов?",
+    "Кто утверждает регламент закупок?",
+    "Порядок согласования договора",
+    "Требования к отчетности по проекту",
+]
+
+
+async def _worker(client: httpx.AsyncClient, args, queue: asyncio.Queue, latencies: list[float], errors: list[str]) -> None:
+    while True:
+        try:
+            idx = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        payload = {"mode": args.mode, "question": QUESTIONS[idx % len(QUESTIONS)], "source_ids": args.source_ids}
+        start = time.perf_counter()
+        try:
+            response = await client.post(f"{args.url}/v1/chat", json=payload)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError as exc:
+            errors.append(type(exc).__name__)
+
+
+async def _run(args) -> None:
+    queue: asyncio.Queue = asyncio.Queue()
+    for idx in range(args.requests):
+        queue.put_nowait(idx)
+    latencies: list[float] = []
+    errors: list[str] = []
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(_worker(client, args, queue, latencies, errors) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    print(f"запросов: {args.requests}, параллельно: {args.concurrency}, за {elapsed:.1f} s")
+    print(f"RPS: {len(latencies) / elapsed:.1f}, ошибок: {len(errors)}")
+    if latencies:
+        p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        print(f"задержка, ms: p50 {p50:.0f}, p95 {p95:.0f}, p99 {p99:.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--mode", default="nas")
+    parser.add_argument("--source-ids", type=int, nargs="*", default=[])
+    parser.add_argument("--timeout", type=float, default=120)
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+-- Кэш эмбеддингов чанков: ключ = модель + sha256 нормализованного текста.
+-- Вектор хранится как сырые float32 (little-endian), чтобы worker читал его через np.frombuffer.
+CREATE TABLE IF NOT EXISTS embedding_cache (
+  model_id TEXT NOT NULL,
+  text_hash TEXT NOT NULL,
+  embedding BYTEA NOT NULL,
+  last_used_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (model_id, text_hash)
+);
+
+CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache(last_used_at);
@@ -0,0 +1,4 @@
+-- Отпечаток текста чанка (sha256 нормализованного текста) для переиндексации без delete-all.
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS fingerprint TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_chunks_document_fingerprint ON chunks(document_id, fingerprint);
@@ -0,0 +1,5 @@
+-- Родительские/дочерние jobs для NAS-скана, разбитого на Celery-подзадачи.
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS parent_job_id BIGINT REFERENCES jobs(id) ON DELETE CASCADE;
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS meta JSONB NOT NULL DEFAULT '{}'::jsonb;
+
+CREATE INDEX IF NOT EXISTS idx_jobs_parent_job_id ON jobs(parent_job_id);
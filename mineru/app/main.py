@@ -6,9 +6,18 @@ app = FastAPI(title="mineru")
 
 class ParseRequest(BaseModel):
     file_path: str
+    # Диапазоны страниц [start, end] включительно, с 1; None — весь документ.
+    pages: list[tuple[int, int]] | None = None
 
 
 @app.post('/v1/parse')
 def parse(payload: ParseRequest):
     # Заглушка MinerU-сервиса для smoke и локального запуска.
-    return {"text": f"MinerU text for {payload.file_path}", "quality_score": 0.72}
+    if not payload.pages:
+        return {"text": f"MinerU text for {payload.file_path}", "quality_score": 0.72}
+    pages = [
+        {"page": page, "text": f"MinerU text for {payload.file_path}, page {page}", "quality_score": 0.72}
+        for start, end in payload.pages
+        for page in range(start, end + 1)
+    ]
+    return {"text": "\n".join(item["text"] for item in pages), "quality_score": 0.72, "pages": pages}
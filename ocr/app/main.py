@@ -6,9 +6,23 @@ app = FastAPI(title="ocr")
 
 class OCRRequest(BaseModel):
     file_path: str
+    # Диапазоны страниц [start, end] включительно, с 1; None — весь документ.
+    pages: list[tuple[int, int]] | None = None
 
 
 @app.post('/v1/ocr')
 def ocr(payload: OCRRequest):
     # Заглушка OCR-сервиса для smoke и локального запуска.
-    return {"text": f"OCR text for {payload.file_path}", "quality_score": 0.88, "pages_processed": 3}
+    if not payload.pages:
+        return {"text": f"OCR text for {payload.file_path}", "quality_score": 0.88, "pages_processed": 3}
+    pages = [
+        {"page": page, "text": f"OCR text for {payload.file_path}, page {page}", "quality_score": 0.88}
+        for start, end in payload.pages
+        for page in range(start, end + 1)
+    ]
+    return {
+        "text": "\n".join(item["text"] for item in pages),
+        "quality_score": 0.88,
+        "pages_processed": len(pages),
+        "pages": pages,
+    }
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import Executor
+import hashlib
+import threading
+from typing import Callable
+
+import numpy as np
+
+ScoreFn = Callable[[list[str], list[str]], np.ndarray]
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class ScoreCache:
+    """LRU оценок пар (hash запроса, hash фрагмента): перегенерация ответа и переформулировки не гоняют модель повторно."""
+
+    def __init__(self, max_items: int):
+        self._max_items = max_items
+        self._items: OrderedDict[tuple[bytes, bytes], float] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, query: str, passages: list[str]) -> tuple[list[float | None], list[tuple[bytes, bytes]]]:
+        query_key = _digest(query)
+        keys = [(query_key, _digest(passage)) for passage in passages]
+        scores: list[float | None] = []
+        with self._lock:
+            for key in keys:
+                score = self._items.get(key)
+                if score is not None:
+                    self._items.move_to_end(key)
+                scores.append(score)
+            hits = sum(score is not None for score in scores)
+            self.hits += hits
+            self.misses += len(scores) - hits
+        return scores, keys
+
+    def store(self, keys: list[tuple[bytes, bytes]], scores: list[float]) -> None:
+        if self._max_items <= 0:
+            return
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._items[key] = score
+                self._items.move_to_end(key)
+            while len(self._items) > self._max_items:
+                self._items.popitem(last=False)
+
+    def describe(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def plan_batches(lengths: list[int], token_budget: int, max_batch: int) -> list[list[int]]:
+    """Разбивает пары на подбатчи по длине: внутри подбатча паддинг идет до близких длин.
+
+    Стоимость подбатча — `len(batch) * max_len` токенов, она не превышает `token_budget`
+    (одна пара длиннее бюджета уходит отдельным батчем).
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    batches: list[list[int]] = []
+    current: list[int] = []
+    for idx in order:
+        # Порядок возрастающий, поэтому текущая пара — самая длинная в подбатче.
+        if current and ((len(current) + 1) * lengths[idx] > token_budget or len(current) >= max_batch):
+            batches.append(current)
+            current = []
+        current.append(idx)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def top_scores(scores: np.ndarray, top_n: int) -> list[tuple[int, float]]:
+    """Индексы и оценки `top_n` лучших по убыванию; полная сортировка только выбранных."""
+    if top_n <= 0 or scores.size == 0:
+        return []
+    if top_n < scores.size:
+        picked = np.argpartition(-scores, top_n - 1)[:top_n]
+    else:
+        picked = np.arange(scores.size)
+    picked = picked[np.argsort(-scores[picked], kind="stable")]
+    return [(int(idx), float(scores[idx])) for idx in picked]
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными границами корзин в миллисекундах."""
+
+    BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self._counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self._sum_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        ms = seconds * 1000
+        with self._lock:
+            self._counts[bisect_left(self.BOUNDS_MS, ms)] += 1
+            self._sum_ms += ms
+
+    def describe(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total_ms = self._sum_ms
+        buckets = {f"le_{bound}": count for bound, count in zip(self.BOUNDS_MS, counts)}
+        buckets["inf"] = counts[-1]
+        total = sum(counts)
+        return {"count": total, "avg_ms": round(total_ms / total, 2) if total else 0.0, "buckets": buckets}
+
+
+class PairBatcher:
+    """Склеивает пары одновременных запросов rerank в один прогон модели.
+
+    Первый запрос открывает окно `max_wait_ms`; накопленные пары уходят в executor по истечении окна
+    или как только их набралось `max_pairs`. Прогоны идут в одном потоке: параллелизм дает ONNX внутри батча.
+    """
+
+    def __init__(self, score: ScoreFn, executor: Executor, max_pairs: int, max_wait_ms: float):
+        self._score = score
+        self._executor = executor
+        self._max_pairs = max_pairs
+        self._max_wait = max_wait_ms / 1000
+        self._pending: list[tuple[str, list[str], asyncio.Future]] = []
+        self._pending_pairs = 0
+        self._timer: asyncio.TimerHandle | None = None
+        # Сильные ссылки на запущенные прогоны, как в EmbeddingBatcher API.
+        self._tasks: set[asyncio.Task] = set()
+        self.runs = 0
+        self.requests = 0
+
+    async def score(self, query: str, passages: list[str]) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, passages, future))
+        self._pending_pairs += len(passages)
+        if self._pending_pairs >= self._max_pairs:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_pairs = self._pending, [], 0
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[str, list[str], asyncio.Future]]) -> None:
+        queries = [query for query, passages, _ in batch for _ in passages]
+        passages = [passage for _, request_passages, _ in batch for passage in request_passages]
+        self.runs += 1
+        self.requests += len(batch)
+        try:
+            scores = await asyncio.get_running_loop().run_in_executor(self._executor, self._score, queries, passages)
+        except Exception as exc:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        offset = 0
+        for _, request_passages, future in batch:
+            if not future.done():
+                future.set_result(scores[offset : offset + len(request_passages)])
+            offset += len(request_passages)
+
+    def describe(self) -> dict:
+        return {
+            "runs": self.runs,
+            "requests": self.requests,
+            "avg_requests_per_run": round(self.requests / self.runs, 2) if self.runs else 0.0,
+        }
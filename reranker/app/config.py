@@ -6,6 +6,14 @@ class Settings(BaseSettings):
     reranker_model_path: str = "/models/bge-reranker-v2-gemma/model.onnx"
     reranker_onnx_providers: list[str] = ["CPUExecutionProvider"]
     reranker_max_tokens: int = 512
+    # LRU оценок (запрос, фрагмент); 0 — без кэша
+    reranker_cache_items: int = 50000
+    # Подбатчи по длине: пар × max длина в токенах на один прогон ONNX, не больше max_batch пар
+    reranker_token_budget: int = 16384
+    reranker_max_batch: int = 64
+    # Склейка одновременных запросов: окно ожидания и число пар, после которого прогон стартует сразу
+    reranker_batch_wait_ms: float = 5.0
+    reranker_batch_max_pairs: int = 128
 
 
 settings = Settings()
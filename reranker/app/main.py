@@ -1,9 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
 from fastapi import FastAPI
 import numpy as np
 import onnxruntime as ort
 from pydantic import BaseModel
 from transformers import AutoTokenizer
 
+from .batching import LatencyHistogram, PairBatcher, ScoreCache, plan_batches, top_scores
 from .config import settings
 
 app = FastAPI(title="reranker")
@@ -11,6 +15,10 @@ _SESSION = ort.InferenceSession(settings.reranker_model_path, providers=settings
 _TOKENIZER = AutoTokenizer.from_pretrained(settings.models_dir + "/bge-reranker-v2-gemma", use_fast=True)
 _INPUT_NAMES = {inp.name for inp in _SESSION.get_inputs()}
 
+_CACHE = ScoreCache(settings.reranker_cache_items)
+_REQUEST_LATENCY = LatencyHistogram()
+_ONNX_LATENCY = LatencyHistogram()
+
 
 class RerankRequest(BaseModel):
     query: str
@@ -18,33 +26,63 @@ class RerankRequest(BaseModel):
     top_n: int = 5
 
 
+def _score_pairs(queries: list[str], passages: list[str]) -> np.ndarray:
+    """Оценки пар подбатчами близкой длины в пределах бюджета токенов."""
+    tokens = _TOKENIZER(queries, passages, truncation=True, max_length=settings.reranker_max_tokens)
+    names = [name for name in tokens.keys() if name in _INPUT_NAMES]
+    lengths = [len(ids) for ids in tokens["input_ids"]]
+    scores = np.empty(len(lengths), dtype=np.float32)
+    for batch in plan_batches(lengths, settings.reranker_token_budget, settings.reranker_max_batch):
+        features = _TOKENIZER.pad({name: [tokens[name][idx] for idx in batch] for name in names}, return_tensors="np")
+        started = time.perf_counter()
+        outputs = _SESSION.run(None, {name: features[name] for name in names})
+        _ONNX_LATENCY.observe(time.perf_counter() - started)
+        scores[batch] = _select_scores(outputs)
+    return scores
+
+
+# Один поток: прогоны не конкурируют за ядра, ONNX сам распараллеливает батч.
+_BATCHER = PairBatcher(
+    _score_pairs,
+    ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank"),
+    settings.reranker_batch_max_pairs,
+    settings.reranker_batch_wait_ms,
+)
+
+
 @app.post('/v1/rerank')
-def rerank(payload: RerankRequest):
+async def rerank(payload: RerankRequest):
     if not payload.passages:
         return {"items": []}
-    tokens = _TOKENIZER(
-        [payload.query] * len(payload.passages),
-        payload.passages,
-        padding=True,
-        truncation=True,
-        max_length=settings.reranker_max_tokens,
-        return_tensors="np",
-    )
-    feeds = {name: tokens[name] for name in _INPUT_NAMES if name in tokens}
-    outputs = _SESSION.run(None, feeds)
-    scores = _select_scores(outputs)
-    scored = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)
-    return {"items": [{"index": idx, "score": float(score)} for idx, score in scored[: payload.top_n]]}
-
-
-def _select_scores(outputs: list[np.ndarray]) -> list[float]:
+    started = time.perf_counter()
+    cached, keys = _CACHE.lookup(payload.query, payload.passages)
+    missing = [idx for idx, score in enumerate(cached) if score is None]
+    scores = np.array([np.nan if score is None else score for score in cached], dtype=np.float32)
+    if missing:
+        fresh = await _BATCHER.score(payload.query, [payload.passages[idx] for idx in missing])
+        scores[missing] = fresh
+        _CACHE.store([keys[idx] for idx in missing], fresh.tolist())
+    items = [{"index": idx, "score": score} for idx, score in top_scores(scores, payload.top_n)]
+    _REQUEST_LATENCY.observe(time.perf_counter() - started)
+    return {"items": items}
+
+
+@app.get('/v1/metrics')
+def metrics():
+    return {
+        "cache": _CACHE.describe(),
+        "batching": _BATCHER.describe(),
+        "request_latency": _REQUEST_LATENCY.describe(),
+        "onnx_latency": _ONNX_LATENCY.describe(),
+    }
+
+
+def _select_scores(outputs: list[np.ndarray]) -> np.ndarray:
     if not outputs:
-        return []
+        return np.empty(0, dtype=np.float32)
     output = outputs[0]
-    if output.ndim == 2 and output.shape[1] == 1:
-        return output[:, 0].astype(np.float32).tolist()
     if output.ndim == 1:
-        return output.astype(np.float32).tolist()
+        return output.astype(np.float32, copy=False)
     if output.ndim == 2:
-        return output[:, 0].astype(np.float32).tolist()
+        return output[:, 0].astype(np.float32)
     raise RuntimeError(f"Неожиданная размерность выходов ONNX: {output.ndim}")
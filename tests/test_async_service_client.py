@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("pydantic_settings")
+
+from api.app.clients.http import AsyncServiceClient  # noqa: E402
+
+
+def _client(handler, retries=2, max_concurrency=2):
+    client = AsyncServiceClient(timeout=5, max_concurrency=max_concurrency, retries=retries, backoff_seconds=0)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_retries_transient_failures_then_succeeds():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        if len(calls) == 2:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"scores": [1.0]})
+
+    result = asyncio.run(_client(handler).post_json("http://reranker/v1/rerank", {}))
+
+    assert result == {"scores": [1.0]}
+    assert len(calls) == 3
+
+
+def test_gives_up_after_retries_and_does_not_retry_client_errors():
+    calls = []
+
+    def unavailable(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_client(unavailable, retries=1).post_json("http://llm/v1/chat", {}))
+    assert len(calls) == 2
+
+    calls.clear()
+
+    def bad_request(request):
+        calls.append(request)
+        return httpx.Response(422)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_client(bad_request).post_json("http://llm/v1/chat", {}))
+    assert len(calls) == 1
+
+
+def test_concurrent_calls_are_limited():
+    active = peak = 0
+
+    async def handler(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+        return httpx.Response(200, json={})
+
+    async def scenario():
+        client = _client(handler, max_concurrency=2)
+        await asyncio.gather(*(client.post_json("http://reranker/v1/rerank", {}) for _ in range(6)))
+
+    asyncio.run(scenario())
+
+    assert peak == 2
@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("asyncpg")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("transformers")
+
+from api.app.clients.http import AsyncServiceClient  # noqa: E402
+from api.app.config import settings  # noqa: E402
+from api.app.services import chat  # noqa: E402
+
+
+def _llm(monkeypatch, handler):
+    client = AsyncServiceClient(timeout=5, max_concurrency=2, retries=0)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(chat, "async_service_client", lambda *args: client)
+
+
+def _events(payload: str) -> list[tuple[str, object]]:
+    events = []
+    for block in payload.strip().split("\n\n"):
+        name, data = block.split("\n")
+        events.append((name.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def _stream(monkeypatch) -> list[tuple[str, object]]:
+    service = chat.ChatService()
+
+    async def prepare(payload, cfg):
+        return [{"doc_id": 1, "title": "t"}], ["фрагмент"]
+
+    monkeypatch.setattr(service, "_prepare", prepare)
+
+    async def collect():
+        return "".join([event async for event in service.stream(type("P", (), {"question": "q"}), settings)])
+
+    return _events(asyncio.run(collect()))
+
+
+def test_citations_come_first_then_streamed_tokens(monkeypatch):
+    body = "".join(
+        f"data: {json.dumps({'choices': [{'delta': {'content': part}}]})}\n\n" for part in ["Отв", "ет"]
+    ) + "data: [DONE]\n\n"
+    _llm(monkeypatch, lambda request: httpx.Response(200, headers={"content-type": "text/event-stream"}, text=body))
+
+    events = _stream(monkeypatch)
+
+    assert events[0] == ("citations", [{"doc_id": 1, "title": "t"}])
+    assert events[1:] == [("token", {"text": "Отв"}), ("token", {"text": "ет"}), ("done", {"answer": "Ответ"})]
+
+
+def test_plain_text_tokens_keep_their_leading_spaces(monkeypatch):
+    body = "data: Привет\n\ndata:  мир\n\ndata:, друг\n\ndata: [DONE]\n\n"
+    _llm(monkeypatch, lambda request: httpx.Response(200, headers={"content-type": "text/event-stream"}, text=body))
+
+    events = _stream(monkeypatch)
+
+    assert [data["text"] for name, data in events if name == "token"] == ["Привет", " мир", ", друг"]
+    assert events[-1] == ("done", {"answer": "Привет мир, друг"})
+
+
+def test_non_streaming_backend_falls_back_to_full_answer(monkeypatch):
+    _llm(monkeypatch, lambda request: httpx.Response(200, json={"choices": [{"message": {"content": "Целиком"}}]}))
+
+    assert _stream(monkeypatch)[1:] == [("token", {"text": "Целиком"}), ("done", {"answer": "Целиком"})]
+
+
+def test_non_json_error_page_falls_back_to_snippets(monkeypatch):
+    _llm(monkeypatch, lambda request: httpx.Response(200, headers={"content-type": "text/html"}, text="<html>502</html>"))
+
+    events = _stream(monkeypatch)
+
+    assert events[1][0] == "token" and "фрагмент" in events[1][1]["text"]
+    assert events[-1][0] == "done"
+
+
+def test_non_json_replies_on_the_blocking_path_fall_back(monkeypatch):
+    _llm(monkeypatch, lambda request: httpx.Response(200, headers={"content-type": "text/html"}, text="<html>502</html>"))
+    service = chat.ChatService()
+
+    answer = asyncio.run(service._call_llm("q", ["фрагмент"], settings))
+    order = asyncio.run(service._call_reranker("q", ["a", "b"], settings))
+
+    assert "фрагмент" in answer
+    assert order is None
+
+
+def test_broken_stream_after_tokens_ends_with_error_and_done(monkeypatch):
+    class Broken(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield 'data: {"token": "Пе"}\n\n'.encode()
+            raise httpx.ReadError("reset")
+
+    _llm(monkeypatch, lambda request: httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=Broken()))
+
+    events = _stream(monkeypatch)
+
+    assert [name for name, _ in events] == ["citations", "token", "error", "done"]
+    assert events[-1] == ("done", {"answer": "Пе"})
+
+
+def test_citations_are_built_from_search_rows_without_queries():
+    rows = [
+        {"document_id": 7, "title": "Регламент", "relative_path": "a/r.pdf", "page_or_sheet": "3", "content": "x" * 300},
+        {"document_id": 7, "title": "Регламент", "relative_path": "a/r.pdf", "page_or_sheet": None, "content": "y"},
+    ]
+
+    citations, snippets = chat.build_citations(rows)
+
+    assert [c["doc_id"] for c in citations] == [7, 7]
+    assert citations[0]["page_or_sheet"] == "3" and len(snippets[0]) == 280
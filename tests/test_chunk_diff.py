@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from worker.app.pipeline.chunk_diff import ExistingChunk, diff_chunks  # noqa: E402
+
+META = {"page_or_sheet": None}
+
+
+def _existing(*fingerprints):
+    return [ExistingChunk(id=100 + idx, chunk_index=idx, fingerprint=fp, meta=META) for idx, fp in enumerate(fingerprints)]
+
+
+def test_unchanged_document_keeps_every_chunk():
+    diff = diff_chunks(_existing("a", "b", "c"), ["a", "b", "c"], [META] * 3)
+
+    assert diff.summary() == {"kept": 3, "updated": 0, "inserted": 0, "deleted": 0}
+
+
+def test_edit_touches_only_changed_chunks():
+    diff = diff_chunks(_existing("a", "b", "c", "d"), ["a", "x", "c", "d", "e"], [META] * 5)
+
+    assert diff.inserts == [1, 4]
+    assert diff.deletes == [101]
+    assert diff.kept == 3
+    assert diff.updates == []
+
+
+def test_shifted_and_repeated_chunks_match_in_order():
+    diff = diff_chunks(_existing("h", "a", "h", "b"), ["new", "h", "a", "h", "b"], [META] * 5)
+
+    assert diff.inserts == [0]
+    assert diff.deletes == []
+    assert diff.updates == [(100, 1, META), (101, 2, META), (102, 3, META), (103, 4, META)]
+
+
+def test_legacy_rows_without_fingerprint_are_replaced():
+    diff = diff_chunks(_existing(None, None), ["a", "b"], [META] * 2)
+
+    assert diff.inserts == [0, 1]
+    assert diff.deletes == [100, 101]
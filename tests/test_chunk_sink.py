@@ -0,0 +1,83 @@
+import struct
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("transformers")
+
+from worker.app.pipeline.sink import ChunkSink  # noqa: E402
+
+
+class _RecordingSession:
+    """Имитирует Session.connection().connection.cursor() из SQLAlchemy/psycopg2."""
+
+    def __init__(self):
+        self.copies = []
+
+    def connection(self):
+        return type("Conn", (), {"connection": self})()
+
+    def cursor(self):
+        return self
+
+    def copy_expert(self, sql, stream):
+        self.copies.append((sql, stream.read()))
+
+    def close(self):
+        pass
+
+
+def _read_field(payload: bytes, pos: int) -> tuple[bytes, int]:
+    (size,) = struct.unpack_from(">i", payload, pos)
+    pos += 4
+    return payload[pos : pos + size], pos + size
+
+
+def test_binary_copy_roundtrip():
+    session = _RecordingSession()
+    sink = ChunkSink(session, document_id=7, binary=True, flush_rows=100)
+    vectors = [[0.5, -0.25, 1.0], [0.0, 0.125, -1.0]]
+    sink.write_batch([3, 4], ["первый\tчанк", "второй\x00"], vectors, [{"page_or_sheet": "1"}, {"page_or_sheet": None}])
+    sink.close()
+
+    assert sink.rows_written == 2
+    assert len(session.copies) == 1
+    sql, payload = session.copies[0]
+    assert "FORMAT binary" in sql
+    assert payload.startswith(b"PGCOPY\n\xff\r\n\x00")
+    assert payload.endswith(struct.pack(">h", -1))
+
+    pos = 19
+    for idx, (content, vector) in enumerate(zip(["первый\tчанк", "второй"], vectors)):
+        (fields,) = struct.unpack_from(">h", payload, pos)
+        assert fields == 6
+        pos += 2
+        doc_id, pos = _read_field(payload, pos)
+        chunk_index, pos = _read_field(payload, pos)
+        text_value, pos = _read_field(payload, pos)
+        embedding, pos = _read_field(payload, pos)
+        meta, pos = _read_field(payload, pos)
+        fingerprint, pos = _read_field(payload, pos)
+        assert struct.unpack(">q", doc_id)[0] == 7
+        assert struct.unpack(">i", chunk_index)[0] == 3 + idx
+        assert text_value.decode("utf-8") == content
+        dim, unused = struct.unpack_from(">hh", embedding)
+        assert (dim, unused) == (3, 0)
+        assert np.frombuffer(embedding[4:], dtype=">f4").tolist() == vector
+        assert meta[:1] == b"\x01"
+        assert len(fingerprint) == 64
+
+
+def test_text_copy_escapes_content():
+    session = _RecordingSession()
+    sink = ChunkSink(session, document_id=1, binary=False, flush_rows=1)
+    sink.write_batch([0], ["a\tb\\c\nd"], [[1.0, 0.0]], fingerprints=["f" * 64])
+
+    sql, payload = session.copies[0]
+    assert "FORMAT binary" not in sql
+    fields = payload.decode("utf-8").rstrip("\n").split("\t")
+    assert fields[:3] == ["1", "0", "a\\tb\\\\c\\nd"]
+    assert fields[3] == "[1,0]"
+    assert fields[5] == "f" * 64
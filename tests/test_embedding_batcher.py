@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pydantic_settings")
+
+from api.app.services.embedding_batcher import EmbeddingBatcher  # noqa: E402
+
+
+def test_concurrent_queries_share_one_batch():
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return np.array([[float(len(text))] for text in texts], dtype=np.float32)
+
+    batcher = EmbeddingBatcher(embed, max_batch=8, max_wait_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.embed(text) for text in ["a", "bb", "a", "ccc"]))
+
+    vectors = asyncio.run(scenario())
+
+    assert calls == [["a", "bb", "ccc"]]
+    assert [float(v[0]) for v in vectors] == [1.0, 2.0, 1.0, 3.0]
+
+
+def test_full_batch_is_sent_without_waiting():
+    sizes = []
+
+    def embed(texts):
+        sizes.append(len(texts))
+        return np.zeros((len(texts), 1), dtype=np.float32)
+
+    batcher = EmbeddingBatcher(embed, max_batch=2, max_wait_ms=10_000)
+
+    async def scenario():
+        await asyncio.wait_for(asyncio.gather(*(batcher.embed(str(idx)) for idx in range(4))), timeout=2)
+
+    asyncio.run(scenario())
+    assert sizes == [2, 2]
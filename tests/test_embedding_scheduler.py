@@ -0,0 +1,91 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("transformers")
+
+from worker.app.embeddings import EmbeddingScheduler  # noqa: E402
+
+
+class _FakeEmbedder:
+    """Токен = слово; вектор хранит номер текста в первой координате."""
+
+    def __init__(self):
+        self.batches = []
+
+    def tokenize(self, texts):
+        return [[int(word) for word in text.split()] for text in texts]
+
+    def embed_token_ids(self, input_ids):
+        self.batches.append([len(ids) for ids in input_ids])
+        out = np.zeros((len(input_ids), 1024), dtype=np.float32)
+        out[:, 0] = [ids[0] for ids in input_ids]
+        return out
+
+
+def _text(marker: int, length: int) -> str:
+    return " ".join([str(marker)] * length)
+
+
+def test_buckets_respect_token_budget_and_restore_order():
+    embedder = _FakeEmbedder()
+    scheduler = EmbeddingScheduler(embedder, token_budget=40, max_batch=8)
+    lengths = [20, 1, 3, 20, 2, 5, 1]
+    texts = [_text(idx, length) for idx, length in enumerate(lengths)]
+
+    result = scheduler.embed(texts)
+
+    assert result[:, 0].tolist() == list(range(len(texts)))
+    for batch in embedder.batches:
+        assert max(batch) * len(batch) <= 40
+        assert batch == sorted(batch)
+    assert scheduler.stats.texts == len(texts)
+    assert scheduler.stats.real_tokens == sum(lengths)
+    assert 0.0 <= scheduler.stats.waste_ratio < 0.5
+
+
+def test_drain_batches_across_documents():
+    embedder = _FakeEmbedder()
+    scheduler = EmbeddingScheduler(embedder, token_budget=1000, max_batch=64)
+    scheduler.submit([_text(1, 4), _text(2, 4)])
+    scheduler.submit([])
+    scheduler.submit([_text(3, 4)])
+    assert scheduler.pending_texts == 3
+
+    first, empty, second = scheduler.drain()
+
+    assert len(embedder.batches) == 1
+    assert first[:, 0].tolist() == [1, 2]
+    assert empty.shape == (0, 1024)
+    assert second[:, 0].tolist() == [3]
+    assert scheduler.pending_texts == 0
+
+
+class _DictCache:
+    def __init__(self):
+        self.vectors = {}
+
+    def lookup(self, texts, out):
+        hits = np.zeros(len(texts), dtype=bool)
+        for idx, content in enumerate(texts):
+            if content in self.vectors:
+                out[idx] = self.vectors[content]
+                hits[idx] = True
+        return hits
+
+    def store(self, texts, embeddings):
+        self.vectors.update(zip(texts, embeddings.copy()))
+
+
+def test_cache_hits_skip_onnx_and_duplicates_are_embedded_once():
+    embedder = _FakeEmbedder()
+    scheduler = EmbeddingScheduler(embedder, token_budget=1000, max_batch=64, cache=_DictCache())
+    texts = [_text(1, 3), _text(2, 3), _text(1, 3)]
+
+    first = scheduler.embed(texts)
+    assert embedder.batches == [[3, 3]]
+    second = scheduler.embed(texts)
+
+    assert embedder.batches == [[3, 3]]
+    assert np.array_equal(first, second)
+    assert first[:, 0].tolist() == [1, 2, 1]
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("pydantic_settings")
+
+from worker.app.gpu import GpuScheduler  # noqa: E402
+
+
+def _scheduler(client, slots=1, lease=60):
+    return GpuScheduler(client=client, key="gpu_test", slots=slots, lease_seconds=lease, poll_seconds=1)
+
+
+def test_slots_limit_concurrent_holders():
+    scheduler = _scheduler(fakeredis.FakeRedis(), slots=2)
+    for token in ("a", "b", "c"):
+        scheduler._enqueue(token, "background")
+
+    assert scheduler.try_acquire("a") is None
+    assert scheduler.try_acquire("b") is None
+    assert scheduler.try_acquire("c") == 1
+
+    scheduler.release("a")
+    assert scheduler.try_acquire("c") is None
+
+
+def test_interactive_waiters_overtake_background():
+    scheduler = _scheduler(fakeredis.FakeRedis())
+    scheduler._enqueue("holder", "background")
+    assert scheduler.try_acquire("holder") is None
+    scheduler._enqueue("scan", "background")
+    scheduler._enqueue("upload", "interactive")
+
+    assert scheduler.try_acquire("scan") == 2
+    assert scheduler.try_acquire("upload") == 1
+
+    scheduler.release("holder")
+    assert scheduler.try_acquire("scan") == 1
+    assert scheduler.try_acquire("upload") is None
+
+
+def test_expired_lease_is_reclaimed_and_release_is_token_owned():
+    client = fakeredis.FakeRedis()
+    scheduler = _scheduler(client)
+    scheduler._enqueue("stale", "background")
+    assert scheduler.try_acquire("stale") is None
+    client.zadd("gpu_test:holders", {"stale": 0})
+    scheduler._enqueue("next", "background")
+
+    assert scheduler.try_acquire("next") is None
+    scheduler.release("stale")
+    assert client.zscore("gpu_test:holders", "next") is not None
+
+
+def test_waiter_wakes_on_release_and_reports_queue_position():
+    client = fakeredis.FakeRedis()
+    scheduler = _scheduler(client)
+    positions = []
+    acquired = threading.Event()
+
+    with scheduler.slot():
+        def waiter():
+            with scheduler.slot(on_queue=positions.append, timeout=10):
+                acquired.set()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.2)
+        assert not acquired.is_set()
+        released = time.monotonic()
+
+    thread.join(5)
+    assert acquired.is_set()
+    assert time.monotonic() - released < 0.9
+    assert positions == [1, None]
+    assert client.zcard("gpu_test:holders") == 0
+
+
+def test_wait_timeout_leaves_the_queue():
+    client = fakeredis.FakeRedis()
+    scheduler = _scheduler(client)
+    with scheduler.slot():
+        with pytest.raises(RuntimeError):
+            with scheduler.slot(timeout=0.1):
+                pass
+    assert client.zcard("gpu_test:waiters") == 0
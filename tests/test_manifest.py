@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from worker.app.pipeline.manifest import ManifestEntry, SourceManifest, is_unchanged  # noqa: E402
+from worker.app.pipeline.scanner import iter_source_files  # noqa: E402
+
+
+def _walk(base, errors=None):
+    return {candidate.relative_path: candidate for candidate in iter_source_files(base, [], ["*/skip/*"], {"txt"}, errors)}
+
+
+def test_scandir_walk_filters_and_reports_inode(tmp_path):
+    (tmp_path / "a" / "skip").mkdir(parents=True)
+    (tmp_path / "a" / "one.txt").write_text("1")
+    (tmp_path / "a" / "skip" / "two.txt").write_text("2")
+    (tmp_path / "three.pdf").write_text("3")
+    (tmp_path / "four.TXT").write_text("4")
+
+    found = _walk(tmp_path)
+
+    assert sorted(found) == ["a/one.txt", "four.TXT"]
+    assert found["a/one.txt"].inode == (tmp_path / "a" / "one.txt").stat().st_ino
+    assert found["a/one.txt"].size_bytes == 1
+
+
+def test_manifest_diff_finds_changed_and_missing_files(tmp_path):
+    (tmp_path / "same.txt").write_text("same")
+    (tmp_path / "edited.txt").write_text("edited")
+    (tmp_path / "new.txt").write_text("new")
+    found = _walk(tmp_path)
+    same, edited = found["same.txt"], found["edited.txt"]
+    manifest = SourceManifest(
+        {
+            "same.txt": ManifestEntry(1, same.mtime, same.size_bytes, same.inode, False),
+            "edited.txt": ManifestEntry(2, edited.mtime, edited.size_bytes + 1, edited.inode, False),
+            "gone.txt": ManifestEntry(3, same.mtime, 1, None, False),
+            "gone-before.txt": ManifestEntry(4, same.mtime, 1, None, True),
+        }
+    )
+
+    changed = [path for path, candidate in sorted(found.items()) if not is_unchanged(manifest.take(path), candidate)]
+
+    assert changed == ["edited.txt", "new.txt"]
+    assert manifest.missing() == [3]
+
+
+def test_replaced_file_with_same_stat_is_detected(tmp_path):
+    (tmp_path / "doc.txt").write_text("doc")
+    candidate = _walk(tmp_path)["doc.txt"]
+
+    assert is_unchanged(ManifestEntry(1, candidate.mtime, candidate.size_bytes, None, False), candidate)
+    assert not is_unchanged(ManifestEntry(1, candidate.mtime, candidate.size_bytes, candidate.inode + 1, False), candidate)
+
+
+def test_documents_not_ready_are_retried_with_same_stat(tmp_path):
+    (tmp_path / "doc.txt").write_text("doc")
+    candidate = _walk(tmp_path)["doc.txt"]
+
+    def entry(status, outcome=None, size=candidate.size_bytes):
+        return ManifestEntry(1, candidate.mtime, size, candidate.inode, False, status, outcome)
+
+    assert is_unchanged(entry("ready"), candidate)
+    assert not is_unchanged(entry("queued"), candidate)
+    assert not is_unchanged(entry("failed", "error"), candidate)
+    assert not is_unchanged(entry("failed", "missing"), candidate)
+    # Таймаут или OOM повторятся на том же файле: ждем, пока файл изменится.
+    assert is_unchanged(entry("failed", "timeout"), candidate)
+    assert is_unchanged(entry("failed", "oom"), candidate)
+    assert not is_unchanged(entry("failed", "oom", size=candidate.size_bytes + 1), candidate)
+
+
+def test_unreadable_directory_is_reported(tmp_path):
+    errors: list[str] = []
+
+    assert _walk(tmp_path / "missing", errors) == {}
+    assert len(errors) == 1
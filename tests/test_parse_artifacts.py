@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("transformers")
+
+from worker.app.config import settings  # noqa: E402
+from worker.app.pipeline import extract  # noqa: E402
+from worker.app.pipeline.artifacts import ArtifactStore  # noqa: E402
+from worker.app.pipeline.chunking import TextSegment  # noqa: E402
+
+
+def test_second_parse_of_same_content_skips_parsers(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "artifact_cache_dir", str(tmp_path / "artifacts"))
+    calls = []
+
+    def fake_parse(path, meta, on_step, job_id, gpu_priority):
+        calls.append(path.name)
+        meta.update(parser_used="ocr", quality_score=0.9)
+        yield TextSegment("страница один", "1")
+        yield TextSegment("страница два", "2")
+
+    monkeypatch.setattr(extract, "_parse_segments", fake_parse)
+    original = tmp_path / "scan.pdf"
+    duplicate = tmp_path / "copy.pdf"
+    original.write_bytes(b"%PDF scanned")
+    duplicate.write_bytes(b"%PDF scanned")
+
+    first, first_meta = extract.extract_content(original)
+    second, second_meta = extract.extract_content(duplicate)
+
+    assert calls == ["scan.pdf"]
+    assert second == first
+    assert first_meta["artifact"] == "miss" and second_meta["artifact"] == "hit"
+    assert second_meta["parser_used"] == "ocr" and second_meta["quality_score"] == 0.9
+
+
+def test_unfinished_stream_is_not_cached_and_lru_eviction(tmp_path):
+    store = ArtifactStore(tmp_path, max_mb=1)
+    stream = store.record("aa" + "0" * 62, iter([TextSegment("x", "1"), TextSegment("y", "2")]), {})
+    next(stream)
+    stream.close()
+    assert store.get("aa" + "0" * 62) is None
+    assert not list((tmp_path / "aa").iterdir())
+
+    payload = [TextSegment(os.urandom(300_000).hex(), None)]
+    for idx, key in enumerate(["b1", "b2", "b3", "b4"]):
+        list(store.record(key + "0" * 62, iter(payload), {}))
+        os.utime(store._path(key + "0" * 62), (idx, idx))
+    meta, segments = store.get("b1" + "0" * 62)
+    assert list(segments) == payload
+
+    assert store.evict() > 0
+    assert store.get("b1" + "0" * 62) is not None
+    assert store.get("b2" + "0" * 62) is None
+
+
+@pytest.mark.parametrize("damage", [b"", b"RAGART1\n\x00\x00\x00\x40{not json", b"garbage"])
+def test_corrupt_artifact_is_a_miss_and_removed(tmp_path, damage):
+    store = ArtifactStore(tmp_path)
+    key = "cc" + "0" * 62
+    list(store.record(key, iter([TextSegment("текст", "1")]), {"parser_used": "builtin"}))
+    path = store._path(key)
+    path.write_bytes(damage)
+
+    assert store.get(key) is None
+    assert not path.exists()
+
+
+def test_truncated_artifact_is_a_miss(tmp_path):
+    store = ArtifactStore(tmp_path)
+    key = "dd" + "0" * 62
+    list(store.record(key, iter([TextSegment("текст " * 100, "1")]), {}))
+    path = store._path(key)
+    path.write_bytes(path.read_bytes()[:-10])
+
+    assert store.get(key) is None
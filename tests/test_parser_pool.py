@@ -0,0 +1,120 @@
+import os
+import signal
+import time
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from worker.app.pipeline.parser_pool import ParseFailure, ParserPool, deadline_paused  # noqa: E402
+
+
+def _hang():
+    time.sleep(60)
+
+
+def _crash():
+    os._exit(3)
+
+
+def _wait_for_gpu():
+    with deadline_paused():
+        time.sleep(3)
+    return "ok"
+
+
+def _allocate():
+    return len(bytearray(2048 * 1024 * 1024))
+
+
+def _numbers(count, hang_at=None):
+    for idx in range(count):
+        if idx == hang_at:
+            time.sleep(60)
+        yield idx
+    return {"count": count}
+
+
+def _pool_in_celery_child():
+    pool = ParserPool(workers=1, timeout=10, memory_mb=0)
+    try:
+        return pool.submit(sum, [1, 2]).result(timeout=30)
+    finally:
+        pool.shutdown()
+
+
+@pytest.fixture
+def pool():
+    pool = ParserPool(workers=1, timeout=2, memory_mb=1024, max_tasks=2)
+    yield pool
+    pool.shutdown()
+
+
+def test_bad_files_fail_alone_and_the_pool_keeps_working(pool):
+    outcomes = []
+    for fn in (_hang, _crash, _allocate):
+        with pytest.raises(ParseFailure) as exc:
+            pool.submit(fn).result(timeout=30)
+        outcomes.append(exc.value.outcome)
+
+    assert outcomes == ["timeout", "crash", "oom"]
+    assert pool.submit(sum, [1, 2]).result(timeout=30) == 3
+
+
+def test_worker_is_recycled_after_max_tasks(pool):
+    pids = [pool.submit(os.getpid).result(timeout=30) for _ in range(4)]
+
+    assert pids[0] == pids[1] != pids[2] == pids[3]
+
+
+def test_idle_worker_killed_outside_is_replaced(pool):
+    pid = pool.submit(os.getpid).result(timeout=30)
+    os.kill(pid, signal.SIGKILL)
+    time.sleep(0.2)
+
+    assert pool.submit(sum, [1, 2]).result(timeout=30) == 3
+    assert pool._thread.is_alive()
+
+
+def test_gpu_wait_does_not_count_towards_timeout(pool):
+    assert pool.submit(_wait_for_gpu).result(timeout=30) == "ok"
+
+
+def test_pool_starts_inside_a_prefork_worker_process():
+    # Задачи Celery prefork выполняются в daemon-процессах billiard.
+    billiard = pytest.importorskip("billiard")
+    with billiard.Pool(1) as celery_pool:
+        assert celery_pool.apply(_pool_in_celery_child) == 3
+
+
+def test_stream_arrives_in_batches_with_generator_result(pool):
+    stream = pool.stream(_numbers, 7, batch_size=3)
+
+    assert list(stream) == list(range(7))
+    assert stream.result() == {"count": 7}
+
+
+def test_slow_consumer_does_not_count_towards_timeout(pool):
+    stream = pool.stream(_numbers, 4, batch_size=1)
+    items = []
+    for item in stream:
+        # Индексация порции в задаче (эмбеддинги, COPY) дольше таймаута файла в 2 s.
+        time.sleep(1)
+        items.append(item)
+
+    assert items == [0, 1, 2, 3]
+
+
+def test_hanging_stream_times_out_and_abandoned_stream_frees_the_worker(pool):
+    received = []
+    with pytest.raises(ParseFailure) as exc:
+        for item in pool.stream(_numbers, 10, 5, batch_size=2):
+            received.append(item)
+    assert exc.value.outcome == "timeout"
+    assert received == [0, 1, 2, 3]
+
+    stream = iter(pool.stream(_numbers, 100, batch_size=2))
+    assert next(stream) == 0
+    stream.close()
+    # Брошенный поток завершается в процессе, и следующая задача идет в тот же пул.
+    assert pool.submit(sum, [1, 2]).result(timeout=30) == 3
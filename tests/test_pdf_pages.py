@@ -0,0 +1,75 @@
+from contextlib import nullcontext
+
+import pytest
+
+pytest.importorskip("pypdf")
+pytest.importorskip("pydantic_settings")
+
+from worker.app.clients import services  # noqa: E402
+from worker.app.pipeline import extract  # noqa: E402
+from worker.app.pipeline.extract import TextSegment, chunk_segments, chunk_text  # noqa: E402
+from worker.app.pipeline.parsers import PdfPage  # noqa: E402
+
+
+def test_chunks_are_labelled_with_pages():
+    segments = [TextSegment("a" * 10, "1"), TextSegment("b" * 10, "2"), TextSegment("c" * 10, "3")]
+
+    chunks, metas = chunk_segments(segments, size=8, overlap=2)
+
+    assert chunks == chunk_text("\n".join(segment.text for segment in segments), 8, 2)
+    assert [meta["page_or_sheet"] for meta in metas][:3] == ["1", "1-2", "2"]
+    assert metas[-1]["page_or_sheet"] == "3"
+
+
+class _Service:
+    def __init__(self, score, pages_processed=None):
+        self.score = score
+        self.pages_processed = pages_processed
+        self.calls = []
+
+    def __call__(self, url, timeout):
+        return self
+
+    def parse_pages(self, file_path, page_ranges):
+        self.calls.append(page_ranges)
+        results = {page: (f"{self.score} p{page}", self.score) for start, end in page_ranges for page in range(start, end + 1)}
+        return results if self.pages_processed is None else (results, len(results))
+
+
+def test_only_weak_page_ranges_go_to_gpu_services(monkeypatch):
+    text_ok = "x" * 500
+    pages = [PdfPage(n, text_ok if n not in {3, 4, 9} else "", 1.0 if n not in {3, 4, 9} else 0.0) for n in range(1, 11)]
+    mineru, ocr = _Service(0.7), _Service(0.9, pages_processed=0)
+    monkeypatch.setattr(extract, "iter_pdf_pages", lambda path: iter(pages))
+    monkeypatch.setattr(extract, "MineruClient", mineru)
+    monkeypatch.setattr(extract, "OCRClient", ocr)
+    monkeypatch.setattr(extract, "gpu_lock", lambda *args: nullcontext())
+
+    segments, meta = extract.extract_pdf(extract.Path("mixed.pdf"))
+
+    assert mineru.calls == [[(3, 4), (9, 9)]]
+    assert ocr.calls == [[(3, 4), (9, 9)]]
+    assert [segment.page_or_sheet for segment in segments] == [str(n) for n in range(1, 11)]
+    assert segments[2].text == "0.9 p3"
+    assert meta["parser_used"] == "paddleocr"
+    assert meta["pages_by_parser"] == {"builtin": 7, "paddleocr": 3}
+    assert meta["ocr_pages_processed"] == 3
+
+
+def test_reply_without_pages_is_not_merged_into_every_window(monkeypatch):
+    pages = [PdfPage(n, "" if n in {2, 6, 10} else "x" * 500, 0.0 if n in {2, 6, 10} else 1.0) for n in range(1, 13)]
+
+    class WholeDocument:
+        def post_json(self, url, payload):
+            return {"text": "весь документ", "quality_score": 0.95, "pages_processed": 12}
+
+    monkeypatch.setattr(extract.settings, "stream_pdf_window_pages", 4)
+    monkeypatch.setattr(extract, "iter_pdf_pages", lambda path: iter(pages))
+    monkeypatch.setattr(services, "service_client", lambda *args: WholeDocument())
+    monkeypatch.setattr(extract, "gpu_lock", lambda *args: nullcontext())
+
+    segments, meta = extract.extract_pdf(extract.Path("scan.pdf"))
+
+    assert not any("весь документ" in segment.text for segment in segments)
+    assert meta["pages_by_parser"] == {"builtin": 12}
+    assert "MinerU ответил без разбивки по страницам, ответ не использован" in meta["warnings"]
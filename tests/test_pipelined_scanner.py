@@ -0,0 +1,154 @@
+from concurrent.futures import Future
+import os
+from pathlib import Path
+import queue
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("transformers")
+
+from worker.app.config import settings  # noqa: E402
+from worker.app.pipeline import scanner  # noqa: E402
+from worker.app.pipeline.extract import ParsedDocument  # noqa: E402
+from worker.app.pipeline.parser_pool import ParseFailure, ParserPool  # noqa: E402
+from worker.app.pipeline.scanner import PipelinedScanner, ScanCandidate  # noqa: E402
+
+
+class FakePool:
+    """Пул без процессов: задача выполняется сразу, `hold=True` оставляет futures незавершенными."""
+
+    def __init__(self, hold: bool = False):
+        self.hold = hold
+        self.futures: list[Future] = []
+
+    def submit(self, fn, path, *args) -> Future:
+        future: Future = Future()
+        self.futures.append(future)
+        if self.hold:
+            return future
+        if path.stem.startswith("bad"):
+            future.set_exception(ParseFailure("timeout", "завис"))
+        else:
+            future.set_result(ParsedDocument(chunks=[path.stem], chunk_metas=[{}], fingerprints=[path.stem], meta={}))
+        return future
+
+
+class FakeDB:
+    def commit(self):
+        pass
+
+
+def _candidate(name: str, size_mb: float = 1) -> ScanCandidate:
+    return ScanCandidate(path=Path(f"/nas/{name}.txt"), relative_path=f"{name}.txt", size_bytes=int(size_mb * 1024 * 1024), mtime="")
+
+
+def _register(candidate: ScanCandidate, files_seen: int) -> int:
+    return files_seen
+
+
+def _parse_stub(path, on_step=None, job_id=None):
+    return ParsedDocument(chunks=[path.stem], chunk_metas=[{}], fingerprints=[path.stem], meta={"pid": os.getpid()})
+
+
+def _scan_in_celery_child():
+    pool = ParserPool(workers=1, timeout=10, memory_mb=0)
+    try:
+        stats = PipelinedScanner(FakeDB(), None, pool=pool).run([_candidate(str(i)) for i in range(3)], _register)
+    finally:
+        pool.shutdown()
+    return stats.indexed, stats.failed
+
+
+@pytest.fixture
+def indexed(monkeypatch):
+    monkeypatch.setattr(settings, "scan_parse_workers", 1)
+    monkeypatch.setattr(settings, "scan_embed_chunks", 1)
+    documents: dict[str, list] = {"indexed": [], "failed": []}
+    monkeypatch.setattr(
+        scanner, "index_documents", lambda db, scheduler, pending: documents["indexed"].extend(p.document_id for p in pending)
+    )
+    monkeypatch.setattr(
+        scanner, "mark_document_failed", lambda db, document_id, error, outcome="error": documents["failed"].append((document_id, outcome))
+    )
+    return documents
+
+
+def test_walker_blocks_on_full_queue():
+    feed: queue.Queue = queue.Queue(maxsize=2)
+    stop = threading.Event()
+    produced = []
+
+    def candidates():
+        for idx in range(100):
+            produced.append(idx)
+            yield _candidate(str(idx))
+
+    walker = threading.Thread(target=scanner._walk, args=(candidates(), feed, stop))
+    walker.start()
+    time.sleep(0.3)
+
+    # Две записи в очереди и одна ждет места: обход не убегает вперед парсинга.
+    assert len(produced) == 3
+    stop.set()
+    walker.join(timeout=5)
+    assert not walker.is_alive()
+
+
+def test_batch_ignores_scan_limits(monkeypatch, indexed):
+    # Лимиты уже применило обнаружение: файлы батча с обновленной строкой documents нельзя бросить в queued.
+    monkeypatch.setattr(settings, "scan_max_files", 2)
+    monkeypatch.setattr(settings, "scan_max_mb", 1)
+    monkeypatch.setattr(settings, "scan_timeout_seconds", 0)
+    stats = PipelinedScanner(FakeDB(), None, pool=FakePool()).run([_candidate(str(i), 2) for i in range(5)], _register)
+
+    assert (stats.files, stats.indexed, stats.stopped) == (5, 5, None)
+    assert sorted(indexed["indexed"]) == [1, 2, 3, 4, 5]
+
+
+def test_files_past_the_scan_deadline_are_deferred(indexed):
+    stats = PipelinedScanner(FakeDB(), None, pool=FakePool()).run(
+        [_candidate(str(i)) for i in range(3)], _register, deadline=time.time() - 1
+    )
+
+    # Строки documents остаются queued: следующий скан возьмет их по манифесту.
+    assert (stats.files, stats.indexed, stats.deferred, stats.stopped) == (0, 0, 3, "timeout")
+    assert indexed["indexed"] == [] and indexed["failed"] == []
+
+
+def test_parse_failure_marks_only_that_document(indexed):
+    candidates = [_candidate("a"), _candidate("bad"), _candidate("c")]
+
+    stats = PipelinedScanner(FakeDB(), None, pool=FakePool()).run(candidates, _register)
+
+    assert (stats.indexed, stats.failed) == (2, 1)
+    assert indexed["failed"] == [(2, "timeout")]
+    assert sorted(indexed["indexed"]) == [1, 3]
+
+
+def test_walker_error_propagates_and_inflight_parses_are_cancelled(monkeypatch, indexed):
+    # Места в полете больше, чем файлов: координатор дочитывает очередь до ошибки обхода.
+    monkeypatch.setattr(settings, "scan_parse_workers", 2)
+
+    def candidates():
+        yield _candidate("a")
+        yield _candidate("b")
+        time.sleep(0.1)
+        raise PermissionError("нет доступа к /nas")
+
+    pool = FakePool(hold=True)
+    with pytest.raises(PermissionError):
+        PipelinedScanner(FakeDB(), None, pool=pool).run(candidates(), _register)
+
+    assert len(pool.futures) == 2
+    assert all(future.cancelled() for future in pool.futures)
+
+
+def test_scan_runs_inside_a_prefork_worker_process(monkeypatch, indexed):
+    # Как в `celery worker` с prefork: скан в daemon-процессе billiard, парсинг — в процессах ParserPool.
+    billiard = pytest.importorskip("billiard")
+    monkeypatch.setattr(scanner, "parse_document", _parse_stub)
+    with billiard.get_context("fork").Pool(1) as celery_pool:
+        assert celery_pool.apply(_scan_in_celery_child) == (3, 0)
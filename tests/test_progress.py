@@ -0,0 +1,106 @@
+from functools import partial
+import pickle
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("sqlalchemy")
+
+from worker.app import progress  # noqa: E402
+from worker.app.progress import ProgressReporter, publish_progress, publish_step, set_queue_position  # noqa: E402
+
+
+class _RecordingSession:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(str(statement).split()[0])
+
+
+def test_only_step_transitions_are_persisted():
+    db, client = _RecordingSession(), fakeredis.FakeRedis(decode_responses=True)
+    reporter = ProgressReporter(db, job_id=7, client=client, min_interval_ms=60_000)
+
+    reporter.update("running", "discover", 5)
+    for idx in range(500):
+        reporter.update("running", "discover", 6, f"file {idx}")
+    assert db.statements == ["UPDATE", "INSERT"]
+    assert client.hget("job_progress:7", "progress") == "5"
+
+    reporter.flush()
+    assert client.hgetall("job_progress:7")["message"] == "file 499"
+
+    reporter.update("completed", "done", 100, "ok")
+    assert db.statements == ["UPDATE", "INSERT"] * 2
+    assert client.hget("job_progress:7", "status") == "completed"
+    assert client.ttl("job_progress:7") > 0
+
+
+def test_updates_within_step_are_published_after_interval():
+    db, client = _RecordingSession(), fakeredis.FakeRedis(decode_responses=True)
+    reporter = ProgressReporter(db, job_id=8, client=client, min_interval_ms=0)
+
+    reporter.update("running", "index_batch", 5)
+    reporter.update("running", "index_batch", 50, "half")
+
+    assert client.hget("job_progress:8", "progress") == "50"
+    assert len(db.statements) == 2
+
+
+def test_step_reaches_redis_only_after_commit_and_rollback_clears_it():
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import Session
+
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE jobs (id INTEGER PRIMARY KEY, status TEXT, current_step TEXT, progress INT, message TEXT)"))
+        conn.execute(text("CREATE TABLE job_steps (job_id INT, step_name TEXT, status TEXT, progress INT, message TEXT)"))
+        conn.execute(text("INSERT INTO jobs (id, status) VALUES (9, 'queued')"))
+    client = fakeredis.FakeRedis(decode_responses=True)
+    db = Session(engine)
+    reporter = ProgressReporter(db, job_id=9, client=client, min_interval_ms=0)
+
+    reporter.update("running", "index_batch", 5)
+    assert not client.exists("job_progress:9")
+    db.commit()
+    assert client.hget("job_progress:9", "step") == "index_batch"
+
+    reporter.update("running", "index_batch", 40)
+    reporter.update("completed", "done", 100)
+    assert client.hget("job_progress:9", "progress") == "40"
+    db.rollback()
+    assert not client.exists("job_progress:9")
+
+    reporter.update("running", "retry", 0)
+    db.commit()
+    assert client.hget("job_progress:9", "step") == "retry"
+    assert db.execute(text("SELECT current_step FROM jobs WHERE id=9")).scalar_one() == "retry"
+    db.close()
+
+
+def test_queue_position_goes_to_redis_without_touching_the_job_row():
+    client = fakeredis.FakeRedis(decode_responses=True)
+
+    # Строку jobs держит транзакция задачи: позиция пишется мимо БД, поверх живого прогресса.
+    publish_progress(10, "running", "parse", 20, None, client)
+    set_queue_position(10, 3, client)
+    assert client.hgetall("job_progress:10")["queue_position"] == "3"
+    assert client.hget("job_progress:10", "step") == "parse"
+
+    set_queue_position(10, None, client)
+    publish_progress(10, "running", "mineru", 30, None, client)
+    assert client.hget("job_progress:10", "queue_position") == ""
+    assert client.ttl("job_progress:10") > 0
+
+
+def test_parse_steps_from_the_pool_reach_redis(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(progress, "redis_client", client)
+    # Колбэк уходит в процесс пула через pickle, как partial(publish_step, job_id) из _ingest_file.
+    on_step = pickle.loads(pickle.dumps(partial(publish_step, 11)))
+
+    on_step("mineru", 35)
+
+    state = client.hgetall("job_progress:11")
+    assert (state["status"], state["step"], state["progress"]) == ("running", "mineru", "35")
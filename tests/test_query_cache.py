@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+fakeredis = pytest.importorskip("fakeredis")
+
+from api.app.services.query_cache import QueryEmbeddingCache, normalize_query  # noqa: E402
+
+
+def test_lru_evicts_oldest_and_counts_hits():
+    cache = QueryEmbeddingCache(max_items=2, ttl_seconds=60)
+    cache.put_local("a", np.ones(3, dtype=np.float32))
+    cache.put_local("b", np.ones(3, dtype=np.float32))
+    assert cache.get_local("a") is not None
+    cache.put_local("c", np.ones(3, dtype=np.float32))
+
+    assert cache.get_local("b") is None
+    assert cache.get_local("a") is not None
+    assert cache.stats.hits == 2
+
+
+def test_redis_level_is_shared_between_replicas():
+    redis = fakeredis.aioredis.FakeRedis()
+    first = QueryEmbeddingCache(max_items=8, ttl_seconds=60, redis=redis)
+    second = QueryEmbeddingCache(max_items=8, ttl_seconds=60, redis=redis)
+    vector = np.arange(4, dtype=np.float32)
+
+    async def scenario():
+        await first.put(normalize_query("  Сроки   поставки "), vector)
+        return await second.get(normalize_query("Сроки поставки"))
+
+    assert np.array_equal(asyncio.run(scenario()), vector)
+    assert second.describe()["redis_hits"] == 1
@@ -0,0 +1,33 @@
+import pytest
+
+from api.app.services.rerank import apply_heavy_order, plan_cascade
+
+
+def test_clear_leader_skips_heavy_reranker():
+    plan = plan_cascade([0.41, 0.78, 0.52], top_k=2, margin=0.1)
+
+    assert plan.order == [1, 2, 0]
+    assert plan.heavy == []
+
+
+def test_ambiguous_top_goes_to_heavy_reranker_and_tail_keeps_dense_order():
+    plan = plan_cascade([0.70, 0.30, 0.72, 0.69], top_k=3, margin=0.1)
+
+    assert plan.heavy == [2, 0, 3]
+    # reranker вернул позиции внутри среза: лучшим оказался кандидат 3.
+    assert apply_heavy_order(plan, [2, 0]) == [3, 2, 0, 1]
+
+
+def test_missing_dense_scores_fall_back_to_full_rerank():
+    assert plan_cascade([0.5, None], top_k=2, margin=0.1) is None
+
+
+def test_unknown_rerank_mode_is_rejected(monkeypatch):
+    pytest.importorskip("pydantic_settings")
+    from pydantic import ValidationError
+
+    from api.app.config import Settings
+
+    monkeypatch.setenv("RERANK_MODE", "dnse")
+    with pytest.raises(ValidationError):
+        Settings()
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from reranker.app.batching import PairBatcher, ScoreCache, plan_batches, top_scores  # noqa: E402
+
+
+def test_batches_group_similar_lengths_under_token_budget():
+    lengths = [500, 20, 30, 480, 25, 40]
+
+    batches = plan_batches(lengths, token_budget=1000, max_batch=8)
+
+    assert batches == [[1, 4, 2, 5], [3, 0]]
+    assert all(len(batch) * max(lengths[idx] for idx in batch) <= 1000 for batch in batches)
+
+
+def test_top_scores_are_sorted_descending():
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3], dtype=np.float32)
+
+    assert [idx for idx, _ in top_scores(scores, 3)] == [1, 3, 2]
+    assert [idx for idx, _ in top_scores(scores, 10)] == [1, 3, 2, 4, 0]
+
+
+def test_cache_returns_scores_of_seen_pairs():
+    cache = ScoreCache(max_items=10)
+    _, keys = cache.lookup("q", ["a", "b"])
+    cache.store(keys, [0.5, 0.25])
+
+    scores, _ = cache.lookup("q", ["b", "c"])
+
+    assert scores == [0.25, None]
+
+
+def test_concurrent_requests_share_one_model_run():
+    runs = []
+
+    def score(queries, passages):
+        runs.append(len(passages))
+        return np.array([len(q) + len(p) for q, p in zip(queries, passages)], dtype=np.float32)
+
+    batcher = PairBatcher(score, None, max_pairs=100, max_wait_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(batcher.score("q", ["a", "bb"]), batcher.score("qq", ["ccc"]))
+
+    first, second = asyncio.run(scenario())
+
+    assert runs == [3]
+    assert first.tolist() == [2.0, 3.0]
+    assert second.tolist() == [5.0]
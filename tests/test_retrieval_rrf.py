@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip("asyncpg")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("transformers")
+
+from api.app.services.retrieval import rrf_fuse  # noqa: E402
+
+
+def test_rrf_rewards_chunks_found_by_both_searches():
+    bm25 = [{"id": 1, "rank": 1}, {"id": 2, "rank": 2}, {"id": 3, "rank": 3}]
+    vector = [{"id": 3, "rank": 1}, {"id": 4, "rank": 2}]
+
+    fused = rrf_fuse(bm25, vector, rrf_k=60, final_top_n=2)
+
+    assert [row["id"] for row in fused] == [3, 1]
@@ -0,0 +1,174 @@
+import pytest
+
+pytest.importorskip("celery")
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("transformers")
+
+from worker.app import tasks  # noqa: E402
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+    def one(self):
+        return self._rows[0]
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self._rows
+
+
+class FakeDB:
+    """Сессия без Postgres: отвечает на запросы по подстроке SQL и пишет журнал выполненного."""
+
+    def __init__(self, answers=None):
+        self.answers = answers or {}
+        self.executed = []
+        self.commits = 0
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.executed.append((sql, params))
+        for fragment, rows in self.answers.items():
+            if fragment in sql:
+                return FakeResult(rows)
+        return FakeResult([])
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeReporter:
+    def __init__(self, db, job_id):
+        self.job_id = job_id
+        self.updates = []
+        reporters.append(self)
+
+    def update(self, status, step, progress, message=None):
+        self.updates.append((status, step, progress))
+
+
+reporters: list[FakeReporter] = []
+
+
+@pytest.fixture(autouse=True)
+def fake_reporter(monkeypatch):
+    reporters.clear()
+    monkeypatch.setattr(tasks, "ProgressReporter", FakeReporter)
+    monkeypatch.setattr(tasks, "publish_progress", lambda *args, **kwargs: None)
+
+
+def test_rollup_progress_covers_range_between_discovery_and_final():
+    assert tasks._rollup_progress(0, 4) == 10
+    assert tasks._rollup_progress(2, 4) == 54
+    assert tasks._rollup_progress(4, 4) == 99
+    assert tasks._rollup_progress(0, 0) == 10
+
+
+def test_roll_up_parent_writes_progress_of_finished_batches():
+    db = FakeDB({"FOR UPDATE": [("running", "dispatch")], "count(*)": [(3, 1)]})
+
+    state = tasks._roll_up_parent(db, 7)
+
+    update = next(params for sql, params in db.executed if sql.startswith("UPDATE jobs"))
+    assert update["progress"] == 39
+    assert state == ("running", "dispatch", 39, "Подзадач завершено: 1 из 3")
+
+
+def test_roll_up_parent_skips_finished_parent():
+    db = FakeDB()
+
+    assert tasks._roll_up_parent(db, 7) is None
+    assert not any(sql.startswith("UPDATE jobs") for sql, _ in db.executed)
+
+
+def test_discovery_failure_keeps_the_committed_job_row(monkeypatch, tmp_path):
+    events = []
+
+    class Session(FakeDB):
+        def commit(self):
+            events.append("commit")
+
+        def rollback(self):
+            events.append("rollback")
+
+    db = Session({"FROM sources": [{"id": 1, "base_path": "../outside", "include_globs": [], "exclude_globs": []}]})
+    monkeypatch.setattr(tasks, "SessionLocal", lambda: db)
+    monkeypatch.setattr(tasks, "_create_job", lambda db, job_type, source_id=None: 5)
+    monkeypatch.setattr(tasks.settings, "nas_mount_path", str(tmp_path))
+
+    with pytest.raises(ValueError):
+        tasks.scan_source_incremental.run(1)
+
+    # Откат после сбоя не трогает уже зафиксированную строку job, и failed пишется в нее.
+    assert events == ["commit", "rollback", "commit"]
+    assert reporters[0].updates[0][:2] == ("running", "scan_start")
+    assert reporters[0].updates[-1][:2] == ("failed", "error")
+
+
+def test_missing_file_fails_alone(tmp_path):
+    present = tmp_path / "a.txt"
+    present.write_text("текст")
+    db = FakeDB(
+        {
+            "FROM documents": [
+                {"id": 1, "relative_path": "a.txt", "storage_path": str(present)},
+                {"id": 2, "relative_path": "gone.txt", "storage_path": str(tmp_path / "gone.txt")},
+            ]
+        }
+    )
+
+    candidates, missing = tasks._batch_candidates(db, [1, 2])
+
+    assert [candidate.document_id for candidate in candidates] == [1]
+    assert missing == 1
+    failed = next(params for sql, params in db.executed if "status='failed'" in sql)
+    assert failed["id"] == 2 and '"parse_outcome": "missing"' in failed["meta"]
+
+
+def test_batch_reports_all_files_failed_after_last_retry(monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(tasks, "SessionLocal", lambda: db)
+    monkeypatch.setattr(tasks, "_batch_candidates", lambda db, ids: (_ for _ in ()).throw(RuntimeError("db down")))
+    rolled_up = []
+    monkeypatch.setattr(tasks, "_roll_up_parent", lambda db, parent: rolled_up.append(parent))
+    tasks.ingest_source_batch.push_request(retries=tasks.ingest_source_batch.max_retries)
+    try:
+        result = tasks.ingest_source_batch.run(11, 7, [1, 2, 3])
+    finally:
+        tasks.ingest_source_batch.pop_request()
+
+    assert result == {"files": 3, "indexed": 0, "failed": 3, "deferred": 0}
+    assert reporters[0].updates[-1][:2] == ("failed", "error")
+    assert rolled_up == [7]
+
+
+@pytest.mark.parametrize(
+    "results, status",
+    [
+        ([{"indexed": 3, "failed": 0}, {"indexed": 2, "failed": 0}], "completed"),
+        ([{"indexed": 3, "failed": 0}, {"indexed": 0, "failed": 2}], "partial_success"),
+        ([{"indexed": 0, "failed": 3}, {"indexed": 0, "failed": 2}], "failed"),
+        ([{"indexed": 3, "failed": 0, "deferred": 0}, {"indexed": 0, "failed": 0, "deferred": 4}], "partial_success"),
+    ],
+)
+def test_finalize_aggregates_batch_results(monkeypatch, results, status):
+    monkeypatch.setattr(tasks, "SessionLocal", FakeDB)
+    monkeypatch.setattr(tasks.settings, "embedding_cache_enabled", False)
+    monkeypatch.setattr(tasks, "get_artifact_store", lambda: None)
+
+    tasks.finalize_source_scan.run(results, 7, "файлов: 5")
+
+    assert reporters[0].updates == [(status, "done", 100)]
@@ -0,0 +1,68 @@
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("pydantic_settings")
+
+from worker.app.clients import http as client_registry  # noqa: E402
+from worker.app.clients.http import ServiceClient  # noqa: E402
+from worker.app.clients.services import MineruClient, OCRClient  # noqa: E402
+
+
+def _client(handler, retries=2):
+    client = ServiceClient(timeout=5, max_concurrency=2, retries=retries, backoff_seconds=0)
+    client._client = httpx.Client(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_retries_transient_failures_then_succeeds():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        if len(calls) == 2:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"text": "ok"})
+
+    assert _client(handler).post_json("http://mineru/v1/parse", {"file_path": "a.pdf"}) == {"text": "ok"}
+    assert len(calls) == 3
+
+
+def test_gives_up_after_retries_and_does_not_retry_client_errors():
+    calls = []
+
+    def unavailable(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        _client(unavailable, retries=1).post_json("http://ocr/v1/ocr", {})
+    assert len(calls) == 2
+
+    calls.clear()
+
+    def bad_request(request):
+        calls.append(request)
+        return httpx.Response(422)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        _client(bad_request).post_json("http://ocr/v1/ocr", {})
+    assert len(calls) == 1
+
+
+def test_ocr_and_mineru_use_separate_clients(monkeypatch):
+    created = {}
+
+    def fake_client(name, timeout, max_concurrency):
+        created[name] = (timeout, max_concurrency)
+        return type("Client", (), {"post_json": lambda self, url, payload: {"text": "ok"}})()
+
+    monkeypatch.setattr("worker.app.clients.services.service_client", fake_client)
+    monkeypatch.setattr(client_registry, "_clients", {})
+    MineruClient("http://mineru/v1/parse", 120).parse_pages("a.pdf", [(1, 1)])
+    OCRClient("http://ocr/v1/ocr", 180).parse_pages("a.pdf", [(1, 1)])
+
+    assert created["mineru"][0] == 120
+    assert created["ocr"][0] == 180
+    assert client_registry.service_client("ocr", 180, 1) is not client_registry.service_client("mineru", 120, 1)
@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("transformers")
+
+from worker.app.config import settings  # noqa: E402
+from worker.app.pipeline import indexer, scanner  # noqa: E402
+from worker.app.pipeline.chunk_diff import ExistingChunk  # noqa: E402
+from worker.app.pipeline.embedding_cache import chunk_text_hash  # noqa: E402
+from worker.app.pipeline.scanner import PipelinedScanner, ScanCandidate, ScanStats  # noqa: E402
+
+META = {"page_or_sheet": None}
+
+
+class FakeScheduler:
+    def __init__(self, log):
+        self.log = log
+
+    def embed(self, contents):
+        self.log.append(("embed", len(contents)))
+        return np.zeros((len(contents), 3), dtype=np.float32)
+
+
+class FakeSink:
+    def __init__(self, log):
+        self.log = log
+
+    def write_batch(self, indexes, contents, embeddings, metas, fingerprints):
+        self.log.append(("write", list(indexes)))
+
+    def close(self):
+        self.log.append(("close",))
+
+
+class FakeDB:
+    def __init__(self):
+        self.rolled_back = 0
+
+    @contextmanager
+    def begin_nested(self):
+        try:
+            yield
+        except Exception:
+            self.rolled_back += 1
+            raise
+
+    def commit(self):
+        pass
+
+
+def _chunks(log, texts, fail_after=None):
+    for idx, text in enumerate(texts):
+        if idx == fail_after:
+            raise RuntimeError("обрыв чтения файла")
+        log.append(("chunk", idx))
+        yield text, META
+
+
+@pytest.fixture
+def log(monkeypatch):
+    log: list = []
+    monkeypatch.setattr(settings, "stream_chunk_batch", 2)
+    old = [ExistingChunk(id=100, chunk_index=0, fingerprint=chunk_text_hash("старый"), meta=META)]
+    monkeypatch.setattr(indexer, "load_existing_chunks", lambda db, ids: {ids[0]: old})
+    monkeypatch.setattr(indexer, "ChunkSink", lambda db, document_id: FakeSink(log))
+    monkeypatch.setattr(indexer, "apply_chunk_diff", lambda db, diff: log.append(("diff", diff.deletes)))
+    monkeypatch.setattr(indexer, "finalize_document", lambda db, document_id, meta: log.append(("ready", meta["reindex"])))
+    return log
+
+
+def test_stream_is_embedded_and_written_in_batches_while_reading(log):
+    texts = [f"чанк {idx}" for idx in range(5)]
+
+    indexer.index_document_stream(None, FakeScheduler(log), 1, _chunks(log, texts), {})
+
+    # Первая порция уходит в эмбеддер и COPY до того, как прочитан третий чанк.
+    assert log[:5] == [("chunk", 0), ("chunk", 1), ("embed", 2), ("write", [0, 1]), ("chunk", 2)]
+    assert [entry for entry in log if entry[0] == "write"] == [("write", [0, 1]), ("write", [2, 3]), ("write", [4])]
+    assert log[-3:] == [("close",), ("diff", [100]), ("ready", {"kept": 0, "updated": 0, "inserted": 5, "deleted": 1})]
+
+
+def test_failure_midway_leaves_old_chunks_and_document_state(log):
+    texts = [f"чанк {idx}" for idx in range(5)]
+
+    with pytest.raises(RuntimeError):
+        indexer.index_document_stream(None, FakeScheduler(log), 1, _chunks(log, texts, fail_after=3), {})
+
+    # Записанная порция откатывается вместе с транзакцией; старые чанки не удалены, документ не ready.
+    assert ("write", [0, 1]) in log
+    assert not [entry for entry in log if entry[0] in ("diff", "ready")]
+
+
+def test_scanner_marks_a_document_failed_when_its_stream_breaks(monkeypatch, log):
+    failed = []
+    monkeypatch.setattr(
+        scanner, "stream_document_pooled", lambda pool, path, *args, **kwargs: (_chunks(log, ["a", "b", "c"], fail_after=1), {})
+    )
+    monkeypatch.setattr(
+        scanner, "mark_document_failed", lambda db, document_id, error, outcome="error": failed.append((document_id, error, outcome))
+    )
+    db, stats = FakeDB(), ScanStats()
+    candidate = ScanCandidate(path=Path("/nas/big.txt"), relative_path="big.txt", size_bytes=1, mtime="")
+
+    PipelinedScanner(db, FakeScheduler(log), pool=object())._stream(7, candidate, stats)
+
+    assert (stats.indexed, stats.failed) == (0, 1)
+    assert db.rolled_back == 1
+    assert failed == [(7, "обрыв чтения файла", "error")]
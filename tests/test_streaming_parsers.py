@@ -0,0 +1,55 @@
+import pytest
+
+docx = pytest.importorskip("docx")
+openpyxl = pytest.importorskip("openpyxl")
+pytest.importorskip("pypdf")
+
+from worker.app.pipeline.parsers import iter_docx_blocks, iter_txt_blocks, iter_xlsx_blocks  # noqa: E402
+
+
+def test_txt_is_read_in_blocks_cut_at_blank_lines(tmp_path):
+    path = tmp_path / "big.txt"
+    paragraphs = [f"абзац {idx} " + "слово " * 20 for idx in range(50)]
+    path.write_text("\n\n".join(paragraphs), encoding="utf-8")
+
+    blocks = list(iter_txt_blocks(path, block_chars=500))
+
+    assert len(blocks) > 5
+    assert "".join(blocks) == path.read_text(encoding="utf-8")
+    assert all(block.endswith("\n") for block in blocks[:-1])
+
+
+def test_docx_paragraphs_are_joined_into_blocks(tmp_path):
+    document = docx.Document()
+    paragraphs = [f"абзац {idx} " + "слово " * 10 for idx in range(30)]
+    for text in paragraphs:
+        document.add_paragraph(text)
+        document.add_paragraph("")
+    path = tmp_path / "big.docx"
+    document.save(path)
+
+    blocks = list(iter_docx_blocks(path, block_chars=300))
+
+    assert len(blocks) > 5
+    # Пустые абзацы пропускаются, непустые идут по порядку без потерь.
+    assert "\n".join(blocks).split("\n") == paragraphs
+
+
+def test_xlsx_rows_stream_per_sheet_with_sheet_header(tmp_path):
+    wb = openpyxl.Workbook()
+    first = wb.active
+    first.title = "План"
+    for idx in range(20):
+        first.append([f"строка{idx}", idx, None])
+    second = wb.create_sheet("Факт")
+    second.append(["итого", 42])
+    path = tmp_path / "big.xlsx"
+    wb.save(path)
+
+    blocks = list(iter_xlsx_blocks(path, block_chars=60))
+
+    plan = [block for sheet, block in blocks if sheet == "План"]
+    assert len(plan) > 2
+    assert plan[0].startswith("## sheet: План\nстрока0 | 0 | ")
+    assert not any(block.startswith("## sheet") for block in plan[1:])
+    assert blocks[-1] == ("Факт", "## sheet: Факт\nитого | 42")
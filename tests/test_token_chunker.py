@@ -0,0 +1,41 @@
+import re
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("transformers")
+
+from worker.app.pipeline.chunking import TextSegment, TokenChunker  # noqa: E402
+
+
+def _words(texts, add_special_tokens, return_offsets_mapping):
+    # Токен — слово: смещения как у быстрого токенизатора.
+    return {"offset_mapping": [[m.span() for m in re.finditer(r"\S+", text)] for text in texts]}
+
+
+def test_paragraphs_are_packed_to_token_budget():
+    text = "a b c\n\nd e\n\nf g h i"
+    chunker = TokenChunker(_words, max_tokens=6, overlap_tokens=0)
+
+    chunks = [chunk for chunk, _ in chunker.iter_chunks([TextSegment(text)])]
+
+    assert chunks == ["a b c\n\nd e", "f g h i"]
+    assert chunker.tokens == 9
+
+
+def test_long_line_is_split_into_overlapping_windows():
+    chunker = TokenChunker(_words, max_tokens=4, overlap_tokens=1)
+
+    chunks = [chunk for chunk, _ in chunker.iter_chunks([TextSegment("w1 w2 w3 w4 w5 w6 w7")])]
+
+    assert chunks == ["w1 w2 w3 w4", "w4 w5 w6 w7"]
+
+
+def test_pages_join_but_sheets_do_not():
+    chunker = TokenChunker(_words, max_tokens=10, overlap_tokens=0)
+    segments = [TextSegment("p one", "1"), TextSegment("p two", "2"), TextSegment("row", "Лист1"), TextSegment("row", "Лист2")]
+
+    chunks = list(chunker.iter_chunks(segments))
+
+    assert chunks[0] == ("p one\np two", {"page_or_sheet": "1-2"})
+    assert [meta["page_or_sheet"] for _, meta in chunks[1:]] == ["Лист1", "Лист2"]
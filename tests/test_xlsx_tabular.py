@@ -0,0 +1,53 @@
+import re
+
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+pytest.importorskip("transformers")
+pytest.importorskip("pypdf")
+
+from worker.app.pipeline.chunking import TableChunker  # noqa: E402
+from worker.app.pipeline.parsers import iter_xlsx_sheets  # noqa: E402
+
+
+def _words(texts, add_special_tokens):
+    return {"input_ids": [re.findall(r"\S+", text) for text in texts]}
+
+
+def test_rows_are_grouped_under_header_with_sheet_and_row_range(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Бюджет"
+    ws.append(["Статья", "Сумма", None, None])
+    for idx in range(1, 6):
+        ws.append([f"статья{idx}", idx * 100, None])
+    ws.append([None, None])
+    ws.append(["итого", 1500])
+    path = tmp_path / "budget.xlsx"
+    wb.save(path)
+
+    chunks = list(TableChunker(_words, max_tokens=12).iter_chunks(iter_xlsx_sheets(path)))
+
+    assert chunks[0][0] == "## Бюджет\nСтатья | Сумма\nстатья1 | 100\nстатья2 | 200"
+    assert [meta for _, meta in chunks] == [
+        {"page_or_sheet": "Бюджет", "row_start": 2, "row_end": 3},
+        {"page_or_sheet": "Бюджет", "row_start": 4, "row_end": 5},
+        {"page_or_sheet": "Бюджет", "row_start": 6, "row_end": 8},
+    ]
+
+
+def test_offset_range_keeps_excel_row_numbers_and_drops_leading_columns(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Отчет"
+    # Данные с B3: столбец A отсекается, пустой C остается, чтобы ячейки не съезжали относительно шапки.
+    ws["B3"], ws["D3"] = "Статья", "Сумма"
+    ws["B4"], ws["D4"] = "аренда", 100
+    ws["B6"], ws["D6"] = "итого", 100
+    path = tmp_path / "report.xlsx"
+    wb.save(path)
+
+    (sheet, rows), = [(sheet, list(rows)) for sheet, rows in iter_xlsx_sheets(path)]
+
+    assert sheet == "Отчет"
+    assert rows == [(3, "Статья |  | Сумма"), (4, "аренда |  | 100"), (6, "итого |  | 100")]
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import importlib.util
+import random
+import threading
+import time
+
+import httpx
+
+from ..config import settings
+
+# HTTP/2 включается, только если установлен пакет h2 (httpx[http2]).
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+# Ответы, после которых запрос безопасно повторить: сервис перегружен или перезапускается.
+RETRY_STATUSES = {429, 502, 503, 504}
+# Ошибки до получения ответа; ReadTimeout не повторяем, чтобы не удваивать долгие вызовы.
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.PoolTimeout)
+
+
+def backoff_delay(attempt: int, base: float) -> float:
+    """Full jitter: случайная пауза до base·2^attempt, чтобы повторы воркеров не шли волной."""
+    return random.uniform(0, base * 2**attempt)
+
+
+class ServiceClient:
+    """Клиент внутреннего сервиса с keep-alive пулом, лимитом параллельных вызовов и повторами.
+
+    Один экземпляр на сервис и процесс (`service_client`), соединения переиспользуются между вызовами.
+    """
+
+    def __init__(self, timeout: float, max_concurrency: int, retries: int | None = None, backoff_seconds: float | None = None):
+        self._retries = settings.http_retries if retries is None else retries
+        self._backoff = settings.http_backoff_seconds if backoff_seconds is None else backoff_seconds
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            http2=HTTP2_AVAILABLE,
+        )
+
+    def post_json(self, url: str, payload: dict) -> dict:
+        attempt = 0
+        while True:
+            try:
+                with self._slots:
+                    response = self._client.post(url, json=payload)
+                if response.status_code not in RETRY_STATUSES or attempt >= self._retries:
+                    response.raise_for_status()
+                    return response.json()
+            except RETRY_ERRORS:
+                if attempt >= self._retries:
+                    raise
+            time.sleep(backoff_delay(attempt, self._backoff))
+            attempt += 1
+
+    def close(self) -> None:
+        self._client.close()
+
+
+_clients: dict[str, ServiceClient] = {}
+_clients_lock = threading.Lock()
+
+
+def service_client(name: str, timeout: float, max_concurrency: int) -> ServiceClient:
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = ServiceClient(timeout, max_concurrency)
+        return _clients[name]
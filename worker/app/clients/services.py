@@ -1,4 +1,18 @@
-import httpx
+from ..config import settings
+from .http import service_client
+
+# Результат сервиса по страницам: номер страницы (с 1) → (текст, quality_score).
+PageResults = dict[int, tuple[str, float]]
+
+
+def _page_results(data: dict) -> PageResults:
+    """Постраничный ответ сервиса; ответ без `pages` пуст — общий текст нельзя отнести к странице.
+
+    Каскад шлет по запросу на окно страниц, и такой текст попал бы в документ по разу на каждое окно.
+    """
+    if "pages" not in data:
+        return {}
+    return {int(item["page"]): (item.get("text", ""), item.get("quality_score", data.get("quality_score", 0.0))) for item in data["pages"]}
 
 
 class MineruClient:
@@ -6,12 +20,11 @@ class MineruClient:
         self.url = url
         self.timeout = timeout
 
-    def parse_pdf(self, file_path: str) -> tuple[str, float]:
-        with httpx.Client(timeout=self.timeout) as client:
-            response = client.post(self.url, json={"file_path": file_path})
-            response.raise_for_status()
-            data = response.json()
-        return data.get("text", ""), data.get("quality_score", 0.0)
+    def parse_pages(self, file_path: str, page_ranges: list[tuple[int, int]]) -> PageResults:
+        """Разбирает только указанные диапазоны страниц (включительно, нумерация с 1)."""
+        client = service_client("mineru", self.timeout, settings.mineru_max_concurrency)
+        data = client.post_json(self.url, {"file_path": file_path, "pages": page_ranges})
+        return _page_results(data)
 
 
 class OCRClient:
@@ -19,9 +32,7 @@ class OCRClient:
         self.url = url
         self.timeout = timeout
 
-    def parse_pdf(self, file_path: str) -> tuple[str, float, int]:
-        with httpx.Client(timeout=self.timeout) as client:
-            response = client.post(self.url, json={"file_path": file_path})
-            response.raise_for_status()
-            data = response.json()
-        return data.get("text", ""), data.get("quality_score", 0.0), data.get("pages_processed", 0)
+    def parse_pages(self, file_path: str, page_ranges: list[tuple[int, int]]) -> tuple[PageResults, int]:
+        client = service_client("ocr", self.timeout, settings.ocr_max_concurrency)
+        data = client.post_json(self.url, {"file_path": file_path, "pages": page_ranges})
+        return _page_results(data), data.get("pages_processed", 0)
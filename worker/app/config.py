@@ -34,9 +34,42 @@ class Settings(BaseSettings):
     # Chunking and embeddings
     chunk_size_chars: int = 800
     chunk_overlap_chars: int = 120
+    # Чанки по токенам BGE-M3 с границами абзацев/страниц/листов; False — прежняя нарезка по символам
+    chunk_by_tokens: bool = True
+    chunk_max_tokens: int = 384
+    chunk_overlap_tokens: int = 48
+    # Пул процессов парсинга: wall-clock таймаут на файл (без ожидания GPU, работы MinerU/OCR и индексации
+    # отданных порций потока), RLIMIT_AS процесса, перезапуск после N файлов
+    parse_file_timeout_seconds: int = 1800
+    parse_memory_mb: int = 6144
+    parse_max_tasks_per_worker: int = 50
+    # Кэш извлеченного текста по хэшу содержимого файла (пусто — выключен), LRU-вытеснение по размеру
+    artifact_cache_dir: str = "/data/artifacts"
+    artifact_cache_max_mb: int = 20480
+    # xlsx по строкам: группы строк под бюджет токенов с шапкой листа, лист и строки в chunks.meta
+    xlsx_tabular: bool = True
+    # Потоковая индексация: блоки текста при чтении файла, окно страниц PDF для каскада,
+    # чанков на эмбеддинг, запись и порцию из пула парсинга; файлы от stream_ingest_min_mb (загрузки и NAS) идут потоком
+    stream_block_chars: int = 262144
+    stream_pdf_window_pages: int = 64
+    stream_chunk_batch: int = 256
+    stream_ingest_min_mb: int = 64
     embedding_dim: int = 1024
     embedding_batch_size: int = 16
     embedding_max_chars: int = 2000
+    # Бюджет дополненных токенов на один ONNX-батч; 0 = embedding_max_tokens × embedding_batch_size
+    embedding_token_budget: int = 0
+    embedding_max_batch: int = 128
+    # Кэш эмбеддингов по хэшу текста чанка (таблица embedding_cache)
+    embedding_model_id: str = "bge-m3"
+    embedding_cache_enabled: bool = True
+    embedding_cache_max_rows: int = 500_000
+    # Сколько чанков NAS-скан копит по нескольким файлам перед общим прогоном эмбеддера
+    scan_embed_chunks: int = 256
+
+    # DB write (COPY вместо построчных INSERT)
+    chunk_sink_binary: bool = True
+    chunk_sink_flush_rows: int = 512
 
     # Limits
     parser_timeout_seconds: int = 120
@@ -44,18 +77,38 @@ class Settings(BaseSettings):
     job_timeout_seconds: int = 900
     max_pdf_pages_for_ocr: int = 100
 
-    # NAS scan limits
+    # NAS scan limits: файлы и MB — на обнаружение; таймаут — на весь скан от его начала, включая
+    # индексацию в подзадачах (не начатые к дедлайну файлы остаются queued до следующего скана)
     scan_max_files: int = 2000
     scan_max_mb: int = 2048
     scan_timeout_seconds: int = 900
+    # Конвейер скана: процессы парсинга (0 = по числу ядер) и размер очереди обхода каталогов
+    scan_parse_workers: int = 0
+    scan_queue_size: int = 256
+    # Fan-out скана: файлов на одну Celery-подзадачу и число повторов упавшего батча
+    scan_batch_files: int = 20
+    scan_batch_max_retries: int = 2
+
+    # Прогресс jobs: живое состояние в Redis не чаще интервала, в job_steps — только смены шагов
+    progress_flush_interval_ms: int = 1000
+    progress_ttl_seconds: int = 86400
 
-    # GPU lock
+    # GPU lock: префикс ключей семафора и максимальное ожидание слота
     gpu_lock_key: str = "gpu_lock"
     gpu_lock_ttl_seconds: int = 1200
+    # Одновременных держателей GPU, аренда слота (продлевается, пока задача жива) и период перепроверки очереди
+    gpu_slots: int = 1
+    gpu_lease_seconds: int = 60
+    gpu_wait_poll_seconds: int = 5
 
     # Services
     mineru_url: str = "http://mineru:8070/v1/parse"
     ocr_url: str = "http://ocr:8080/v1/ocr"
+    # HTTP-клиенты сервисов: параллельных вызовов на процесс, повторы с jitter-паузой
+    mineru_max_concurrency: int = 4
+    ocr_max_concurrency: int = 4
+    http_retries: int = 2
+    http_backoff_seconds: float = 0.2
 
     # NAS
     nas_mount_path: str = "/mnt/nas"
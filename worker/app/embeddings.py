@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
 
 import numpy as np
 import onnxruntime as ort
@@ -11,7 +12,8 @@ from .config import settings
 
 @dataclass
 class EmbeddingBatch:
-    embeddings: list[list[float]]
+    # Матрица (n, dim) float32, C-contiguous, строки L2-нормированы.
+    embeddings: np.ndarray
 
 
 class OnnxEmbeddingModel:
@@ -24,45 +26,191 @@ class OnnxEmbeddingModel:
 
     def embed_texts(self, texts: list[str]) -> EmbeddingBatch:
         if not texts:
-            return EmbeddingBatch(embeddings=[])
+            return EmbeddingBatch(embeddings=np.empty((0, settings.embedding_dim), dtype=np.float32))
+        return EmbeddingBatch(embeddings=self.embed_token_ids(self.tokenize(texts)))
 
+    def tokenize(self, texts: list[str]) -> list[list[int]]:
+        """Токенизация без паддинга: длины нужны планировщику батчей."""
         trimmed = [text[: settings.embedding_max_chars] for text in texts]
-        tokens = self._tokenizer(
-            trimmed,
-            padding=True,
-            truncation=True,
-            max_length=settings.embedding_max_tokens,
-            return_tensors="np",
-        )
+        tokens = self._tokenizer(trimmed, truncation=True, max_length=settings.embedding_max_tokens)
+        return tokens["input_ids"]
+
+    def embed_token_ids(self, input_ids: list[list[int]]) -> np.ndarray:
+        """Паддит батч до самой длинной последовательности и считает нормированные эмбеддинги."""
+        tokens = self._tokenizer.pad({"input_ids": input_ids}, padding=True, return_tensors="np")
         feeds = {name: tokens[name] for name in self._input_names if name in tokens}
         outputs = self._session.run(None, feeds)
-        embeddings = self._select_embeddings(outputs, tokens)
-        normalized = [self._normalize(vec) for vec in embeddings]
-        return EmbeddingBatch(embeddings=normalized)
+        return self._normalize(self._select_embeddings(outputs, tokens))
 
-    def _select_embeddings(self, outputs: list[np.ndarray], tokens) -> list[list[float]]:
+    def _select_embeddings(self, outputs: list[np.ndarray], tokens) -> np.ndarray:
         if not outputs:
             raise RuntimeError("ONNX модель не вернула выходы")
         output = outputs[0]
         if output.ndim == 2:
-            return output.astype(np.float32).tolist()
+            return np.array(output, dtype=np.float32, order="C")
         if output.ndim == 3:
             mask = tokens.get("attention_mask")
             if mask is None:
                 raise RuntimeError("Не найдена attention_mask для mean pooling")
             mask = mask.astype(np.float32)
-            summed = (output * mask[:, :, None]).sum(axis=1)
-            counts = np.clip(mask.sum(axis=1, keepdims=True), 1.0, None)
-            pooled = summed / counts
-            return pooled.astype(np.float32).tolist()
+            # einsum суммирует по токенам без промежуточного тензора (batch, seq, dim).
+            pooled = np.einsum("bsd,bs->bd", output.astype(np.float32, copy=False), mask)
+            pooled /= np.clip(mask.sum(axis=1, keepdims=True), 1.0, None)
+            return pooled
         raise RuntimeError(f"Неожиданная размерность выходов ONNX: {output.ndim}")
 
-    def _normalize(self, vec: list[float]) -> list[float]:
-        array = np.array(vec, dtype=np.float32)
-        norm = np.linalg.norm(array)
-        if norm == 0:
-            return array.tolist()
-        return (array / norm).tolist()
+    def _normalize(self, embeddings: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embeddings /= norms
+        return embeddings
+
+
+def to_pgvector_binary(vectors: np.ndarray) -> np.ndarray:
+    """Кодирует строки матрицы в поле COPY BINARY формата pgvector (vector_recv).
+
+    Возвращает матрицу uint8 (n, 8 + 4 * dim): строка — длина поля, dim, 0 и float4 big-endian.
+    Данные переставляются в сетевой порядок байт один раз на батч, строки отдаются как view.
+    """
+    count, dim = vectors.shape
+    layout = np.dtype([("size", ">i4"), ("dim", ">i2"), ("unused", ">i2"), ("data", ">f4", (dim,))])
+    encoded = np.empty(count, dtype=layout)
+    encoded["size"] = 4 + 4 * dim
+    encoded["dim"] = dim
+    encoded["unused"] = 0
+    encoded["data"] = vectors
+    return encoded.view(np.uint8).reshape(count, layout.itemsize)
+
+
+def to_pgvector_text(vectors: np.ndarray) -> list[str]:
+    """Текстовые литералы pgvector (`[x1,...,xn]`) для строк матрицы."""
+    template = _vector_template(vectors.shape[1])
+    return [template % tuple(row) for row in vectors.tolist()]
+
+
+@lru_cache(maxsize=4)
+def _vector_template(dim: int) -> str:
+    return "[" + ",".join(["%.7g"] * dim) + "]"
+
+
+@dataclass
+class PaddingStats:
+    """Счетчики паддинга: сколько токенов модель посчитала впустую."""
+
+    batches: int = 0
+    texts: int = 0
+    real_tokens: int = 0
+    padded_tokens: int = 0
+
+    @property
+    def waste_ratio(self) -> float:
+        if not self.padded_tokens:
+            return 0.0
+        return 1.0 - self.real_tokens / self.padded_tokens
+
+    def describe(self) -> str:
+        return (
+            f"эмбеддинги: {self.texts} текстов, {self.batches} батчей, "
+            f"паддинг {self.waste_ratio:.1%} ({self.padded_tokens - self.real_tokens} токенов)"
+        )
+
+
+class EmbeddingScheduler:
+    """Динамический батчинг по длине: тексты сортируются по числу токенов и режутся на бакеты.
+
+    Бакет ограничен бюджетом `embedding_token_budget` на дополненные токены (длина × размер),
+    поэтому короткие чанки не платят за паддинг длинных. Запросы нескольких документов можно
+    накопить через `submit` и посчитать одним `drain`; результаты возвращаются в исходном порядке.
+    Если передан `cache` (EmbeddingCache), ONNX считает только промахи кэша.
+    """
+
+    def __init__(
+        self,
+        embedder: OnnxEmbeddingModel,
+        token_budget: int | None = None,
+        max_batch: int | None = None,
+        cache=None,
+    ):
+        self._embedder = embedder
+        self._token_budget = (
+            token_budget or settings.embedding_token_budget or settings.embedding_max_tokens * settings.embedding_batch_size
+        )
+        self._max_batch = max_batch or settings.embedding_max_batch
+        self.cache = cache
+        self._pending: list[list[str]] = []
+        self.stats = PaddingStats()
+
+    @property
+    def pending_texts(self) -> int:
+        return sum(len(request) for request in self._pending)
+
+    def describe(self) -> str:
+        if self.cache is None:
+            return self.stats.describe()
+        return f"{self.stats.describe()}; {self.cache.stats.describe()}"
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Считает только `texts`, не трогая накопленные через `submit` запросы."""
+        pending, self._pending = self._pending, []
+        try:
+            self.submit(texts)
+            return self.drain()[0]
+        finally:
+            self._pending = pending
+
+    def submit(self, texts: list[str]) -> None:
+        self._pending.append(list(texts))
+
+    def drain(self) -> list[np.ndarray]:
+        """Считает все накопленные запросы и возвращает матрицы в порядке `submit`."""
+        requests, self._pending = self._pending, []
+        texts = [content for request in requests for content in request]
+        embeddings = np.empty((len(texts), settings.embedding_dim), dtype=np.float32)
+
+        missing = np.arange(len(texts))
+        if self.cache is not None:
+            missing = np.flatnonzero(~self.cache.lookup(texts, embeddings))
+        # Одинаковые чанки (шапки таблиц, колонтитулы) считаем один раз.
+        unique: dict[str, list[int]] = {}
+        for idx in missing.tolist():
+            unique.setdefault(texts[idx], []).append(idx)
+        unique_texts = list(unique)
+        computed = self._embed_sorted(self._embedder.tokenize(unique_texts) if unique_texts else [])
+        for row, positions in zip(computed, unique.values()):
+            embeddings[positions] = row
+        if self.cache is not None:
+            self.cache.store(unique_texts, computed)
+        self.stats.texts += len(texts)
+
+        results = []
+        offset = 0
+        for request in requests:
+            results.append(embeddings[offset : offset + len(request)])
+            offset += len(request)
+        return results
+
+    def _embed_sorted(self, input_ids: list[list[int]]) -> np.ndarray:
+        embeddings = np.empty((len(input_ids), settings.embedding_dim), dtype=np.float32)
+        lengths = np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(input_ids))
+        order = np.argsort(lengths, kind="stable")
+        for bucket in self._buckets(order, lengths):
+            embeddings[bucket] = self._embedder.embed_token_ids([input_ids[idx] for idx in bucket])
+            self.stats.batches += 1
+            self.stats.real_tokens += int(lengths[bucket].sum())
+            self.stats.padded_tokens += int(lengths[bucket[-1]]) * len(bucket)
+        return embeddings
+
+    def _buckets(self, order: np.ndarray, lengths: np.ndarray):
+        # order отсортирован по возрастанию длины, поэтому паддинг бакета = длина последнего элемента.
+        start = 0
+        for pos in range(1, len(order) + 1):
+            if pos == len(order):
+                yield order[start:pos]
+                break
+            size = pos - start + 1
+            if size > self._max_batch or size * int(lengths[order[pos]]) > self._token_budget:
+                yield order[start:pos]
+                start = pos
 
 
 _EMBEDDER: OnnxEmbeddingModel | None = None
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import threading
+import time
+from typing import Callable, Iterator
+import uuid
+
+from redis import Redis, WatchError
+
+from .config import settings
+
+redis_client = Redis.from_url(settings.redis_url)
+
+PRIORITIES = {"interactive": 0, "background": 1}
+# Позиция в очереди (с 1) или None, когда слот получен.
+QueueCallback = Callable[[int | None], None]
+
+
+class GpuScheduler:
+    """Распределенный семафор GPU на Redis со справедливой очередью.
+
+    Ключи (префикс `gpu_lock_key`):
+    - `:holders` — ZSET токен → срок аренды (время Redis); просроченные аренды снимаются любым участником;
+    - `:waiters` — ZSET токен → приоритет·10¹³ + время постановки, т.е. FIFO внутри приоритета;
+    - `:alive:<token>` — признак живого ожидающего, мертвые из головы очереди удаляются;
+    - `:wake:<token>` — список, на котором ожидающий висит в BLPOP до освобождения слота.
+
+    Слот выдается первым `slots − занято` ожидающим в транзакции WATCH/MULTI. Аренда принадлежит
+    токену: освобождение и продление трогают только свой токен, продлевает фоновый поток.
+    """
+
+    def __init__(
+        self,
+        client: Redis | None = None,
+        key: str | None = None,
+        slots: int | None = None,
+        lease_seconds: int | None = None,
+        poll_seconds: int | None = None,
+    ):
+        self._client = client or redis_client
+        self._key = key or settings.gpu_lock_key
+        self._slots = slots or settings.gpu_slots
+        self._lease = lease_seconds or settings.gpu_lease_seconds
+        self._poll = poll_seconds or settings.gpu_wait_poll_seconds
+        self._holders = f"{self._key}:holders"
+        self._waiters = f"{self._key}:waiters"
+
+    @contextmanager
+    def slot(
+        self, priority: str = "background", on_queue: QueueCallback | None = None, timeout: float | None = None
+    ) -> Iterator[None]:
+        token = uuid.uuid4().hex
+        self._enqueue(token, priority)
+        try:
+            self._wait(token, on_queue, settings.gpu_lock_ttl_seconds if timeout is None else timeout)
+        except BaseException:
+            self._leave(token)
+            raise
+        stop = threading.Event()
+        renewer = threading.Thread(target=self._renew, args=(token, stop), name="gpu-lease", daemon=True)
+        renewer.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            renewer.join()
+            self.release(token)
+
+    def _now(self) -> float:
+        seconds, micros = self._client.time()
+        return seconds + micros / 1_000_000
+
+    def _enqueue(self, token: str, priority: str) -> None:
+        score = PRIORITIES[priority] * 10**13 + int(self._now() * 1000)
+        pipe = self._client.pipeline()
+        pipe.set(f"{self._key}:alive:{token}", 1, ex=self._poll * 3)
+        pipe.zadd(self._waiters, {token: score})
+        pipe.execute()
+
+    def try_acquire(self, token: str) -> int | None:
+        """Забирает слот, если токен в голове очереди; иначе возвращает позицию в очереди (с 1)."""
+        now = self._now()
+        self._client.zremrangebyscore(self._holders, "-inf", now)
+        self._drop_dead_waiters()
+        with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self._holders, self._waiters)
+                    free = self._slots - pipe.zcard(self._holders)
+                    rank = pipe.zrank(self._waiters, token)
+                    if rank is None:
+                        raise RuntimeError("Ожидающий GPU удален из очереди")
+                    if rank >= free:
+                        pipe.unwatch()
+                        return rank - max(free, 0) + 1
+                    pipe.multi()
+                    pipe.zrem(self._waiters, token)
+                    pipe.zadd(self._holders, {token: now + self._lease})
+                    pipe.delete(f"{self._key}:alive:{token}", f"{self._key}:wake:{token}")
+                    pipe.execute()
+                    return None
+                except WatchError:
+                    continue
+
+    def release(self, token: str) -> None:
+        self._client.zrem(self._holders, token)
+        self._wake()
+
+    def _wait(self, token: str, on_queue: QueueCallback | None, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        reported = None
+        while True:
+            position = self.try_acquire(token)
+            if position != reported and on_queue:
+                on_queue(position)
+                reported = position
+            if position is None:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RuntimeError("Таймаут ожидания GPU lock")
+            self._client.set(f"{self._key}:alive:{token}", 1, ex=self._poll * 3)
+            # Таймаут BLPOP страхует от потерянного пробуждения и от аренды, истекшей без release.
+            self._client.blpop([f"{self._key}:wake:{token}"], timeout=max(1, min(self._poll, int(remaining))))
+
+    def _leave(self, token: str) -> None:
+        pipe = self._client.pipeline()
+        pipe.zrem(self._waiters, token)
+        pipe.delete(f"{self._key}:alive:{token}", f"{self._key}:wake:{token}")
+        pipe.execute()
+        self._wake()
+
+    def _wake(self) -> None:
+        pipe = self._client.pipeline()
+        for token in self._client.zrange(self._waiters, 0, self._slots - 1):
+            token = token.decode() if isinstance(token, bytes) else token
+            pipe.rpush(f"{self._key}:wake:{token}", 1)
+            pipe.expire(f"{self._key}:wake:{token}", self._poll * 3)
+        pipe.execute()
+
+    def _drop_dead_waiters(self) -> None:
+        # Упавший воркер не должен вечно держать голову очереди: проверяем только ее начало.
+        head = self._client.zrange(self._waiters, 0, self._slots * 4 - 1)
+        if not head:
+            return
+        pipe = self._client.pipeline()
+        for token in head:
+            token = token.decode() if isinstance(token, bytes) else token
+            pipe.exists(f"{self._key}:alive:{token}")
+        dead = [token for token, alive in zip(head, pipe.execute()) if not alive]
+        if dead:
+            self._client.zrem(self._waiters, *dead)
+
+    def _renew(self, token: str, stop: threading.Event) -> None:
+        while not stop.wait(self._lease / 3):
+            # XX: аренду, уже снятую как просроченную, не воскрешаем.
+            if not self._client.zadd(self._holders, {token: self._now() + self._lease}, xx=True, ch=True):
+                return
+
+
+def gpu_lock(priority: str = "background", on_queue: QueueCallback | None = None):
+    """Слот GPU для тяжелых задач OCR/MinerU; загрузки пользователей идут с priority="interactive"."""
+    return GpuScheduler().slot(priority, on_queue)
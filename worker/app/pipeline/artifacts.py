@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+import struct
+from typing import Iterable, Iterator
+import uuid
+import zlib
+
+from ..config import settings
+from .chunking import TextSegment
+
+# Меняется при любой правке парсеров, влияющей на извлеченный текст: старые артефакты перестают совпадать.
+PARSER_VERSION = "1"
+
+_MAGIC = b"RAGART1\n"
+_HEADER_LEN = struct.Struct(">I")
+_BYTES_IN_MB = 1024 * 1024
+
+
+def file_digest(path: Path) -> str:
+    with path.open("rb") as handle:
+        return hashlib.file_digest(handle, "sha256").hexdigest()
+
+
+def artifact_key(path: Path) -> str:
+    """Хэш содержимого файла + версия парсеров + пороги каскада, от которых зависит текст."""
+    config = (
+        f"{PARSER_VERSION}:{settings.quality_threshold_builtin}:{settings.quality_threshold_mineru}:"
+        f"{settings.quality_threshold_ocr}:{settings.max_pdf_pages_for_ocr}:{settings.stream_block_chars}"
+    )
+    return hashlib.sha256(f"{file_digest(path)}:{config}".encode()).hexdigest()
+
+
+class ArtifactStore:
+    """Кэш извлеченного текста на локальном диске, адресуемый содержимым файла.
+
+    Артефакт — файл `<root>/<ab>/<key>.art`: заголовок JSON (meta парсинга и карта сегментов
+    «метка, смещение, длина») и независимо сжатые zlib сегменты. Чтение идет через mmap и
+    разжимает сегменты по одному, поэтому поток индексации не держит документ целиком. Файл
+    пишется во временный и публикуется `os.replace`. Время изменения файла — отметка последнего
+    использования для LRU-вытеснения по `artifact_cache_max_mb`.
+    """
+
+    def __init__(self, root: str | Path, max_mb: int | None = None):
+        self._root = Path(root)
+        self._max_bytes = (max_mb or settings.artifact_cache_max_mb) * _BYTES_IN_MB
+        self.evicted = 0
+
+    def _path(self, key: str) -> Path:
+        return self._root / key[:2] / f"{key}.art"
+
+    def get(self, key: str) -> tuple[dict, Iterator[TextSegment]] | None:
+        path = self._path(key)
+        try:
+            handle = path.open("rb")
+        except FileNotFoundError:
+            return None
+        try:
+            with handle:
+                data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Пустой файл не отображается в память.
+            return self._discard(path)
+        try:
+            if data[: len(_MAGIC)] != _MAGIC:
+                raise ValueError("нет сигнатуры артефакта")
+            start = len(_MAGIC) + _HEADER_LEN.size
+            (header_len,) = _HEADER_LEN.unpack_from(data, len(_MAGIC))
+            header = json.loads(data[start : start + header_len])
+            meta, index = header["meta"], header["segments"]
+            if start + header_len + sum(length for _, _, length in index) != len(data):
+                raise ValueError("артефакт обрезан")
+        except (ValueError, TypeError, struct.error, KeyError):
+            # Недописанный или испорченный артефакт — промах кэша, а не ошибка разбора документа.
+            data.close()
+            return self._discard(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return meta, self._segments(data, start + header_len, index)
+
+    @staticmethod
+    def _discard(path: Path) -> None:
+        try:
+            path.unlink(missing_ok=True)
+        except OSError:
+            pass
+        return None
+
+    @staticmethod
+    def _segments(data: mmap.mmap, base: int, index: list) -> Iterator[TextSegment]:
+        try:
+            for label, offset, length in index:
+                text = zlib.decompress(data[base + offset : base + offset + length]).decode("utf-8")
+                yield TextSegment(text, label)
+        finally:
+            data.close()
+
+    def record(self, key: str, segments: Iterable[TextSegment], meta: dict) -> Iterator[TextSegment]:
+        """Пропускает сегменты дальше и пишет артефакт; он публикуется, только если поток дочитан до конца.
+
+        Ошибка записи на диск (нет места и т.п.) отключает запись, но не прерывает разбор.
+        """
+        path = self._path(key)
+        body_path = path.with_suffix(f".{uuid.uuid4().hex}.body")
+        index: list = []
+        offset = 0
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            body = body_path.open("wb")
+        except OSError:
+            body = None
+        try:
+            for segment in segments:
+                if body is not None:
+                    block = zlib.compress(segment.text.encode("utf-8"), 6)
+                    try:
+                        body.write(block)
+                    except OSError:
+                        body.close()
+                        body = None
+                    index.append([segment.page_or_sheet, offset, len(block)])
+                    offset += len(block)
+                yield segment
+            if body is not None:
+                body.close()
+                self._publish(path, body_path, {key: value for key, value in meta.items() if key != "artifact"}, index)
+        finally:
+            if body is not None:
+                body.close()
+            body_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _publish(path: Path, body_path: Path, meta: dict, index: list) -> None:
+        header = json.dumps({"meta": meta, "segments": index}, ensure_ascii=False).encode("utf-8")
+        final_tmp = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        try:
+            with final_tmp.open("wb") as out, body_path.open("rb") as body:
+                out.write(_MAGIC + _HEADER_LEN.pack(len(header)) + header)
+                while block := body.read(_BYTES_IN_MB):
+                    out.write(block)
+            os.replace(final_tmp, path)
+        except OSError:
+            final_tmp.unlink(missing_ok=True)
+
+    def evict(self) -> int:
+        """Удаляет давно не использованные артефакты, пока кэш больше `artifact_cache_max_mb` (до 90% лимита)."""
+        if not self._root.exists():
+            return 0
+        entries = []
+        total = 0
+        for directory in os.scandir(self._root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self._max_bytes:
+            return 0
+        removed = 0
+        for _, size, entry_path in sorted(entries):
+            if total <= self._max_bytes * 0.9:
+                break
+            try:
+                os.unlink(entry_path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+        self.evicted += removed
+        return removed
+
+
+def get_artifact_store() -> ArtifactStore | None:
+    return ArtifactStore(settings.artifact_cache_dir) if settings.artifact_cache_dir else None
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+import json
+
+from sqlalchemy import text
+
+
+@dataclass
+class ExistingChunk:
+    id: int
+    chunk_index: int
+    fingerprint: str | None
+    meta: dict
+
+
+@dataclass
+class ChunkDiff:
+    """План переиндексации документа: какие чанки оставить, переписать, добавить и удалить."""
+
+    kept: int = 0
+    # (chunk_id, новый chunk_index, новый meta) для совпавших чанков, у которых сдвинулась позиция или meta.
+    updates: list[tuple[int, int, dict]] = field(default_factory=list)
+    # Индексы новых чанков, которым нужны эмбеддинги и вставка.
+    inserts: list[int] = field(default_factory=list)
+    deletes: list[int] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        return {
+            "kept": self.kept,
+            "updated": len(self.updates),
+            "inserted": len(self.inserts),
+            "deleted": len(self.deletes),
+        }
+
+
+class ChunkMatcher:
+    """Пошаговое сопоставление новых чанков со старыми по отпечатку текста, с сохранением id неизмененных.
+
+    Одинаковые отпечатки сопоставляются по порядку chunk_index, поэтому повторяющиеся
+    фрагменты (шапки, колонтитулы) не перемешиваются. Чанки подаются по одному в порядке
+    документа, что позволяет сверять их потоком, не собирая весь документ.
+    """
+
+    def __init__(self, existing: list[ExistingChunk]):
+        self._existing = existing
+        self._by_fingerprint: dict[str, deque[ExistingChunk]] = defaultdict(deque)
+        for chunk in sorted(existing, key=lambda item: item.chunk_index):
+            if chunk.fingerprint:
+                self._by_fingerprint[chunk.fingerprint].append(chunk)
+        self._matched: set[int] = set()
+        self.diff = ChunkDiff()
+
+    def add(self, idx: int, fingerprint: str, meta: dict) -> bool:
+        """Учитывает чанк `idx`; True — чанк новый и ему нужны эмбеддинг и вставка."""
+        candidates = self._by_fingerprint.get(fingerprint)
+        if not candidates:
+            self.diff.inserts.append(idx)
+            return True
+        chunk = candidates.popleft()
+        self._matched.add(chunk.id)
+        if chunk.chunk_index != idx or chunk.meta != meta:
+            self.diff.updates.append((chunk.id, idx, meta))
+        else:
+            self.diff.kept += 1
+        return False
+
+    def finish(self) -> ChunkDiff:
+        self.diff.deletes = [chunk.id for chunk in self._existing if chunk.id not in self._matched]
+        return self.diff
+
+
+def diff_chunks(existing: list[ExistingChunk], fingerprints: list[str], metas: list[dict]) -> ChunkDiff:
+    """План переиндексации документа целиком (см. `ChunkMatcher`)."""
+    matcher = ChunkMatcher(existing)
+    for idx, (fingerprint, meta) in enumerate(zip(fingerprints, metas)):
+        matcher.add(idx, fingerprint, meta)
+    return matcher.finish()
+
+
+def load_existing_chunks(db, document_ids: list[int]) -> dict[int, list[ExistingChunk]]:
+    rows = db.execute(
+        text("SELECT id, document_id, chunk_index, fingerprint, meta FROM chunks WHERE document_id = ANY(:ids)"),
+        {"ids": document_ids},
+    ).mappings()
+    existing: dict[int, list[ExistingChunk]] = defaultdict(list)
+    for row in rows:
+        existing[row["document_id"]].append(
+            ExistingChunk(id=row["id"], chunk_index=row["chunk_index"], fingerprint=row["fingerprint"], meta=row["meta"] or {})
+        )
+    return existing
+
+
+def apply_chunk_diff(db, diff: ChunkDiff) -> None:
+    """Удаляет исчезнувшие чанки и переписывает позиции/meta совпавших одним запросом на операцию."""
+    if diff.deletes:
+        db.execute(text("DELETE FROM chunks WHERE id = ANY(:ids)"), {"ids": diff.deletes})
+    if diff.updates:
+        db.execute(
+            text(
+                "UPDATE chunks c SET chunk_index=u.chunk_index, meta=CAST(u.meta AS jsonb) "
+                "FROM unnest(CAST(:ids AS bigint[]), CAST(:indexes AS int[]), CAST(:metas AS text[])) "
+                "AS u(id, chunk_index, meta) WHERE c.id=u.id"
+            ),
+            {
+                "ids": [chunk_id for chunk_id, _, _ in diff.updates],
+                "indexes": [idx for _, idx, _ in diff.updates],
+                "metas": [json.dumps(meta, ensure_ascii=False) for _, _, meta in diff.updates],
+            },
+        )
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from dataclasses import dataclass
+from functools import lru_cache
+import re
+from typing import Iterable, Iterator, NamedTuple
+
+from transformers import AutoTokenizer
+
+from ..config import settings
+
+_PARAGRAPH = re.compile(r"\S(?:.*?\S)?(?=\s*\n\s*\n|\s*\Z)", re.S)
+_LINE = re.compile(r"\S(?:[^\n]*\S)?")
+
+
+@dataclass
+class TextSegment:
+    """Фрагмент текста документа с привязкой к странице/листу (None — без разметки)."""
+
+    text: str
+    page_or_sheet: str | None = None
+
+
+def chunk_text(content: str, size: int, overlap: int) -> list[str]:
+    return [content[start:end] for start, end in _chunk_bounds(len(content), size, overlap)]
+
+
+def _chunk_bounds(length: int, size: int, overlap: int) -> list[tuple[int, int]]:
+    bounds = []
+    start = 0
+    while start < length:
+        bounds.append((start, min(length, start + size)))
+        start += max(1, size - overlap)
+    return bounds
+
+
+def chunk_segments(segments: list[TextSegment], size: int, overlap: int) -> tuple[list[str], list[dict]]:
+    """Режет склеенный текст сегментов как `chunk_text` и подписывает чанки страницами («3» или «3-4»)."""
+    starts = []
+    offset = 0
+    for segment in segments:
+        starts.append(offset)
+        offset += len(segment.text) + 1
+    content = "\n".join(segment.text for segment in segments)
+    chunks, metas = [], []
+    for start, end in _chunk_bounds(len(content), size, overlap):
+        chunks.append(content[start:end])
+        first = segments[bisect_right(starts, start) - 1].page_or_sheet
+        last = segments[bisect_right(starts, end - 1) - 1].page_or_sheet
+        metas.append({"page_or_sheet": _label(first, last)})
+    return chunks, metas
+
+
+def _label(first: str | None, last: str | None) -> str | None:
+    return first if first == last or last is None else (last if first is None else f"{first}-{last}")
+
+
+class _Span(NamedTuple):
+    # Смещения в тексте сегмента и число токенов без служебных.
+    start: int
+    end: int
+    tokens: int
+
+
+class TokenChunker:
+    """Чанкер по бюджету токенов BGE-M3 с сохранением структуры документа.
+
+    Текст сегмента делится на абзацы, слишком длинные абзацы — на строки, слишком длинные строки —
+    на окна по смещениям токенов с перекрытием `overlap_tokens`. Затем соседние части упаковываются
+    в чанк, пока он укладывается в `max_tokens` и `max_chars`. Чанк внутри сегмента — один срез
+    исходного текста `[start, end)`, строка создается только при выдаче. Страницы PDF склеиваются
+    в один чанк («3-4»), листы и прочие разметки — нет.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int | None = None, overlap_tokens: int | None = None, max_chars: int | None = None):
+        self._tokenizer = tokenizer
+        # Два токена на CLS/SEP, которые добавит эмбеддер.
+        self.max_tokens = min(max_tokens or settings.chunk_max_tokens, settings.embedding_max_tokens - 2)
+        self._overlap = min(settings.chunk_overlap_tokens if overlap_tokens is None else overlap_tokens, self.max_tokens // 2)
+        self._max_chars = max_chars or settings.embedding_max_chars
+        self.chunks = 0
+        self.tokens = 0
+
+    def utilization(self) -> float:
+        """Средняя доля бюджета токенов, занятая чанком."""
+        return self.tokens / (self.chunks * self.max_tokens) if self.chunks else 0.0
+
+    def iter_chunks(self, segments: Iterable[TextSegment]) -> Iterator[tuple[str, dict]]:
+        """(текст чанка, meta) по мере разбора сегментов; годится для генераторов сегментов."""
+        parts: list[tuple[TextSegment, int, int]] = []
+        tokens = chars = 0
+        previous: TextSegment | None = None
+        for segment in segments:
+            if parts and not _joinable(previous, segment):
+                yield self._emit(parts, tokens)
+                parts, tokens, chars = [], 0, 0
+            previous = segment
+            for span in self._spans(segment.text):
+                size = span.end - span.start
+                if parts and (tokens + span.tokens > self.max_tokens or chars + size > self._max_chars):
+                    yield self._emit(parts, tokens)
+                    parts, tokens, chars = [], 0, 0
+                if parts and parts[-1][0] is segment:
+                    # Соседняя часть того же сегмента: чанк расширяется до ее конца вместе с разделителями.
+                    parts[-1] = (segment, parts[-1][1], span.end)
+                else:
+                    parts.append((segment, span.start, span.end))
+                tokens += span.tokens
+                chars += size
+        if parts:
+            yield self._emit(parts, tokens)
+
+    def _emit(self, parts: list[tuple[TextSegment, int, int]], tokens: int) -> tuple[str, dict]:
+        self.chunks += 1
+        self.tokens += tokens
+        text = "\n".join(segment.text[start:end] for segment, start, end in parts)
+        return text, {"page_or_sheet": _label(parts[0][0].page_or_sheet, parts[-1][0].page_or_sheet)}
+
+    def _spans(self, text: str) -> Iterator[_Span]:
+        paragraphs = [(m.start(), m.end()) for m in _PARAGRAPH.finditer(text)]
+        for (start, end), offsets in zip(paragraphs, self._offsets(text, paragraphs)):
+            if len(offsets) <= self.max_tokens and end - start <= self._max_chars:
+                yield _Span(start, end, len(offsets))
+                continue
+            lines = [(m.start(), m.end()) for m in _LINE.finditer(text, start, end)]
+            for (line_start, line_end), line_offsets in zip(lines, self._offsets(text, lines)):
+                if len(line_offsets) <= self.max_tokens and line_end - line_start <= self._max_chars:
+                    yield _Span(line_start, line_end, len(line_offsets))
+                else:
+                    yield from self._windows(line_start, line_offsets)
+
+    def _windows(self, base: int, offsets: list[tuple[int, int]]) -> Iterator[_Span]:
+        step = self.max_tokens - self._overlap
+        for first in range(0, len(offsets), step):
+            window = offsets[first : first + self.max_tokens]
+            yield _Span(base + window[0][0], base + window[-1][1], len(window))
+            if first + self.max_tokens >= len(offsets):
+                return
+
+    def _offsets(self, text: str, spans: list[tuple[int, int]]) -> list[list[tuple[int, int]]]:
+        if not spans:
+            return []
+        encoded = self._tokenizer(
+            [text[start:end] for start, end in spans], add_special_tokens=False, return_offsets_mapping=True
+        )
+        return encoded["offset_mapping"]
+
+
+class TableChunker:
+    """Чанки таблиц: группы строк листа под бюджет токенов, каждая с названием листа и шапкой.
+
+    Первая непустая строка листа считается шапкой и повторяется в каждом чанке, поэтому строки
+    не режутся пополам и не теряют названий колонок. В meta чанка — лист и диапазон строк Excel.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int | None = None, max_chars: int | None = None, count_batch: int = 512):
+        self._tokenizer = tokenizer
+        self.max_tokens = min(max_tokens or settings.chunk_max_tokens, settings.embedding_max_tokens - 2)
+        self._max_chars = max_chars or settings.embedding_max_chars
+        self._count_batch = count_batch
+        self.chunks = 0
+        self.tokens = 0
+        self.sheets = 0
+        self.rows = 0
+
+    def iter_chunks(self, sheets: Iterable[tuple[str, Iterable[tuple[int, str]]]]) -> Iterator[tuple[str, dict]]:
+        for title, rows in sheets:
+            self.sheets += 1
+            header: tuple[int, str] | None = None
+            prefix_tokens = prefix_chars = 0
+            block: list[tuple[int, str]] = []
+            tokens = chars = 0
+            for batch in _batched(rows, self._count_batch):
+                if header is None:
+                    header, batch = batch[0], batch[1:]
+                    prefix = f"## {title}\n{header[1]}"
+                    prefix_tokens, prefix_chars = self._count([prefix])[0], len(prefix)
+                for row, row_tokens in zip(batch, self._count([text for _, text in batch])):
+                    self.rows += 1
+                    if block and (
+                        prefix_tokens + tokens + row_tokens > self.max_tokens
+                        or prefix_chars + chars + len(row[1]) > self._max_chars
+                    ):
+                        yield self._emit(title, header, block, prefix_tokens + tokens)
+                        block, tokens, chars = [], 0, 0
+                    block.append(row)
+                    tokens += row_tokens
+                    chars += len(row[1]) + 1
+            if block or header is not None:
+                # Лист из одной шапки тоже попадает в индекс.
+                yield self._emit(title, header, block, prefix_tokens + tokens)
+
+    def _emit(self, title: str, header: tuple[int, str], block: list[tuple[int, str]], tokens: int) -> tuple[str, dict]:
+        self.chunks += 1
+        self.tokens += tokens
+        first, last = (block[0][0], block[-1][0]) if block else (header[0], header[0])
+        text = "\n".join([f"## {title}", header[1], *(row for _, row in block)])
+        return text, {"page_or_sheet": title, "row_start": first, "row_end": last}
+
+    def _count(self, texts: list[str]) -> list[int]:
+        if not texts:
+            return []
+        return [len(ids) for ids in self._tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _joinable(previous: TextSegment | None, segment: TextSegment) -> bool:
+    # Страницы и блоки без разметки идут сплошным текстом; листы таблиц и прочие разметки не смешиваются.
+    if previous is None:
+        return True
+    labels = (previous.page_or_sheet, segment.page_or_sheet)
+    if labels == (None, None):
+        return True
+    return all(label is not None and label.isdigit() for label in labels)
+
+
+@lru_cache(maxsize=1)
+def get_chunk_tokenizer():
+    """Быстрый токенизатор BGE-M3, один на процесс пула парсинга."""
+    return AutoTokenizer.from_pretrained(settings.models_dir + "/bge-m3", use_fast=True)
+
+
+def iter_chunks(segments: Iterable[TextSegment]) -> Iterator[tuple[str, dict]]:
+    """Чанки документа по настройкам: по токенам (`chunk_by_tokens`) или прежняя нарезка по символам."""
+    if settings.chunk_by_tokens:
+        yield from TokenChunker(get_chunk_tokenizer()).iter_chunks(segments)
+        return
+    chunks, metas = chunk_segments(list(segments), settings.chunk_size_chars, settings.chunk_overlap_chars)
+    yield from zip(chunks, metas)
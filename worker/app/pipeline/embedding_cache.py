@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import hashlib
+import re
+import unicodedata
+
+import numpy as np
+from sqlalchemy import text
+
+from ..config import settings
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_chunk_text(content: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", content)).strip()
+
+
+def chunk_text_hash(content: str) -> str:
+    return hashlib.sha256(normalize_chunk_text(content).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evicted: int = 0
+
+    def describe(self) -> str:
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0.0
+        return f"кэш эмбеддингов: {self.hits} попаданий, {self.misses} промахов ({ratio:.0%}), вытеснено {self.evicted}"
+
+
+class EmbeddingCache:
+    """Постоянный кэш эмбеддингов в Postgres (таблица `embedding_cache`).
+
+    Ключ — идентификатор модели вместе с лимитами обрезки и sha256 нормализованного текста чанка,
+    поэтому смена модели или `embedding_max_tokens` не подмешивает старые векторы.
+    """
+
+    def __init__(self, db, model_id: str | None = None, max_rows: int | None = None):
+        self._db = db
+        self._model_id = model_id or (
+            f"{settings.embedding_model_id}:{settings.embedding_max_tokens}:{settings.embedding_max_chars}"
+        )
+        self._max_rows = settings.embedding_cache_max_rows if max_rows is None else max_rows
+        self.stats = CacheStats()
+
+    def lookup(self, texts: list[str], out: np.ndarray) -> np.ndarray:
+        """Заполняет найденные строки `out` и возвращает булеву маску попаданий."""
+        hashes = [chunk_text_hash(content) for content in texts]
+        hits = np.zeros(len(texts), dtype=bool)
+        if not hashes:
+            return hits
+        rows = self._db.execute(
+            text("SELECT text_hash, embedding FROM embedding_cache WHERE model_id=:model_id AND text_hash = ANY(:hashes)"),
+            {"model_id": self._model_id, "hashes": list(set(hashes))},
+        ).all()
+        found = {row[0]: np.frombuffer(row[1], dtype=np.float32) for row in rows}
+        for idx, text_hash in enumerate(hashes):
+            vector = found.get(text_hash)
+            if vector is not None and vector.shape[0] == out.shape[1]:
+                out[idx] = vector
+                hits[idx] = True
+        if found:
+            # last_used_at обновляем не чаще раза в сутки, чтобы аудит не переписывал весь кэш.
+            self._db.execute(
+                text(
+                    "UPDATE embedding_cache SET last_used_at=NOW() WHERE model_id=:model_id "
+                    "AND text_hash = ANY(:hashes) AND last_used_at < NOW() - INTERVAL '1 day'"
+                ),
+                {"model_id": self._model_id, "hashes": list(found)},
+            )
+        self.stats.hits += int(hits.sum())
+        self.stats.misses += len(texts) - int(hits.sum())
+        return hits
+
+    def store(self, texts: list[str], embeddings: np.ndarray) -> None:
+        if not texts:
+            return
+        vectors = np.ascontiguousarray(embeddings, dtype="<f4")
+        self._db.execute(
+            text(
+                "INSERT INTO embedding_cache (model_id, text_hash, embedding) "
+                "SELECT :model_id, h, e FROM unnest(CAST(:hashes AS text[]), CAST(:embeddings AS bytea[])) AS t(h, e) "
+                "ON CONFLICT DO NOTHING"
+            ),
+            {
+                "model_id": self._model_id,
+                "hashes": [chunk_text_hash(content) for content in texts],
+                "embeddings": [row.tobytes() for row in vectors],
+            },
+        )
+
+    def evict(self) -> None:
+        """Удаляет самые давно использованные записи сверх `embedding_cache_max_rows`."""
+        total = self._db.execute(text("SELECT count(*) FROM embedding_cache")).scalar_one()
+        excess = total - self._max_rows
+        if excess <= 0:
+            return
+        self._db.execute(
+            text(
+                "DELETE FROM embedding_cache WHERE ctid IN "
+                "(SELECT ctid FROM embedding_cache ORDER BY last_used_at LIMIT :excess)"
+            ),
+            {"excess": excess},
+        )
+        self.stats.evicted += excess
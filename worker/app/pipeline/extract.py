@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Generator, Iterator
+
+from ..clients.services import MineruClient, OCRClient
+from ..config import settings
+from ..gpu import gpu_lock
+from ..progress import set_queue_position
+from .artifacts import artifact_key, get_artifact_store
+from .chunking import (  # noqa: F401  (реэкспорт)
+    TableChunker,
+    TextSegment,
+    chunk_segments,
+    chunk_text,
+    get_chunk_tokenizer,
+    iter_chunks,
+)
+from .embedding_cache import chunk_text_hash
+from .memory import StageMemory
+from .parser_pool import ParserPool, deadline_paused
+from .parsers import PdfPage, iter_docx_blocks, iter_pdf_pages, iter_txt_blocks, iter_xlsx_blocks, iter_xlsx_sheets
+
+# Колбэк шага пайплайна: (step, progress). В процесс пула парсинга передается только picklable-колбэк (`publish_step`).
+StepCallback = Callable[[str, int], None]
+
+
+@dataclass
+class ParsedDocument:
+    """Результат разбора файла: чанки с meta и отпечатками плюс метаданные парсинга."""
+
+    chunks: list[str]
+    chunk_metas: list[dict]
+    fingerprints: list[str]
+    meta: dict
+
+
+def _page_ranges(pages: list[int]) -> list[tuple[int, int]]:
+    ranges: list[tuple[int, int]] = []
+    for page in sorted(pages):
+        if ranges and ranges[-1][1] == page - 1:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges
+
+
+def _describe_ranges(ranges: list[tuple[int, int]]) -> str:
+    return ", ".join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+
+@contextmanager
+def _gpu_slot(job_id: int | None, priority: str) -> Iterator[None]:
+    on_queue = (lambda position: set_queue_position(job_id, position)) if job_id else None
+    # Очередь за GPU и удаленный разбор не съедают таймаут файла в пуле парсинга.
+    with deadline_paused(), gpu_lock(priority, on_queue):
+        yield
+
+
+class _PdfCascade:
+    """Каскад builtin → MinerU → OCR для окна страниц; статистика копится по всему документу."""
+
+    def __init__(self, path: Path, on_step: StepCallback | None, job_id: int | None, gpu_priority: str):
+        self._path = path
+        self._on_step = on_step
+        self._job_id = job_id
+        self._gpu_priority = gpu_priority
+        self._ocr_budget = settings.max_pdf_pages_for_ocr
+        self._ocr_wanted = 0
+        self._low_quality: list[int] = []
+        self._score_sum = 0.0
+        self._by_parser: dict[str, int] = {}
+        # Сервисы, ответившие без разбивки по страницам: их ответ отброшен, страницы идут дальше по каскаду.
+        self._unpaged: set[str] = set()
+        self.pages = 0
+        self.ocr_pages_processed = 0
+
+    def run(self, pages: list[PdfPage]) -> list[TextSegment]:
+        texts = {page.number: page.text for page in pages}
+        scores = {page.number: page.score for page in pages}
+        parsers = {page.number: "builtin" for page in pages}
+        weak = [number for number, score in scores.items() if score < settings.quality_threshold_builtin]
+        if weak:
+            if self._on_step:
+                self._on_step("mineru", 35)
+            with _gpu_slot(self._job_id, self._gpu_priority):
+                results = MineruClient(settings.mineru_url, settings.parser_timeout_seconds).parse_pages(
+                    str(self._path), _page_ranges(weak)
+                )
+            if not results:
+                self._unpaged.add("MinerU")
+            _merge_pages(results, "mineru", texts, scores, parsers)
+
+            weak = [number for number in weak if scores[number] < settings.quality_threshold_mineru]
+            self._ocr_wanted += len(weak)
+            weak = weak[: self._ocr_budget]
+            self._ocr_budget -= len(weak)
+            if weak:
+                if self._on_step:
+                    self._on_step("paddleocr", 55)
+                with _gpu_slot(self._job_id, self._gpu_priority):
+                    results, processed = OCRClient(settings.ocr_url, settings.ocr_timeout_seconds).parse_pages(
+                        str(self._path), _page_ranges(weak)
+                    )
+                self.ocr_pages_processed += processed
+                if not results:
+                    self._unpaged.add("OCR")
+                _merge_pages(results, "paddleocr", texts, scores, parsers)
+                self._low_quality += [number for number in weak if scores[number] < settings.quality_threshold_ocr]
+
+        self.pages += len(texts)
+        self._score_sum += sum(scores.values())
+        for parser in parsers.values():
+            self._by_parser[parser] = self._by_parser.get(parser, 0) + 1
+        return [TextSegment(texts[number], str(number)) for number in sorted(texts)]
+
+    def describe(self) -> dict:
+        warnings = []
+        if self._ocr_wanted > settings.max_pdf_pages_for_ocr:
+            warnings.append(f"OCR ограничен {settings.max_pdf_pages_for_ocr} страницами из {self._ocr_wanted}")
+        if self._low_quality:
+            warnings.append(f"Низкое качество OCR: стр. {_describe_ranges(_page_ranges(self._low_quality))}")
+        for service in sorted(self._unpaged):
+            warnings.append(f"{service} ответил без разбивки по страницам, ответ не использован")
+        parser_used = next((name for name in ("paddleocr", "mineru") if name in self._by_parser), "builtin")
+        return {
+            "parser_used": parser_used,
+            "quality_score": self._score_sum / max(1, self.pages),
+            "warnings": warnings,
+            "ocr_pages_processed": self.ocr_pages_processed,
+            "pages": self.pages,
+            "pages_by_parser": dict(sorted(self._by_parser.items())),
+        }
+
+
+def iter_pdf_segments(
+    path: Path,
+    meta: dict,
+    on_step: StepCallback | None = None,
+    job_id: int | None = None,
+    gpu_priority: str = "background",
+) -> Iterator[TextSegment]:
+    """Постраничный каскад: builtin по всем страницам, MinerU и OCR — только для слабых диапазонов.
+
+    Страницы идут окнами по `stream_pdf_window_pages`, поэтому PDF на тысячи страниц не держится
+    в памяти целиком. Под GPU lock уходят лишь страницы окна ниже порога предыдущей ступени; пока job
+    ждет слот GPU, его позиция в очереди видна в живом прогрессе job (Redis). `meta` заполняется по мере
+    разбора и окончательна после исчерпания генератора.
+    """
+    cascade = _PdfCascade(path, on_step, job_id, gpu_priority)
+    window: list[PdfPage] = []
+    for page in iter_pdf_pages(path):
+        window.append(page)
+        if len(window) >= settings.stream_pdf_window_pages:
+            yield from cascade.run(window)
+            window = []
+            meta.update(cascade.describe())
+    if window:
+        yield from cascade.run(window)
+    meta.update(cascade.describe())
+
+
+def extract_pdf(
+    path: Path, on_step: StepCallback | None = None, job_id: int | None = None, gpu_priority: str = "background"
+) -> tuple[list[TextSegment], dict]:
+    meta: dict = {}
+    segments = list(iter_pdf_segments(path, meta, on_step, job_id, gpu_priority))
+    return segments, meta
+
+
+def _merge_pages(results, parser: str, texts: dict[int, str], scores: dict[int, float], parsers: dict[int, str]) -> None:
+    for number, (text, score) in results.items():
+        if number in texts and score > scores[number]:
+            texts[number], scores[number], parsers[number] = text, score, parser
+
+
+def _iter_builtin(blocks: Iterator[tuple[str | None, str]], meta: dict) -> Iterator[TextSegment]:
+    chars = 0
+    meta.update(parser_used="builtin", quality_score=0.0, warnings=[], ocr_pages_processed=0)
+    for label, block in blocks:
+        chars += len(block.strip())
+        yield TextSegment(block, label)
+        meta["quality_score"] = min(1.0, chars / 5000)
+
+
+def iter_segments(
+    path: Path,
+    meta: dict,
+    on_step: StepCallback | None = None,
+    job_id: int | None = None,
+    gpu_priority: str = "background",
+) -> Iterator[TextSegment]:
+    """Сегменты документа по мере чтения файла; `meta` парсинга окончательна после исчерпания генератора.
+
+    Сначала проверяется кэш артефактов по хэшу содержимого: неизмененный или повторно загруженный
+    файл не проходит парсеры и OCR заново (`meta["artifact"]` — hit | miss).
+    """
+    store = get_artifact_store()
+    if store is None:
+        return _parse_segments(path, meta, on_step, job_id, gpu_priority)
+    key = artifact_key(path)
+    cached = store.get(key)
+    if cached is not None:
+        cached_meta, segments = cached
+        meta.update(cached_meta, artifact="hit")
+        return segments
+    meta["artifact"] = "miss"
+    return store.record(key, _parse_segments(path, meta, on_step, job_id, gpu_priority), meta)
+
+
+def _parse_segments(
+    path: Path, meta: dict, on_step: StepCallback | None, job_id: int | None, gpu_priority: str
+) -> Iterator[TextSegment]:
+    ext = path.suffix.lower()
+    block_chars = settings.stream_block_chars
+    if ext == ".pdf":
+        return iter_pdf_segments(path, meta, on_step, job_id, gpu_priority)
+    if ext == ".txt":
+        return _iter_builtin(((None, block) for block in iter_txt_blocks(path, block_chars)), meta)
+    if ext == ".docx":
+        return _iter_builtin(((None, block) for block in iter_docx_blocks(path, block_chars)), meta)
+    if ext == ".xlsx":
+        return _iter_builtin(iter_xlsx_blocks(path, block_chars), meta)
+    raise ValueError("Расширение не поддерживается")
+
+
+def extract_content(
+    path: Path, on_step: StepCallback | None = None, job_id: int | None = None, gpu_priority: str = "background"
+) -> tuple[list[TextSegment], dict]:
+    meta: dict = {}
+    segments = list(iter_segments(path, meta, on_step, job_id, gpu_priority))
+    return segments, meta
+
+
+def _iter_table_chunks(path: Path, meta: dict) -> Iterator[tuple[str, dict]]:
+    """Табличный режим xlsx: чанки — группы строк с шапкой листа (`TableChunker`)."""
+    chunker = TableChunker(get_chunk_tokenizer())
+    chars = 0
+    meta.update(parser_used="builtin", quality_score=0.0, warnings=[], ocr_pages_processed=0)
+    for chunk, chunk_meta in chunker.iter_chunks(iter_xlsx_sheets(path)):
+        chars += len(chunk)
+        meta.update(quality_score=min(1.0, chars / 5000), sheets=chunker.sheets, rows=chunker.rows)
+        yield chunk, chunk_meta
+
+
+def stream_document(
+    path: Path,
+    on_step: StepCallback | None = None,
+    job_id: int | None = None,
+    gpu_priority: str = "background",
+    memory: StageMemory | None = None,
+) -> tuple[Iterator[tuple[str, dict]], dict]:
+    """Поток (чанк, meta чанка) для больших файлов: в памяти только текущий блок и незакрытый чанк.
+
+    Вторым элементом возвращается meta парсинга, которая заполняется по ходу потока.
+    """
+    meta: dict = {}
+    if path.suffix.lower() == ".xlsx" and settings.chunk_by_tokens and settings.xlsx_tabular:
+        chunks = _iter_table_chunks(path, meta)
+    else:
+        segments = iter_segments(path, meta, on_step, job_id, gpu_priority)
+        if memory is not None:
+            segments = memory.track("parse", segments)
+        chunks = iter_chunks(segments)
+    if memory is not None:
+        chunks = memory.track("chunk", chunks)
+    return chunks, meta
+
+
+def _stream_chunks(
+    path: Path, on_step: StepCallback | None, job_id: int | None, gpu_priority: str
+) -> Generator[tuple[str, dict], None, dict]:
+    """Тело потоковой задачи пула: чанки по одному, meta парсинга — значением `return`."""
+    chunks, meta = stream_document(path, on_step, job_id, gpu_priority)
+    yield from chunks
+    return meta
+
+
+def stream_document_pooled(
+    pool: ParserPool,
+    path: Path,
+    on_step: StepCallback | None = None,
+    job_id: int | None = None,
+    gpu_priority: str = "background",
+    memory: StageMemory | None = None,
+) -> tuple[Iterator[tuple[str, dict]], dict]:
+    """`stream_document` в процессе пула: таймаут, RLIMIT_AS и изоляция сбоев для больших файлов.
+
+    Чанки приходят порциями по `stream_chunk_batch`, процесс ждет, пока задача их проиндексирует.
+    meta парсинга заполняется после исчерпания потока; сбой процесса — `ParseFailure` из итерации.
+    """
+    meta: dict = {}
+
+    def chunks() -> Iterator[tuple[str, dict]]:
+        stream = pool.stream(_stream_chunks, path, on_step, job_id, gpu_priority)
+        yield from stream
+        meta.update(stream.result())
+
+    items = chunks()
+    if memory is not None:
+        items = memory.track("chunk", items)
+    return items, meta
+
+
+def parse_document(
+    path: Path, on_step: StepCallback | None = None, job_id: int | None = None, gpu_priority: str = "background"
+) -> ParsedDocument:
+    """Извлекает текст и режет его на чанки; функция верхнего уровня, чтобы запускаться в пуле процессов."""
+    chunk_stream, meta = stream_document(path, on_step, job_id, gpu_priority)
+    chunks, chunk_metas = [], []
+    for chunk, chunk_meta in chunk_stream:
+        chunks.append(chunk)
+        chunk_metas.append(chunk_meta)
+    return ParsedDocument(
+        chunks=chunks,
+        chunk_metas=chunk_metas,
+        fingerprints=[chunk_text_hash(chunk) for chunk in chunks],
+        meta=meta,
+    )
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import json
+from typing import Iterable
+
+from sqlalchemy import text
+
+from ..config import settings
+from ..embeddings import EmbeddingScheduler, get_embedder
+from .chunk_diff import ChunkDiff, ChunkMatcher, apply_chunk_diff, diff_chunks, load_existing_chunks
+from .embedding_cache import EmbeddingCache, chunk_text_hash
+from .extract import ParsedDocument
+from .memory import StageMemory
+from .sink import ChunkSink
+
+
+@dataclass
+class PendingDocument:
+    """Документ, разобранный и нарезанный на чанки, но еще не проиндексированный."""
+
+    document_id: int
+    parsed: ParsedDocument
+
+
+def new_scheduler(db) -> EmbeddingScheduler:
+    cache = EmbeddingCache(db) if settings.embedding_cache_enabled else None
+    return EmbeddingScheduler(get_embedder(), cache=cache)
+
+
+def finish_scheduler(scheduler: EmbeddingScheduler) -> str:
+    """Подрезает кэш эмбеддингов и возвращает сводку для сообщения job."""
+    if scheduler.cache is not None:
+        scheduler.cache.evict()
+    return scheduler.describe()
+
+
+def index_documents(db, scheduler: EmbeddingScheduler, pending: list[PendingDocument]) -> None:
+    """Переиндексирует документы по диффу чанков; эмбеддинги новых чанков считаются общими батчами.
+
+    Неизмененные чанки сохраняют id и эмбеддинги, меняются только вставленные/удаленные строки.
+    Все правки документа идут в одной транзакции, поэтому поиск видит либо старую, либо новую версию.
+    """
+    existing = load_existing_chunks(db, [doc.document_id for doc in pending])
+    diffs = [
+        diff_chunks(existing.get(doc.document_id, []), doc.parsed.fingerprints, doc.parsed.chunk_metas)
+        for doc in pending
+    ]
+    for doc, diff in zip(pending, diffs):
+        scheduler.submit([doc.parsed.chunks[idx] for idx in diff.inserts])
+    for doc, diff, embeddings in zip(pending, diffs, scheduler.drain()):
+        parsed = doc.parsed
+        apply_chunk_diff(db, diff)
+        sink = ChunkSink(db, doc.document_id)
+        sink.write_batch(
+            diff.inserts,
+            [parsed.chunks[idx] for idx in diff.inserts],
+            embeddings,
+            [parsed.chunk_metas[idx] for idx in diff.inserts],
+            [parsed.fingerprints[idx] for idx in diff.inserts],
+        )
+        sink.close()
+        finalize_document(db, doc.document_id, {**parsed.meta, "reindex": diff.summary()})
+
+
+def index_document_stream(
+    db,
+    scheduler: EmbeddingScheduler,
+    document_id: int,
+    chunks: Iterable[tuple[str, dict]],
+    parse_meta: dict,
+    memory: StageMemory | None = None,
+) -> None:
+    """Потоковая переиндексация одного документа с фиксированным потолком памяти.
+
+    Чанки сверяются с существующими по мере поступления и уходят на эмбеддинг и COPY порциями
+    по `stream_chunk_batch`; в памяти только текущая порция и отпечатки старых чанков. Исчезнувшие
+    чанки удаляются в конце, вся запись — в транзакции `db`, как и в `index_documents`.
+    """
+    memory = memory or StageMemory()
+    matcher = ChunkMatcher(load_existing_chunks(db, [document_id]).get(document_id, []))
+    sink = ChunkSink(db, document_id)
+    applied = 0
+    batch: list[tuple[int, str, dict, str]] = []
+    for idx, (content, meta) in enumerate(chunks):
+        fingerprint = chunk_text_hash(content)
+        if matcher.add(idx, fingerprint, meta):
+            batch.append((idx, content, meta, fingerprint))
+        if len(batch) >= settings.stream_chunk_batch:
+            _write_stream_batch(sink, scheduler, batch, memory)
+            batch = []
+        if len(matcher.diff.updates) - applied >= settings.stream_chunk_batch:
+            apply_chunk_diff(db, ChunkDiff(updates=matcher.diff.updates[applied:]))
+            applied = len(matcher.diff.updates)
+    if batch:
+        _write_stream_batch(sink, scheduler, batch, memory)
+    with memory.stage("write"):
+        sink.close()
+        diff = matcher.finish()
+        apply_chunk_diff(db, ChunkDiff(updates=diff.updates[applied:], deletes=diff.deletes))
+    finalize_document(db, document_id, {**parse_meta, "reindex": diff.summary()})
+
+
+def _write_stream_batch(sink: ChunkSink, scheduler: EmbeddingScheduler, batch: list, memory: StageMemory) -> None:
+    indexes, contents, metas, fingerprints = zip(*batch)
+    with memory.stage("embed"):
+        embeddings = scheduler.embed(list(contents))
+    with memory.stage("write"):
+        sink.write_batch(indexes, contents, embeddings, metas, fingerprints)
+
+
+def finalize_document(db, document_id: int, parse_meta: dict) -> None:
+    existing_meta = db.execute(text("SELECT meta FROM documents WHERE id=:id"), {"id": document_id}).scalar()
+    meta = existing_meta or {}
+    meta.update(parse_meta)
+    db.execute(
+        text("UPDATE documents SET status='ready', meta=CAST(:meta AS jsonb) WHERE id=:id"),
+        {"id": document_id, "meta": json.dumps(meta, ensure_ascii=False)},
+    )
+
+
+def mark_document_failed(db, document_id: int, error: str, outcome: str = "error") -> None:
+    """`outcome` — итог разбора: error (исключение парсера) или timeout | oom | crash из пула парсинга."""
+    db.execute(
+        text("UPDATE documents SET status='failed', meta=meta || CAST(:meta AS jsonb) WHERE id=:id"),
+        {"id": document_id, "meta": json.dumps({"last_error": error[:500], "parse_outcome": outcome}, ensure_ascii=False)},
+    )
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from typing import NamedTuple
+
+from sqlalchemy import text
+
+from .scanner import ScanCandidate
+
+# Итоги разбора, которые повторятся на том же файле: такой документ ждет изменения файла, а не каждого скана.
+DETERMINISTIC_FAILURES = frozenset({"timeout", "oom", "crash"})
+
+
+class ManifestEntry(NamedTuple):
+    document_id: int
+    mtime: str | None
+    size_bytes: int | None
+    inode: int | None
+    deleted: bool
+    # documents.status: файл, не дошедший до ready (queued, failed с временной ошибкой), индексируется заново.
+    status: str = "ready"
+    # documents.meta.parse_outcome последнего сбоя (см. `mark_document_failed`).
+    parse_outcome: str | None = None
+
+
+class SourceManifest:
+    """Снимок состояния файлов источника из documents: relative_path → (id, mtime, size, inode, status).
+
+    Загружается одним запросом, дальше скан сверяет файлы в памяти. Встреченные пути
+    забираются из манифеста через `take`, поэтому после полного обхода в нем остаются
+    только исчезнувшие с NAS файлы.
+    """
+
+    def __init__(self, entries: dict[str, ManifestEntry]):
+        self._entries = entries
+
+    @classmethod
+    def load(cls, db, source_id: int) -> SourceManifest:
+        rows = db.execute(
+            text(
+                "SELECT id, relative_path, meta->>'mtime' AS mtime, "
+                "CAST(meta->>'size_bytes' AS bigint) AS size_bytes, CAST(meta->>'inode' AS bigint) AS inode, "
+                "deleted_at IS NOT NULL AS deleted, status, meta->>'parse_outcome' AS parse_outcome "
+                "FROM documents WHERE source_id=:source_id AND scope='nas'"
+            ),
+            {"source_id": source_id},
+        )
+        return cls({row[1]: ManifestEntry(row[0], row[2], row[3], row[4], row[5], row[6], row[7]) for row in rows})
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def take(self, relative_path: str) -> ManifestEntry | None:
+        return self._entries.pop(relative_path, None)
+
+    def missing(self) -> list[int]:
+        """id документов, чьих файлов не было при обходе (еще не помеченных удаленными)."""
+        return [entry.document_id for entry in self._entries.values() if not entry.deleted]
+
+
+def is_unchanged(entry: ManifestEntry | None, candidate: ScanCandidate) -> bool:
+    if entry is None or entry.deleted:
+        return False
+    if entry.status != "ready" and not (entry.status == "failed" and entry.parse_outcome in DETERMINISTIC_FAILURES):
+        return False
+    if entry.mtime != candidate.mtime or entry.size_bytes != candidate.size_bytes:
+        return False
+    # Старые записи без inode сравниваются только по mtime/size.
+    return entry.inode is None or candidate.inode is None or entry.inode == candidate.inode
+
+
+def tombstone_documents(db, document_ids: list[int]) -> None:
+    """Помечает удаленными документы исчезнувших файлов; поиск их больше не видит, чанки остаются до возврата файла."""
+    if document_ids:
+        db.execute(
+            text("UPDATE documents SET status='deleted', deleted_at=NOW() WHERE id = ANY(:ids) AND deleted_at IS NULL"),
+            {"ids": document_ids},
+        )
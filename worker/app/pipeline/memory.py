@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import os
+import resource
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_BYTES_IN_MB = 1024 * 1024
+
+
+def current_rss_mb() -> float:
+    """Текущий RSS процесса; без /proc — пиковый за всю жизнь процесса."""
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / _BYTES_IN_MB
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageMemory:
+    """Пиковый RSS по стадиям индексации (parse, chunk, embed, write), MB — для jobs.meta.
+
+    Стадии потока чередуются, поэтому RSS снимается после каждого элемента или вызова стадии
+    и приписывается ей; максимум по стадиям показывает, какая из них поднимает потолок памяти.
+    """
+
+    def __init__(self):
+        self.peaks: dict[str, float] = {}
+
+    def sample(self, stage: str) -> None:
+        rss = current_rss_mb()
+        if rss > self.peaks.get(stage, 0.0):
+            self.peaks[stage] = rss
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        try:
+            yield
+        finally:
+            self.sample(name)
+
+    def track(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        for item in items:
+            self.sample(name)
+            yield item
+
+    def describe(self) -> dict:
+        return {
+            "peak_rss_mb": {stage: round(value, 1) for stage, value in self.peaks.items()},
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
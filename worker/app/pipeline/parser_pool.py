@@ -0,0 +1,386 @@
+from __future__ import annotations
+
+import atexit
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+import os
+import queue
+import resource
+import signal
+import threading
+import time
+from typing import Callable, Generator, Iterator
+
+import billiard
+from billiard.connection import wait
+
+from ..config import settings
+
+_BYTES_IN_MB = 1024 * 1024
+# Соединение с родителем в процессе пула; None — код выполняется вне пула.
+_WORKER_CONN = None
+
+
+class ParseFailure(RuntimeError):
+    """Разбор файла не завершился штатно; `outcome` — timeout | oom | crash (пишется в documents.meta)."""
+
+    def __init__(self, outcome: str, message: str):
+        super().__init__(message)
+        self.outcome = outcome
+
+
+@contextmanager
+def deadline_paused() -> Iterator[None]:
+    """Время внутри блока не входит в таймаут файла: ожидание очереди GPU и работа MinerU/OCR.
+
+    Таймаут пула ограничивает CPU-разбор, а не очередь за чужими задачами; удаленные вызовы
+    ограничены собственными таймаутами HTTP-клиентов. Вне процесса пула ничего не делает.
+    """
+    conn = _WORKER_CONN
+    if conn is None:
+        yield
+        return
+    conn.send(("pause", None))
+    try:
+        yield
+    finally:
+        conn.send(("resume", None))
+
+
+def _send_items(conn, batch: list) -> bool:
+    """Отдает порцию потока родителю и ждет, пока он ее разберет; False — поток больше не нужен.
+
+    Ожидание родителя (эмбеддинги, запись в БД) в таймаут файла не входит: родитель ставит его
+    на паузу при получении порции, а "resume" уходит после ответа.
+    """
+    conn.send(("item", batch))
+    more = conn.recv()
+    conn.send(("resume", None))
+    return more
+
+
+def _run_stream(conn, items: Generator, batch_size: int):
+    batch: list = []
+    while True:
+        try:
+            batch.append(next(items))
+        except StopIteration as stop:
+            if batch:
+                _send_items(conn, batch)
+            return stop.value
+        if len(batch) >= batch_size:
+            if not _send_items(conn, batch):
+                items.close()
+                return None
+            batch = []
+
+
+def _worker_main(conn, memory_mb: int) -> None:
+    global _WORKER_CONN
+    _WORKER_CONN = conn
+    if memory_mb:
+        limit = memory_mb * _BYTES_IN_MB
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    while True:
+        task = conn.recv()
+        if task is None:
+            return
+        # batch_size > 0 — потоковая задача: fn возвращает генератор, элементы идут родителю порциями.
+        fn, args, batch_size = task
+        try:
+            result = ("ok", _run_stream(conn, fn(*args), batch_size) if batch_size else fn(*args))
+        except MemoryError:
+            result = ("oom", None)
+        except Exception as exc:
+            result = ("error", exc)
+        try:
+            conn.send(result)
+        except Exception as exc:
+            conn.send(("error", RuntimeError(f"Результат парсера не передан: {exc}")))
+        if result[0] == "oom":
+            # После MemoryError состояние процесса ненадежно: родитель поднимет новый.
+            return
+
+
+def _reply(conn, more: bool) -> None:
+    try:
+        conn.send(more)
+    except (OSError, ValueError):
+        # Процесс уже убит (таймаут, сбой): итог придет через future.
+        pass
+
+
+class PoolStream:
+    """Поток элементов из процесса пула (`ParserPool.stream`) с обратным давлением.
+
+    Процесс отдает порцию и ждет, пока потребитель ее разберет, поэтому в памяти не больше
+    порции с каждой стороны. Таймаут, RLIMIT_AS и изоляция сбоев — как у обычной задачи пула;
+    сбой приходит исключением из итерации. `result()` — значение `return` генератора после исчерпания.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.future: Future = Future()
+        self._items: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._waiting = False
+        self._closed = False
+        # Порции кладет диспетчер до итога задачи, поэтому маркер конца всегда приходит последним.
+        self.future.add_done_callback(lambda _: self._items.put(None))
+
+    def __iter__(self) -> Iterator:
+        try:
+            while True:
+                batch = self._items.get()
+                if batch is None:
+                    self.future.result()
+                    return
+                yield from batch
+                self._answer(True)
+        finally:
+            with self._lock:
+                self._closed = True
+            self._answer(False)
+
+    def result(self):
+        return self.future.result()
+
+    def _offer(self, conn, batch: list) -> None:
+        # Поток диспетчера: на каждую порцию процесс получает ровно один ответ.
+        with self._lock:
+            if self._closed:
+                _reply(conn, False)
+                return
+            self._conn, self._waiting = conn, True
+            self._items.put(batch)
+
+    def _answer(self, more: bool) -> None:
+        with self._lock:
+            if self._waiting:
+                self._waiting = False
+                _reply(self._conn, more)
+
+
+@dataclass
+class _Slot:
+    process: billiard.Process
+    conn: object
+    future: Future | None = None
+    stream: PoolStream | None = None
+    deadline: float = 0.0
+    # Момент паузы таймаута (deadline_paused, ожидание потребителя потока); None — таймаут идет.
+    paused: float | None = None
+    done: int = 0
+
+
+class ParserPool:
+    """Теплый пул процессов парсинга с изоляцией сбоев.
+
+    Каждый процесс берет по одному файлу. Для задачи действует таймаут по wall-clock: зависший
+    процесс убивается и заменяется, задача завершается `ParseFailure("timeout")`. Адресное
+    пространство процесса ограничено RLIMIT_AS (`MemoryError` → "oom"), падение процесса
+    (segfault, OOM killer) дает "crash"/"oom" только этой задаче; умерший в простое процесс
+    заменяется перед выдачей задачи. Ожидание GPU и вызовы MinerU/OCR в таймаут не входят
+    (`deadline_paused`). После `max_tasks` файлов процесс
+    перезапускается, чтобы не копить фрагментацию памяти парсеров. Большие файлы идут через
+    `stream`: чанки возвращаются порциями, пока задача их индексирует, с теми же гарантиями.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        timeout: float | None = None,
+        memory_mb: int | None = None,
+        max_tasks: int | None = None,
+    ):
+        # forkserver: процессы не наследуют потоки и соединения с БД родителя. Контекст billiard, а не
+        # multiprocessing: задачи Celery prefork идут в daemon-процессах, которым stdlib не дает заводить детей.
+        self._context = billiard.get_context("forkserver")
+        self._timeout = timeout or settings.parse_file_timeout_seconds
+        self._memory_mb = settings.parse_memory_mb if memory_mb is None else memory_mb
+        self._max_tasks = max_tasks or settings.parse_max_tasks_per_worker
+        self._tasks: queue.SimpleQueue = queue.SimpleQueue()
+        self._slots = [self._spawn() for _ in range(workers or settings.scan_parse_workers or os.cpu_count() or 1)]
+        self._stop = threading.Event()
+        self.outcomes: dict[str, int] = {}
+        self._thread = threading.Thread(target=self._loop, name="parser-pool", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        future: Future = Future()
+        self._put(future, fn, args, None)
+        return future
+
+    def stream(self, fn: Callable[..., Generator], *args, batch_size: int | None = None) -> PoolStream:
+        """Запускает генератор `fn(*args)` в процессе пула; элементы приходят порциями по `batch_size`."""
+        stream = PoolStream(batch_size or settings.stream_chunk_batch)
+        self._put(stream.future, fn, args, stream)
+        return stream
+
+    def _put(self, future: Future, fn: Callable, args: tuple, stream: PoolStream | None) -> None:
+        if self._stop.is_set() or not self._thread.is_alive():
+            raise RuntimeError("Пул парсинга остановлен")
+        self._tasks.put((future, fn, args, stream))
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        for slot in self._slots:
+            if slot.future is not None:
+                slot.future.set_exception(RuntimeError("Пул парсинга остановлен"))
+            self._retire(slot, graceful=slot.future is None)
+        while True:
+            try:
+                future, _, _, _ = self._tasks.get_nowait()
+            except queue.Empty:
+                break
+            future.cancel()
+
+    def _spawn(self) -> _Slot:
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child, self._memory_mb), name="parser", daemon=True)
+        process.start()
+        child.close()
+        return _Slot(process=process, conn=parent)
+
+    def _retire(self, slot: _Slot, graceful: bool) -> None:
+        if graceful and slot.process.is_alive():
+            try:
+                slot.conn.send(None)
+            except OSError:
+                pass
+            slot.process.join(timeout=5)
+        if slot.process.is_alive():
+            # У процессов billiard нет kill(): SIGKILL шлем сами.
+            try:
+                os.kill(slot.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            slot.process.join()
+        slot.conn.close()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._step()
+            except Exception as exc:
+                # Поток диспетчера не должен умирать молча: иначе ни одна следующая задача не завершится.
+                self._recover(exc)
+
+    def _recover(self, exc: Exception) -> None:
+        for idx, slot in enumerate(self._slots):
+            try:
+                if slot.future is not None:
+                    self._fail(idx, slot, ParseFailure("crash", f"Сбой диспетчера пула парсинга: {exc}"))
+                elif not slot.process.is_alive():
+                    self._replace(idx, slot)
+            except Exception:
+                time.sleep(0.5)
+
+    def _step(self) -> None:
+        self._dispatch()
+        busy = [slot for slot in self._slots if slot.future is not None]
+        if not busy:
+            time.sleep(0.05)
+            return
+        ready = set(wait([slot.conn for slot in busy] + [slot.process.sentinel for slot in busy], timeout=0.2))
+        now = time.monotonic()
+        for idx, slot in enumerate(self._slots):
+            if slot.future is None:
+                continue
+            if slot.conn in ready:
+                self._receive(idx, slot)
+            elif slot.process.sentinel in ready:
+                code = slot.process.exitcode
+                # SIGKILL не от нас — почти всегда OOM killer ядра.
+                outcome = "oom" if code == -signal.SIGKILL else "crash"
+                self._fail(idx, slot, ParseFailure(outcome, f"Процесс парсера завершился с кодом {code}"))
+            elif slot.paused is None and now > slot.deadline:
+                self._fail(idx, slot, ParseFailure("timeout", f"Парсинг дольше {self._timeout:.0f} s"))
+
+    def _dispatch(self) -> None:
+        for idx, slot in enumerate(self._slots):
+            if slot.future is not None:
+                continue
+            if not slot.process.is_alive():
+                # Простаивающий процесс убит извне (OOM killer, kill): задачу получит замена.
+                slot = self._replace(idx, slot)
+            try:
+                future, fn, args, stream = self._tasks.get_nowait()
+            except queue.Empty:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            slot.future, slot.stream = future, stream
+            slot.deadline, slot.paused = time.monotonic() + self._timeout, None
+            try:
+                slot.conn.send((fn, args, stream.batch_size if stream else 0))
+            except OSError as exc:
+                self._fail(idx, slot, ParseFailure("crash", f"Процесс парсера недоступен: {exc}"))
+            except Exception as exc:
+                # Задачу не удалось сериализовать: процесс цел, ошибка — только этой задаче.
+                slot.future, slot.stream = None, None
+                self._count("error")
+                future.set_exception(exc)
+
+    def _receive(self, idx: int, slot: _Slot) -> None:
+        try:
+            status, payload = slot.conn.recv()
+        except (EOFError, OSError):
+            self._fail(idx, slot, ParseFailure("crash", "Процесс парсера оборвал соединение"))
+            return
+        if status == "pause":
+            slot.paused = time.monotonic()
+            return
+        if status == "resume":
+            if slot.paused is not None:
+                slot.deadline += time.monotonic() - slot.paused
+            slot.paused = None
+            return
+        if status == "item":
+            slot.paused = time.monotonic()
+            slot.stream._offer(slot.conn, payload)
+            return
+        if status == "oom":
+            self._fail(idx, slot, ParseFailure("oom", f"Парсер превысил {self._memory_mb} MB"))
+            return
+        future, slot.future, slot.stream = slot.future, None, None
+        self._count("ok" if status == "ok" else "error")
+        if status == "ok":
+            future.set_result(payload)
+        else:
+            future.set_exception(payload)
+        slot.done += 1
+        if slot.done >= self._max_tasks:
+            self._retire(slot, graceful=True)
+            self._slots[idx] = self._spawn()
+
+    def _fail(self, idx: int, slot: _Slot, error: ParseFailure) -> None:
+        future, slot.future, slot.stream = slot.future, None, None
+        self._count(error.outcome)
+        future.set_exception(error)
+        self._replace(idx, slot)
+
+    def _replace(self, idx: int, slot: _Slot) -> _Slot:
+        self._retire(slot, graceful=False)
+        self._slots[idx] = self._spawn()
+        return self._slots[idx]
+
+    def _count(self, outcome: str) -> None:
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+
+_POOL: ParserPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_parser_pool() -> ParserPool:
+    """Общий пул процесса воркера: процессы остаются теплыми между задачами Celery."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ParserPool()
+            atexit.register(_POOL.shutdown)
+    return _POOL
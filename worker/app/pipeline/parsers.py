@@ -1,40 +1,98 @@
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Iterator
 
 from docx import Document as DocxDocument
 from openpyxl import load_workbook
 from pypdf import PdfReader
 
 
-def parse_txt(path: Path) -> tuple[str, float]:
-    content = path.read_text(encoding="utf-8", errors="ignore")
-    score = min(1.0, len(content.strip()) / 5000)
-    return content, score
+def _blocks(pieces: Iterator[str], block_chars: int, separator: str = "\n") -> Iterator[str]:
+    """Склеивает куски текста в блоки около `block_chars` символов, не держа в памяти весь документ."""
+    block: list[str] = []
+    size = 0
+    for piece in pieces:
+        block.append(piece)
+        size += len(piece) + len(separator)
+        if size >= block_chars:
+            yield separator.join(block)
+            block, size = [], 0
+    if block:
+        yield separator.join(block)
 
 
-def parse_docx(path: Path) -> tuple[str, float]:
+def iter_txt_blocks(path: Path, block_chars: int) -> Iterator[str]:
+    """Текстовый файл блоками по границам абзацев (пустых строк), читается построчно."""
+    with path.open(encoding="utf-8", errors="ignore") as handle:
+        block: list[str] = []
+        size = 0
+        for line in handle:
+            block.append(line)
+            size += len(line)
+            # Режем на пустой строке, а если абзацев нет — на любой строке после двойного размера блока.
+            if (size >= block_chars and not line.strip()) or size >= 2 * block_chars:
+                yield "".join(block)
+                block, size = [], 0
+        if block:
+            yield "".join(block)
+
+
+def iter_docx_blocks(path: Path, block_chars: int) -> Iterator[str]:
     doc = DocxDocument(path)
-    content = "\n".join(par.text for par in doc.paragraphs if par.text)
-    score = min(1.0, len(content.strip()) / 5000)
-    return content, score
+    yield from _blocks((par.text for par in doc.paragraphs if par.text), block_chars)
 
 
-def parse_xlsx(path: Path) -> tuple[str, float]:
+def iter_xlsx_blocks(path: Path, block_chars: int) -> Iterator[tuple[str, str]]:
+    """(лист, блок строк): read_only-книга отдает строки лениво, лист целиком в памяти не собирается."""
     wb = load_workbook(path, read_only=True, data_only=True)
-    blocks = []
-    for ws in wb.worksheets:
-        rows = []
-        for row in ws.iter_rows(values_only=True):
-            rows.append(" | ".join([str(v) if v is not None else "" for v in row]))
-        blocks.append(f"## sheet: {ws.title}\n" + "\n".join(rows))
-    content = "\n\n".join(blocks)
-    score = min(1.0, len(content.strip()) / 5000)
-    return content, score
-
-
-def parse_pdf_builtin(path: Path) -> tuple[str, float]:
+    try:
+        for ws in wb.worksheets:
+            rows = (" | ".join([str(v) if v is not None else "" for v in row]) for row in ws.iter_rows(values_only=True))
+            for idx, block in enumerate(_blocks(rows, block_chars)):
+                yield ws.title, f"## sheet: {ws.title}\n{block}" if idx == 0 else block
+    finally:
+        wb.close()
+
+
+def iter_xlsx_sheets(path: Path) -> Iterator[tuple[str, Iterator[tuple[int, str]]]]:
+    """(лист, строки) для табличного режима: строки — (номер строки в Excel, ячейки через « | »).
+
+    Пустые столбцы до начала данных листа, пустые ячейки в конце строки и пустые строки отбрасываются;
+    строки читаются лениво, в один проход по листу.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            yield ws.title, _sheet_rows(ws)
+    finally:
+        wb.close()
+
+
+def _sheet_rows(ws) -> Iterator[tuple[int, str]]:
+    # read_only-лист без min_row отдает строки с первой, поэтому номер строки — с 1; пустые столбцы
+    # слева отсекает min_col из размеров листа (<dimension>), остальное режется в том же проходе.
+    for number, row in enumerate(ws.iter_rows(min_col=ws.min_column or 1, values_only=True), start=1):
+        cells = ["" if value is None else str(value).strip() for value in row]
+        while cells and not cells[-1]:
+            cells.pop()
+        if cells:
+            yield number, " | ".join(cells)
+
+
+# Страница с таким числом символов текстового слоя считается полностью распознанной.
+PDF_PAGE_FULL_CHARS = 200
+
+
+@dataclass
+class PdfPage:
+    number: int
+    text: str
+    score: float
+
+
+def iter_pdf_pages(path: Path) -> Iterator[PdfPage]:
+    """Текстовый слой PDF постранично: pypdf разбирает страницу только при обращении к ней."""
     reader = PdfReader(path)
-    pages = [page.extract_text() or "" for page in reader.pages]
-    content = "\n".join(pages)
-    non_empty = sum(1 for p in pages if p.strip())
-    score = non_empty / max(1, len(pages))
-    return content, score
+    for idx, page in enumerate(reader.pages):
+        text = page.extract_text() or ""
+        yield PdfPage(number=idx + 1, text=text, score=min(1.0, len(text.strip()) / PDF_PAGE_FULL_CHARS))
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass
+from datetime import datetime
+from fnmatch import fnmatch
+import os
+from pathlib import Path
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator
+
+from ..config import settings
+from ..embeddings import EmbeddingScheduler
+from .extract import parse_document, stream_document_pooled
+from .indexer import PendingDocument, index_document_stream, index_documents, mark_document_failed
+from .memory import StageMemory
+from .parser_pool import ParseFailure, ParserPool, get_parser_pool
+
+_BYTES_IN_MB = 1024 * 1024
+_WALK_DONE = object()
+
+
+@dataclass
+class ScanCandidate:
+    path: Path
+    relative_path: str
+    size_bytes: int
+    mtime: str
+    inode: int | None = None
+    # Заполнен, если строка documents уже создана (подзадача индексации батча).
+    document_id: int | None = None
+
+
+@dataclass
+class ScanStats:
+    files: int = 0
+    megabytes: float = 0.0
+    indexed: int = 0
+    skipped: int = 0
+    failed: int = 0
+    # Файлы батча, не начатые до дедлайна скана: остаются queued до следующего скана.
+    deferred: int = 0
+    # Причина досрочной остановки: max_files | max_mb | timeout.
+    stopped: str | None = None
+
+    def describe(self) -> str:
+        summary = (
+            f"файлов: {self.files} ({self.megabytes:.1f} MB), проиндексировано {self.indexed}, "
+            f"без изменений {self.skipped}, ошибок {self.failed}"
+        )
+        if self.deferred:
+            summary += f", отложено до следующего скана {self.deferred}"
+        if self.stopped:
+            summary += f", остановлено по лимиту {self.stopped}"
+        return summary
+
+
+def matches_globs(relative_path: str, include_globs: list[str], exclude_globs: list[str]) -> bool:
+    if include_globs and not any(fnmatch(relative_path, pat) for pat in include_globs):
+        return False
+    if exclude_globs and any(fnmatch(relative_path, pat) for pat in exclude_globs):
+        return False
+    return True
+
+
+def iter_source_files(
+    base_path: Path,
+    include_globs: list[str],
+    exclude_globs: list[str],
+    allowed: set[str],
+    errors: list[str] | None = None,
+) -> Iterator[ScanCandidate]:
+    """Обходит дерево через `os.scandir`: тип записи и inode берутся из dirent, `stat` — только для подходящих файлов.
+
+    Каталоги, которые не удалось прочитать, попадают в `errors`: по неполному обходу нельзя судить об удалениях.
+    """
+    # Пути собираются строками: pathlib на каждую запись заметно дороже самого обхода.
+    stack = [(str(base_path), "")]
+    while stack:
+        directory, prefix = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, f"{prefix}{entry.name}/"))
+                        continue
+                    if not entry.is_file():
+                        continue
+                    if os.path.splitext(entry.name)[1].lower().lstrip(".") not in allowed:
+                        continue
+                    rel_path = prefix + entry.name
+                    if not matches_globs(rel_path, include_globs, exclude_globs):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        # Файл удалили между readdir и stat.
+                        continue
+                    yield ScanCandidate(
+                        path=Path(entry.path),
+                        relative_path=rel_path,
+                        size_bytes=stat.st_size,
+                        mtime=datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                        inode=entry.inode(),
+                    )
+        except OSError as exc:
+            if errors is None:
+                raise
+            errors.append(f"{directory}: {exc.strerror or exc}")
+
+
+class PipelinedScanner:
+    """Конвейер NAS-скана: обход каталогов → очередь → пул процессов парсинга → эмбеддинги → запись в БД.
+
+    Обход идет в отдельном потоке и упирается в ограниченную очередь, парсинг (CPU) — в общем `ParserPool`
+    с таймаутом и лимитом памяти на файл и ограниченным числом задач в полете. Эмбеддинги и запись выполняет один поток-координатор с одной
+    сессией БД, пока пул разбирает следующие файлы. Лимиты `scan_max_files`/`scan_max_mb`/
+    `scan_max_files`/`scan_max_mb` здесь не проверяются: их применяет обнаружение. От `scan_timeout_seconds`
+    остается `deadline` всего скана: после него файлы не берутся в работу и остаются queued (`deferred`),
+    а манифест следующего скана отдаст их в индексацию снова.
+    Файлы от `stream_ingest_min_mb` разбираются в том же пуле потоком (`stream_document_pooled`), а
+    координатор индексирует их чанки порциями (`index_document_stream`).
+    """
+
+    def __init__(self, db, scheduler: EmbeddingScheduler, pool: ParserPool | None = None, job_id: int | None = None):
+        self._db = db
+        self._job_id = job_id
+        self._scheduler = scheduler
+        self._pool = pool or get_parser_pool()
+        self._max_inflight = (settings.scan_parse_workers or os.cpu_count() or 1) * 2
+        self.memory = StageMemory()
+
+    def run(
+        self,
+        candidates: Iterable[ScanCandidate],
+        register: Callable[[ScanCandidate, int], int | None],
+        on_progress: Callable[[ScanStats], None] | None = None,
+        deadline: float | None = None,
+    ) -> ScanStats:
+        """`register(candidate, files_seen)` готовит строку documents и возвращает её id (None — пропустить файл).
+
+        `on_progress(stats)` вызывается после каждой порции завершенных разборов и записей;
+        `deadline` — момент по `time.time()`, после которого новые файлы откладываются.
+        """
+        stats = ScanStats()
+        feed: queue.Queue = queue.Queue(maxsize=settings.scan_queue_size)
+        stop = threading.Event()
+        walker = threading.Thread(target=_walk, args=(candidates, feed, stop), name="scan-walker", daemon=True)
+        walker.start()
+
+        inflight: dict[Future, int] = {}
+        pending: list[PendingDocument] = []
+        pending_chunks = 0
+        exhausted = False
+        try:
+            while not exhausted or inflight:
+                while not exhausted and len(inflight) < self._max_inflight:
+                    try:
+                        item = feed.get(timeout=0.5) if not inflight else feed.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _WALK_DONE:
+                        exhausted = True
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    if deadline is not None and time.time() > deadline:
+                        stats.stopped = "timeout"
+                        stats.deferred += 1
+                        continue
+                    stats.files += 1
+                    stats.megabytes += item.size_bytes / _BYTES_IN_MB
+                    document_id = register(item, stats.files)
+                    if document_id is None:
+                        stats.skipped += 1
+                        continue
+                    if item.size_bytes >= settings.stream_ingest_min_mb * _BYTES_IN_MB:
+                        self._stream(document_id, item, stats)
+                        continue
+                    inflight[self._pool.submit(parse_document, item.path, None, self._job_id)] = document_id
+
+                if not inflight:
+                    continue
+                done, _ = wait(inflight, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    document_id = inflight.pop(future)
+                    try:
+                        parsed = future.result()
+                    except Exception as exc:
+                        outcome = exc.outcome if isinstance(exc, ParseFailure) else "error"
+                        mark_document_failed(self._db, document_id, str(exc), outcome)
+                        stats.failed += 1
+                        continue
+                    pending.append(PendingDocument(document_id=document_id, parsed=parsed))
+                    pending_chunks += len(parsed.chunks)
+                if pending_chunks >= settings.scan_embed_chunks:
+                    self._flush(pending, stats)
+                    pending, pending_chunks = [], 0
+                if on_progress and done:
+                    on_progress(stats)
+            if pending:
+                self._flush(pending, stats)
+                if on_progress:
+                    on_progress(stats)
+        finally:
+            stop.set()
+            # Пул общий для процесса: чужие для него задачи прерванного скана снимаем из очереди.
+            for future in inflight:
+                future.cancel()
+        return stats
+
+    def _flush(self, pending: list[PendingDocument], stats: ScanStats) -> None:
+        with self.memory.stage("index"):
+            index_documents(self._db, self._scheduler, pending)
+        self._db.commit()
+        stats.indexed += len(pending)
+
+    def _stream(self, document_id: int, candidate: ScanCandidate, stats: ScanStats) -> None:
+        # Большой файл разбирается в пуле потоком: чанки индексируются порциями, не собираясь целиком.
+        try:
+            with self._db.begin_nested():
+                chunks, meta = stream_document_pooled(self._pool, candidate.path, None, self._job_id, memory=self.memory)
+                index_document_stream(self._db, self._scheduler, document_id, chunks, meta, self.memory)
+        except Exception as exc:
+            outcome = exc.outcome if isinstance(exc, ParseFailure) else "error"
+            mark_document_failed(self._db, document_id, str(exc), outcome)
+            stats.failed += 1
+            return
+        self._db.commit()
+        stats.indexed += 1
+
+
+def limit_reached(stats: ScanStats, candidate: ScanCandidate, started: float) -> str | None:
+    if stats.files >= settings.scan_max_files:
+        return "max_files"
+    if stats.megabytes + candidate.size_bytes / _BYTES_IN_MB > settings.scan_max_mb:
+        return "max_mb"
+    if time.monotonic() - started > settings.scan_timeout_seconds:
+        return "timeout"
+    return None
+
+
+def _walk(candidates: Iterable[ScanCandidate], feed: queue.Queue, stop: threading.Event) -> None:
+    try:
+        for candidate in candidates:
+            if not _put(feed, candidate, stop):
+                return
+        _put(feed, _WALK_DONE, stop)
+    except Exception as exc:
+        _put(feed, exc, stop)
+
+
+def _put(feed: queue.Queue, item, stop: threading.Event) -> bool:
+    # Ограниченная очередь дает backpressure: обход ждет, пока координатор разберет файлы.
+    while not stop.is_set():
+        try:
+            feed.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import io
+import json
+import struct
+from typing import Sequence
+
+import numpy as np
+
+from ..config import settings
+from ..embeddings import to_pgvector_binary, to_pgvector_text
+from .embedding_cache import chunk_text_hash
+
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+_CHUNK_COLUMNS = "document_id, chunk_index, content, embedding, meta, fingerprint"
+_TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_DEFAULT_META = {"page_or_sheet": None}
+
+
+class ChunkSink:
+    """Пакетная запись чанков документа в Postgres через COPY ... FROM STDIN.
+
+    Строки копятся в буфере и уходят одним COPY на каждые `chunk_sink_flush_rows` строк.
+    Запись идет в транзакции сессии `db`, коммит остается за вызывающим кодом.
+    """
+
+    def __init__(self, db, document_id: int, binary: bool | None = None, flush_rows: int | None = None):
+        self._db = db
+        self._document_id = document_id
+        self._binary = settings.chunk_sink_binary if binary is None else binary
+        self._flush_rows = flush_rows or settings.chunk_sink_flush_rows
+        self._buffer = io.BytesIO()
+        self._pending = 0
+        self.rows_written = 0
+
+    def write_batch(
+        self,
+        chunk_indexes: Sequence[int],
+        contents: Sequence[str],
+        embeddings: np.ndarray,
+        metas: Sequence[dict] | None = None,
+        fingerprints: Sequence[str] | None = None,
+    ) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if self._binary:
+            encode, fields = self._encode_binary, to_pgvector_binary(vectors)
+        else:
+            encode, fields = self._encode_text, to_pgvector_text(vectors)
+        for offset, (chunk_index, content, field) in enumerate(zip(chunk_indexes, contents, fields)):
+            meta = metas[offset] if metas is not None else _DEFAULT_META
+            fingerprint = fingerprints[offset] if fingerprints is not None else chunk_text_hash(content)
+            encode(chunk_index, content, field, meta, fingerprint)
+            self._pending += 1
+            if self._pending >= self._flush_rows:
+                self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        if self._binary:
+            payload = _COPY_HEADER + self._buffer.getvalue() + _COPY_TRAILER
+            sql = f"COPY chunks ({_CHUNK_COLUMNS}) FROM STDIN WITH (FORMAT binary)"
+        else:
+            payload = self._buffer.getvalue()
+            sql = f"COPY chunks ({_CHUNK_COLUMNS}) FROM STDIN"
+        cursor = self._db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(sql, io.BytesIO(payload))
+        finally:
+            cursor.close()
+        self.rows_written += self._pending
+        self._pending = 0
+        self._buffer = io.BytesIO()
+
+    def close(self) -> None:
+        self.flush()
+
+    def _encode_binary(self, chunk_index: int, content: str, vector_field: np.ndarray, meta: dict, fingerprint: str) -> None:
+        content_bytes = _clean_content(content).encode("utf-8")
+        meta_bytes = b"\x01" + json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        fingerprint_bytes = fingerprint.encode("ascii")
+        write = self._buffer.write
+        write(struct.pack(">hiqiii", 6, 8, self._document_id, 4, chunk_index, len(content_bytes)))
+        write(content_bytes)
+        write(vector_field.data)
+        write(struct.pack(">i", len(meta_bytes)))
+        write(meta_bytes)
+        write(struct.pack(">i", len(fingerprint_bytes)))
+        write(fingerprint_bytes)
+
+    def _encode_text(self, chunk_index: int, content: str, vector_literal: str, meta: dict, fingerprint: str) -> None:
+        fields = (
+            str(self._document_id),
+            str(chunk_index),
+            _clean_content(content).translate(_TEXT_ESCAPES),
+            vector_literal,
+            json.dumps(meta, ensure_ascii=False).translate(_TEXT_ESCAPES),
+            fingerprint,
+        )
+        self._buffer.write(("\t".join(fields) + "\n").encode("utf-8"))
+
+
+def _clean_content(content: str) -> str:
+    # Postgres не хранит NUL в text, а pypdf иногда отдает его на битых страницах.
+    return content.replace("\x00", "")
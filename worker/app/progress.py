@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import time
+
+from redis import Redis, RedisError
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from .config import settings
+
+redis_client = Redis.from_url(settings.redis_url)
+
+# Ключ живого прогресса job; API читает тот же формат (api/app/services/progress.py).
+PROGRESS_KEY = "job_progress:{job_id}"
+
+
+def publish_progress(job_id: int, status: str, step: str | None, progress: int, message: str | None, client: Redis | None = None) -> None:
+    """Пишет текущее состояние job в Redis; недоступный Redis не должен ронять пайплайн."""
+    key = PROGRESS_KEY.format(job_id=job_id)
+    state = {"status": status, "step": step or "", "progress": progress, "message": message or "", "updated_at": time.time()}
+    try:
+        pipe = (client or redis_client).pipeline(transaction=False)
+        pipe.hset(key, mapping=state)
+        pipe.expire(key, settings.progress_ttl_seconds)
+        pipe.execute()
+    except RedisError:
+        pass
+
+
+def clear_progress(job_id: int, client: Redis | None = None) -> None:
+    """Удаляет живой прогресс job: API вернется к строке jobs из Postgres."""
+    try:
+        (client or redis_client).delete(PROGRESS_KEY.format(job_id=job_id))
+    except RedisError:
+        pass
+
+
+class ProgressReporter:
+    """Прогресс job с коалесцированием записей.
+
+    Смена статуса или шага пишется сразу в UPDATE jobs + строку job_steps, а в Redis уходит после
+    коммита сессии, поэтому итог вроде completed не виден до фиксации. Обновления внутри шага копятся
+    и уходят только в Redis, не чаще `progress_flush_interval_ms`. Откат транзакции (повтор задачи)
+    удаляет ключ Redis, и API показывает зафиксированную строку jobs. Сессии не-`Session` (тесты)
+    публикуются сразу.
+    """
+
+    def __init__(self, db, job_id: int, client: Redis | None = None, min_interval_ms: int | None = None):
+        self._db = db
+        self.job_id = job_id
+        self._client = client
+        interval_ms = settings.progress_flush_interval_ms if min_interval_ms is None else min_interval_ms
+        self._interval = interval_ms / 1000
+        self._status: str | None = None
+        self._step: str | None = None
+        self._pending: tuple[str, str, int, str | None] | None = None
+        self._published_at = 0.0
+        # Последнее состояние, если смена шага ждет коммита; были ли публикации с последнего коммита.
+        self._uncommitted: tuple[str, str, int, str | None] | None = None
+        self._dirty = False
+        self._transactional = isinstance(db, Session)
+        if self._transactional:
+            event.listen(db, "after_commit", self._on_commit)
+            event.listen(db, "after_rollback", self._on_rollback)
+
+    def update(self, status: str, step: str, progress: int, message: str | None = None) -> None:
+        if status != self._status or step != self._step:
+            self._persist(status, step, progress, message)
+            return
+        self._pending = (status, step, progress, message)
+        if time.monotonic() - self._published_at >= self._interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending is not None:
+            self._publish(*self._pending)
+
+    def _persist(self, status: str, step: str, progress: int, message: str | None) -> None:
+        self._db.execute(
+            text("UPDATE jobs SET status=:status, current_step=:step, progress=:progress, message=:message WHERE id=:id"),
+            {"id": self.job_id, "status": status, "step": step, "progress": progress, "message": message},
+        )
+        self._db.execute(
+            text(
+                "INSERT INTO job_steps (job_id, step_name, status, progress, message) "
+                "VALUES (:job_id, :step_name, :status, :progress, :message)"
+            ),
+            {"job_id": self.job_id, "step_name": step, "status": status, "progress": progress, "message": message},
+        )
+        self._status, self._step = status, step
+        if self._transactional:
+            self._uncommitted, self._pending = (status, step, progress, message), None
+            return
+        self._publish(status, step, progress, message)
+
+    def _publish(self, status: str, step: str, progress: int, message: str | None) -> None:
+        if self._uncommitted is not None:
+            # Прогресс внутри незафиксированного шага виден сразу (долгое обнаружение файлов), при коммите уйдет он же.
+            self._uncommitted = (status, step, progress, message)
+        publish_progress(self.job_id, status, step, progress, message, self._client)
+        self._pending = None
+        self._published_at = time.monotonic()
+        self._dirty = self._transactional
+
+    def _on_commit(self, session) -> None:
+        state, self._uncommitted = self._uncommitted, None
+        if state is not None:
+            self._publish(*state)
+        self._dirty = False
+
+    def _on_rollback(self, session) -> None:
+        if self._uncommitted is not None or self._dirty:
+            clear_progress(self.job_id, self._client)
+        self._uncommitted, self._pending, self._dirty = None, None, False
+        # Следующее обновление снова запишет шаг в БД: откаченная строка jobs его уже не содержит.
+        self._status = self._step = None
+
+
+def set_queue_position(job_id: int, position: int | None, client: Redis | None = None) -> None:
+    """Позиция job в очереди GPU (None — слот получен) в живом прогрессе Redis.
+
+    Не UPDATE jobs: строку job держит незафиксированная транзакция задачи, отдельное соединение ждало бы ее вечно.
+    """
+    key = PROGRESS_KEY.format(job_id=job_id)
+    try:
+        pipe = (client or redis_client).pipeline(transaction=False)
+        pipe.hset(key, "queue_position", "" if position is None else position)
+        pipe.expire(key, settings.progress_ttl_seconds)
+        pipe.execute()
+    except RedisError:
+        pass
+
+
+def publish_step(job_id: int, step: str, progress: int, client: Redis | None = None) -> None:
+    """Шаг разбора (mineru, paddleocr) из процесса пула парсинга — в живой прогресс Redis.
+
+    У процесса пула нет сессии задачи, а строку jobs держит ее незафиксированная транзакция, как и для
+    `set_queue_position`. Итог job задача пишет сама после коммита.
+    """
+    publish_progress(job_id, "running", step, progress, None, client)
@@ -1,70 +1,32 @@
-from contextlib import contextmanager
 from datetime import datetime
-from fnmatch import fnmatch
+from functools import partial
+import json
 from pathlib import Path
 import time
 
-from celery import Celery
-from redis import Redis
+from celery import Celery, chord
 from sqlalchemy import text
 
-from .clients.services import MineruClient, OCRClient
 from .config import settings
 from .db import SessionLocal
-from .embeddings import get_embedder
-from .pipeline.parsers import parse_docx, parse_pdf_builtin, parse_txt, parse_xlsx
+from .pipeline.artifacts import get_artifact_store
+from .pipeline.embedding_cache import EmbeddingCache
+from .pipeline.extract import parse_document, stream_document_pooled
+from .pipeline.indexer import (
+    PendingDocument,
+    finish_scheduler,
+    index_document_stream,
+    index_documents,
+    mark_document_failed,
+    new_scheduler,
+)
+from .pipeline.manifest import ManifestEntry, SourceManifest, is_unchanged, tombstone_documents
+from .pipeline.memory import StageMemory
+from .pipeline.parser_pool import ParseFailure, get_parser_pool
+from .pipeline.scanner import PipelinedScanner, ScanCandidate, ScanStats, iter_source_files, limit_reached
+from .progress import ProgressReporter, publish_progress, publish_step
 
 celery_app = Celery("worker", broker=settings.redis_url, backend=settings.redis_url)
-redis_client = Redis.from_url(settings.redis_url)
-
-
-def _update_job(db, job_id: int, status: str, step: str, progress: int, message: str | None = None):
-    db.execute(
-        text("UPDATE jobs SET status=:status, current_step=:step, progress=:progress, message=:message WHERE id=:id"),
-        {"id": job_id, "status": status, "step": step, "progress": progress, "message": message},
-    )
-    db.execute(
-        text("INSERT INTO job_steps (job_id, step_name, status, progress, message) VALUES (:job_id, :step_name, :status, :progress, :message)"),
-        {"job_id": job_id, "step_name": step, "status": status, "progress": progress, "message": message},
-    )
-
-
-def _chunk_text(content: str, size: int, overlap: int):
-    chunks = []
-    start = 0
-    while start < len(content):
-        end = min(len(content), start + size)
-        chunks.append(content[start:end])
-        start += max(1, size - overlap)
-    return chunks
-
-
-def _format_vector(vec: list[float]) -> str:
-    return "[" + ",".join(f"{v:.6f}" for v in vec) + "]"
-
-
-def _embed_texts(texts: list[str]) -> list[str]:
-    embedder = get_embedder()
-    batch = embedder.embed_texts(texts)
-    return [_format_vector(vec) for vec in batch.embeddings]
-
-
-@contextmanager
-def _gpu_lock():
-    """Глобальная блокировка GPU для тяжелых задач OCR/MinerU."""
-    start = time.time()
-    while True:
-        acquired = redis_client.set(settings.gpu_lock_key, "1", nx=True, ex=settings.gpu_lock_ttl_seconds)
-        if acquired:
-            break
-        if time.time() - start > settings.gpu_lock_ttl_seconds:
-            raise RuntimeError("Таймаут ожидания GPU lock")
-        time.sleep(1)
-    try:
-        yield
-    finally:
-        redis_client.delete(settings.gpu_lock_key)
-
 
 def _create_job(db, job_type: str, source_id: int | None = None, document_id: int | None = None) -> int:
     return db.execute(
@@ -87,110 +49,258 @@ def _resolve_source_base(base_path: str) -> Path:
     return candidate
 
 
-def _matches_globs(relative_path: str, include_globs: list[str], exclude_globs: list[str]) -> bool:
-    if include_globs and not any(fnmatch(relative_path, pat) for pat in include_globs):
-        return False
-    if exclude_globs and any(fnmatch(relative_path, pat) for pat in exclude_globs):
-        return False
-    return True
-
-
-def _ingest_file(db, document_id: int, path: Path, job_id: int | None):
-    ext = path.suffix.lower()
-    content = ""
-    parser_used = "builtin"
-    quality_score = 0.0
-    warnings = []
-    ocr_pages_processed = 0
-
-    if ext == ".pdf":
-        content, quality_score = parse_pdf_builtin(path)
-        if quality_score < settings.quality_threshold_builtin:
-            parser_used = "mineru"
-            if job_id:
-                _update_job(db, job_id, "running", "mineru", 35)
-            with _gpu_lock():
-                text_v, score_v = MineruClient(settings.mineru_url, settings.parser_timeout_seconds).parse_pdf(str(path))
-            if score_v > quality_score:
-                content, quality_score = text_v, score_v
-            if quality_score < settings.quality_threshold_mineru:
-                parser_used = "paddleocr"
-                if job_id:
-                    _update_job(db, job_id, "running", "paddleocr", 55)
-                with _gpu_lock():
-                    ocr_text, ocr_score, pages = OCRClient(settings.ocr_url, settings.ocr_timeout_seconds).parse_pdf(str(path))
-                if ocr_score > quality_score:
-                    content, quality_score = ocr_text, ocr_score
-                ocr_pages_processed = pages
-                if quality_score < settings.quality_threshold_ocr:
-                    warnings.append("Низкое качество OCR")
-    elif ext == ".txt":
-        content, quality_score = parse_txt(path)
-    elif ext == ".docx":
-        content, quality_score = parse_docx(path)
-    elif ext == ".xlsx":
-        content, quality_score = parse_xlsx(path)
-    else:
-        raise ValueError("Расширение не поддерживается")
-
-    chunks = _chunk_text(content, settings.chunk_size_chars, settings.chunk_overlap_chars)
-    for start in range(0, len(chunks), settings.embedding_batch_size):
-        batch_chunks = chunks[start : start + settings.embedding_batch_size]
-        embeddings = _embed_texts(batch_chunks)
-        for offset, (chunk, embedding) in enumerate(zip(batch_chunks, embeddings)):
-            db.execute(
-                text(
-                    "INSERT INTO chunks (document_id, chunk_index, content, embedding, meta) "
-                    "VALUES (:document_id, :chunk_index, :content, CAST(:embedding AS vector), :meta::jsonb)"
-                ),
-                {
-                    "document_id": document_id,
-                    "chunk_index": start + offset,
-                    "content": chunk,
-                    "embedding": embedding,
-                    "meta": '{"page_or_sheet": null}',
-                },
-            )
+def _merge_job_meta(db, job_id: int, meta: dict) -> None:
+    db.execute(
+        text("UPDATE jobs SET meta=meta || CAST(:meta AS jsonb) WHERE id=:id"),
+        {"id": job_id, "meta": json.dumps(meta, ensure_ascii=False)},
+    )
+
 
-    existing_meta = db.execute(text("SELECT meta FROM documents WHERE id=:id"), {"id": document_id}).scalar()
-    meta = existing_meta or {}
-    meta.update(
+def _ingest_file(db, document_id: int, path: Path, reporter: ProgressReporter | None):
+    """Индексирует загруженный файл.
+
+    Файлы разбираются в `ParserPool` (таймаут, лимит памяти, изоляция сбоев), итог сбоя пишется
+    в documents.meta. Файлы от `stream_ingest_min_mb` разбираются там же потоком: чанки приходят
+    порциями, эмбеддинги и запись идут в задаче с фиксированным потолком памяти.
+    """
+    scheduler = new_scheduler(db)
+    job_id = reporter.job_id if reporter else None
+    memory = StageMemory()
+    pool = get_parser_pool()
+    # Шаги каскада PDF процесс пула публикует в Redis сам: очередь в UI видит mineru/paddleocr.
+    on_step = partial(publish_step, job_id) if job_id else None
+    # Загрузки пользователя обгоняют фоновые NAS-сканы в очереди GPU.
+    try:
+        if path.stat().st_size < settings.stream_ingest_min_mb * 1024 * 1024:
+            parsed = pool.submit(parse_document, path, on_step, job_id, "interactive").result()
+            with memory.stage("index"):
+                index_documents(db, scheduler, [PendingDocument(document_id=document_id, parsed=parsed)])
+        else:
+            # Savepoint: при сбое посреди файла уже записанные порции чанков не попадут в коммит ошибки.
+            with db.begin_nested():
+                chunks, parse_meta = stream_document_pooled(pool, path, on_step, job_id, "interactive", memory)
+                index_document_stream(db, scheduler, document_id, chunks, parse_meta, memory)
+    except ParseFailure as exc:
+        mark_document_failed(db, document_id, str(exc), exc.outcome)
+        raise
+    if reporter:
+        _merge_job_meta(db, reporter.job_id, {"memory": memory.describe()})
+    return finish_scheduler(scheduler)
+
+
+def _scan_progress(files_seen: int, expected: int) -> int:
+    # Обнаружение занимает 5–10%, остальное докладывают подзадачи индексации (_roll_up_parent).
+    return 5 + int(min(5, (files_seen / max(1, expected)) * 5))
+
+
+def _register_file(db, source_id: int, candidate: ScanCandidate, entry: ManifestEntry | None) -> int:
+    """Ставит файл в очередь индексации: обновляет строку documents из манифеста или создает новую."""
+    file_meta = json.dumps({"mtime": candidate.mtime, "size_bytes": candidate.size_bytes, "inode": candidate.inode})
+    if entry:
+        db.execute(
+            text(
+                "UPDATE documents SET status='queued', deleted_at=NULL, storage_path=:storage_path, "
+                "meta=meta || CAST(:meta AS jsonb) WHERE id=:id"
+            ),
+            {"id": entry.document_id, "storage_path": str(candidate.path), "meta": file_meta},
+        )
+        return entry.document_id
+    return db.execute(
+        text(
+            "INSERT INTO documents (source_id, scope, title, relative_path, storage_path, status, meta) "
+            "VALUES (:source_id, 'nas', :title, :relative_path, :storage_path, 'queued', CAST(:meta AS jsonb)) "
+            "RETURNING id"
+        ),
         {
-            "parser_used": parser_used,
-            "quality_score": quality_score,
-            "warnings": warnings,
-            "ocr_pages_processed": ocr_pages_processed,
-        }
-    )
+            "source_id": source_id,
+            "title": candidate.path.name,
+            "relative_path": candidate.relative_path,
+            "storage_path": str(candidate.path),
+            "meta": file_meta,
+        },
+    ).scalar_one()
+
+
+def _create_child_job(db, parent_job_id: int, source_id: int, files: int) -> int:
+    return db.execute(
+        text(
+            "INSERT INTO jobs (job_type, source_id, parent_job_id, status, progress, current_step, meta) "
+            "VALUES ('scan_batch', :source_id, :parent_job_id, 'queued', 0, 'queued', CAST(:meta AS jsonb)) RETURNING id"
+        ),
+        {"source_id": source_id, "parent_job_id": parent_job_id, "meta": json.dumps({"files": files})},
+    ).scalar_one()
+
+
+def _rollup_progress(done: int, total: int) -> int:
+    # 10% на обнаружение, остальное — доля завершенных подзадач; 100 ставит finalize_source_scan.
+    return 10 + 89 * done // max(1, total)
+
+
+def _roll_up_parent(db, parent_job_id: int) -> tuple | None:
+    """Прогресс родительского скана по завершенным подзадачам; состояние для Redis публикуется после коммита."""
+    # Блокировка строки родителя упорядочивает подзадачи: каждая считает уже зафиксированные итоги соседей.
+    parent = db.execute(
+        text("SELECT status, current_step FROM jobs WHERE id=:id AND status='running' FOR UPDATE"),
+        {"id": parent_job_id},
+    ).first()
+    if not parent:
+        return None
+    total, done = db.execute(
+        text(
+            "SELECT count(*), count(*) FILTER (WHERE status IN ('completed', 'partial_success', 'failed')) "
+            "FROM jobs WHERE parent_job_id=:id"
+        ),
+        {"id": parent_job_id},
+    ).one()
+    progress = _rollup_progress(done, total)
+    message = f"Подзадач завершено: {done} из {total}"
     db.execute(
-        text("UPDATE documents SET status='ready', meta=:meta::jsonb WHERE id=:id"),
-        {"id": document_id, "meta": str(meta).replace(\"'\", '\"')},
+        text("UPDATE jobs SET progress=:progress, message=:message WHERE id=:id"),
+        {"id": parent_job_id, "progress": progress, "message": message},
     )
+    return parent[0], parent[1], progress, message
+
+
+def _batch_candidates(db, document_ids: list[int]) -> tuple[list[ScanCandidate], int]:
+    """Кандидаты батча и число файлов, исчезнувших после обнаружения (они помечаются failed/missing)."""
+    rows = db.execute(
+        text("SELECT id, relative_path, storage_path FROM documents WHERE id = ANY(:ids) ORDER BY id"),
+        {"ids": document_ids},
+    ).mappings().all()
+    candidates = []
+    missing = 0
+    for row in rows:
+        path = Path(row["storage_path"])
+        try:
+            stat = path.stat()
+        except OSError as exc:
+            # Файл удален или перемещен между обнаружением и батчем: повтор не поможет, остальные индексируем.
+            mark_document_failed(db, row["id"], f"Файл недоступен: {exc}", "missing")
+            missing += 1
+            continue
+        candidates.append(
+            ScanCandidate(
+                path=path,
+                relative_path=row["relative_path"] or path.name,
+                size_bytes=stat.st_size,
+                mtime=datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                document_id=row["id"],
+            )
+        )
+    return candidates, missing
+
+
+def _discover_source(source_id: int, job_type: str, start_step: str, error_prefix: str, reindex_all: bool):
+    """Обнаружение изменений: сверяет дерево NAS с манифестом источника и раздает измененные файлы подзадачам.
+
+    Неизмененные файлы (mtime/size/inode; документ ready или упал по таймауту/памяти) отсеиваются в памяти без запросов к БД; лимиты скана
+    считаются только по файлам, ушедшим в индексацию. Исчезнувшие файлы помечаются удаленными,
+    если обход дошел до конца без ошибок. Парсинг и эмбеддинги идут в `worker.ingest_source_batch`
+    на любых репликах воркера, а `worker.finalize_source_scan` (callback chord) подводит итог.
+    """
+    db = SessionLocal()
+    reporter = None
+    try:
+        job_id = _create_job(db, job_type, source_id=source_id)
+        reporter = ProgressReporter(db, job_id)
+        reporter.update("running", start_step, 5)
+        # Строка job фиксируется сразу: откат после сбоя обнаружения не должен ее удалить.
+        db.commit()
+        source = db.execute(
+            text("SELECT id, base_path, include_globs, exclude_globs FROM sources WHERE id=:id AND enabled=TRUE"),
+            {"id": source_id},
+        ).mappings().first()
+        if not source:
+            reporter.update("failed", start_step, 100, "Источник не найден")
+            db.commit()
+            return
+
+        base_path = _resolve_source_base(source["base_path"])
+        allowed = {ext.strip().lower() for ext in settings.allowed_extensions.split(",") if ext.strip()}
+        manifest = SourceManifest.load(db, source_id)
+        walk_errors: list[str] = []
+        stats = ScanStats()
+        started = time.monotonic()
+        # Дедлайн всего скана по wall-clock: подзадачи идут в других процессах и на других репликах.
+        deadline = time.time() + settings.scan_timeout_seconds
+        files_seen = 0
+        document_ids: list[int] = []
+        for candidate in iter_source_files(
+            base_path, source["include_globs"] or [], source["exclude_globs"] or [], allowed, walk_errors
+        ):
+            files_seen += 1
+            reporter.update(
+                "running", "discover", _scan_progress(files_seen, len(manifest) + files_seen), f"Проверка {candidate.relative_path}"
+            )
+            entry = manifest.take(candidate.relative_path)
+            if not reindex_all and is_unchanged(entry, candidate):
+                stats.skipped += 1
+                continue
+            stats.stopped = limit_reached(stats, candidate, started)
+            if stats.stopped:
+                break
+            stats.files += 1
+            stats.megabytes += candidate.size_bytes / (1024 * 1024)
+            document_ids.append(_register_file(db, source_id, candidate, entry))
+
+        discovery = stats.describe()
+        if stats.stopped or walk_errors:
+            if walk_errors:
+                discovery += f"; недоступно каталогов: {len(walk_errors)} ({walk_errors[0]})"
+        else:
+            removed = manifest.missing()
+            tombstone_documents(db, removed)
+            discovery += f"; удалено с NAS: {len(removed)}"
+
+        batch_size = max(1, settings.scan_batch_files)
+        batches = [document_ids[i : i + batch_size] for i in range(0, len(document_ids), batch_size)]
+        if not batches:
+            reporter.update("completed", "done", 100, discovery)
+            db.commit()
+            return
+
+        subtasks = [
+            ingest_source_batch.s(_create_child_job(db, job_id, source_id, len(batch)), job_id, batch, deadline)
+            for batch in batches
+        ]
+        reporter.update("running", "dispatch", 10, f"{discovery}; подзадач: {len(batches)}")
+        # Строки документов и дочерних jobs должны быть видны подзадачам до их запуска.
+        db.commit()
+        chord(subtasks)(finalize_source_scan.s(job_id, discovery))
+    except Exception as exc:
+        if reporter is not None:
+            db.rollback()
+            reporter.update("failed", "error", 100, f"{error_prefix}: {exc}")
+            db.commit()
+        raise
+    finally:
+        db.close()
 
 
 @celery_app.task(name="worker.ingest_uploaded_document")
 def ingest_uploaded_document(document_id: int, job_id: int):
     db = SessionLocal()
+    reporter = ProgressReporter(db, job_id)
     try:
-        _update_job(db, job_id, "running", "read_document", 10)
+        reporter.update("running", "read_document", 10)
         doc = db.execute(text("SELECT id, storage_path, title FROM documents WHERE id=:id"), {"id": document_id}).mappings().first()
         if not doc:
-            _update_job(db, job_id, "failed", "read_document", 100, "Документ не найден")
+            reporter.update("failed", "read_document", 100, "Документ не найден")
             db.commit()
             return
 
         path = Path(doc["storage_path"])
         if path.suffix.lower() not in {".pdf", ".txt", ".docx", ".xlsx"}:
-            _update_job(db, job_id, "failed", "validate_extension", 100, "Расширение не поддерживается")
+            reporter.update("failed", "validate_extension", 100, "Расширение не поддерживается")
             db.commit()
             return
 
-        _update_job(db, job_id, "running", "chunk_embed", 75)
-        _ingest_file(db, document_id, path, job_id)
-        _update_job(db, job_id, "completed", "done", 100)
+        reporter.update("running", "chunk_embed", 75)
+        summary = _ingest_file(db, document_id, path, reporter)
+        reporter.update("completed", "done", 100, summary)
         db.commit()
     except Exception as exc:
-        _update_job(db, job_id, "failed", "error", 100, f"Ошибка пайплайна: {exc}")
+        reporter.update("failed", "error", 100, f"Ошибка пайплайна: {exc}")
         db.commit()
         raise
     finally:
@@ -199,178 +309,88 @@ def ingest_uploaded_document(document_id: int, job_id: int):
 
 @celery_app.task(name="worker.scan_source_incremental")
 def scan_source_incremental(source_id: int):
-    db = SessionLocal()
-    job_id = None
-    try:
-        job_id = _create_job(db, "scan_incremental", source_id=source_id)
-        _update_job(db, job_id, "running", "scan_start", 5)
-        source = db.execute(
-            text("SELECT id, base_path, include_globs, exclude_globs FROM sources WHERE id=:id AND enabled=TRUE"),
-            {"id": source_id},
-        ).mappings().first()
-        if not source:
-            _update_job(db, job_id, "failed", "scan_start", 100, "Источник не найден")
-            db.commit()
-            return
+    _discover_source(source_id, "scan_incremental", "scan_start", "Ошибка сканирования", reindex_all=False)
 
-        base_path = _resolve_source_base(source["base_path"])
-        include_globs = source["include_globs"] or []
-        exclude_globs = source["exclude_globs"] or []
-        allowed = {ext.strip().lower() for ext in settings.allowed_extensions.split(",") if ext.strip()}
 
-        scanned_files = 0
-        scanned_mb = 0.0
-        start_time = time.time()
-
-        for file_path in base_path.rglob("*"):
-            if not file_path.is_file():
-                continue
-            rel_path = file_path.relative_to(base_path).as_posix()
-            if not _matches_globs(rel_path, include_globs, exclude_globs):
-                continue
-            if file_path.suffix.lower().lstrip(".") not in allowed:
-                continue
+@celery_app.task(name="worker.scan_source_full_audit")
+def scan_source_full_audit(source_id: int):
+    _discover_source(source_id, "scan_full_audit", "audit_start", "Ошибка аудита", reindex_all=True)
 
-            stat = file_path.stat()
-            file_mb = stat.st_size / (1024 * 1024)
-            if scanned_files >= settings.scan_max_files or scanned_mb + file_mb > settings.scan_max_mb:
-                break
-            if time.time() - start_time > settings.scan_timeout_seconds:
-                break
 
-            scanned_files += 1
-            scanned_mb += file_mb
-            progress = int(min(90, (scanned_files / max(1, settings.scan_max_files)) * 90))
-            _update_job(db, job_id, "running", "index_file", progress, f"Индексирование {rel_path}")
-
-            doc = db.execute(
-                text("SELECT id, meta FROM documents WHERE source_id=:source_id AND relative_path=:relative_path"),
-                {"source_id": source_id, "relative_path": rel_path},
-            ).mappings().first()
-            meta = doc["meta"] if doc else {}
-            mtime = datetime.fromtimestamp(stat.st_mtime).isoformat()
-            if doc and meta.get("mtime") == mtime and meta.get("size_bytes") == stat.st_size:
-                continue
+@celery_app.task(name="worker.ingest_source_batch", bind=True, max_retries=settings.scan_batch_max_retries)
+def ingest_source_batch(self, job_id: int, parent_job_id: int, document_ids: list[int], deadline: float | None = None) -> dict:
+    """Индексирует батч документов скана; повтор переделывает только этот батч.
 
-            if doc:
-                document_id = doc["id"]
-                db.execute(text("DELETE FROM chunks WHERE document_id=:document_id"), {"document_id": document_id})
-                db.execute(
-                    text("UPDATE documents SET status='queued', storage_path=:storage_path, meta=:meta::jsonb WHERE id=:id"),
-                    {
-                        "id": document_id,
-                        "storage_path": str(file_path),
-                        "meta": str({"mtime": mtime, "size_bytes": stat.st_size}).replace("'", '"'),
-                    },
-                )
-            else:
-                document_id = db.execute(
-                    text(
-                        "INSERT INTO documents (source_id, scope, title, relative_path, storage_path, status, meta) "
-                        "VALUES (:source_id, 'nas', :title, :relative_path, :storage_path, 'queued', :meta::jsonb) "
-                        "RETURNING id"
-                    ),
-                    {
-                        "source_id": source_id,
-                        "title": file_path.name,
-                        "relative_path": rel_path,
-                        "storage_path": str(file_path),
-                        "meta": str({"mtime": mtime, "size_bytes": stat.st_size}).replace("'", '"'),
-                    },
-                ).scalar_one()
-
-            _ingest_file(db, document_id, file_path, job_id)
-
-        _update_job(db, job_id, "completed", "done", 100)
+    Файлы, не начатые до `deadline` скана (`time.time()`), остаются queued и уходят в следующий скан.
+    Всегда возвращает итог (даже после исчерпания повторов), чтобы callback chord сработал.
+    """
+    db = SessionLocal()
+    reporter = ProgressReporter(db, job_id)
+    try:
+        reporter.update("running", "index_batch", 5, f"Файлов в батче: {len(document_ids)}")
         db.commit()
+        candidates, missing = _batch_candidates(db, document_ids)
+        scheduler = new_scheduler(db)
+
+        def on_progress(stats: ScanStats) -> None:
+            done = stats.indexed + stats.failed + stats.deferred
+            reporter.update("running", "index_batch", 5 + 90 * done // max(1, len(candidates)), f"Обработано {done} из {len(candidates)}")
+
+        scanner = PipelinedScanner(db, scheduler, job_id=job_id)
+        stats = scanner.run(candidates, lambda candidate, _: candidate.document_id, on_progress, deadline)
+        stats.files += missing
+        stats.failed += missing
+        result = {"files": stats.files, "indexed": stats.indexed, "failed": stats.failed, "deferred": stats.deferred}
+        status = "partial_success" if stats.failed or stats.deferred else "completed"
+        reporter.update(status, "done", 100, f"{stats.describe()}; {scheduler.describe()}")
+        _merge_job_meta(db, job_id, {**result, "memory": scanner.memory.describe()})
+        parent = _roll_up_parent(db, parent_job_id)
+        db.commit()
+        if parent:
+            publish_progress(parent_job_id, *parent)
+        return result
     except Exception as exc:
-        if job_id is not None:
-            _update_job(db, job_id, "failed", "error", 100, f"Ошибка сканирования: {exc}")
+        db.rollback()
+        if self.request.retries < self.max_retries:
+            reporter.update("running", "retry", 0, f"Повтор {self.request.retries + 1}: {exc}")
             db.commit()
-        raise
+            raise self.retry(exc=exc, countdown=30 * (self.request.retries + 1))
+        reporter.update("failed", "error", 100, f"Ошибка индексации батча: {exc}")
+        parent = _roll_up_parent(db, parent_job_id)
+        db.commit()
+        if parent:
+            publish_progress(parent_job_id, *parent)
+        return {"files": len(document_ids), "indexed": 0, "failed": len(document_ids), "deferred": 0}
     finally:
         db.close()
 
 
-@celery_app.task(name="worker.scan_source_full_audit")
-def scan_source_full_audit(source_id: int):
+@celery_app.task(name="worker.finalize_source_scan")
+def finalize_source_scan(results: list[dict], job_id: int, discovery: str):
     db = SessionLocal()
-    job_id = None
+    reporter = ProgressReporter(db, job_id)
     try:
-        job_id = _create_job(db, "scan_full_audit", source_id=source_id)
-        _update_job(db, job_id, "running", "audit_start", 5)
-        source = db.execute(
-            text("SELECT id, base_path, include_globs, exclude_globs FROM sources WHERE id=:id AND enabled=TRUE"),
-            {"id": source_id},
-        ).mappings().first()
-        if not source:
-            _update_job(db, job_id, "failed", "audit_start", 100, "Источник не найден")
-            db.commit()
-            return
-
-        base_path = _resolve_source_base(source["base_path"])
-        include_globs = source["include_globs"] or []
-        exclude_globs = source["exclude_globs"] or []
-        allowed = {ext.strip().lower() for ext in settings.allowed_extensions.split(",") if ext.strip()}
-
-        scanned_files = 0
-        scanned_mb = 0.0
-        start_time = time.time()
-
-        for file_path in base_path.rglob("*"):
-            if not file_path.is_file():
-                continue
-            rel_path = file_path.relative_to(base_path).as_posix()
-            if not _matches_globs(rel_path, include_globs, exclude_globs):
-                continue
-            if file_path.suffix.lower().lstrip(".") not in allowed:
-                continue
-
-            stat = file_path.stat()
-            file_mb = stat.st_size / (1024 * 1024)
-            if scanned_files >= settings.scan_max_files or scanned_mb + file_mb > settings.scan_max_mb:
-                break
-            if time.time() - start_time > settings.scan_timeout_seconds:
-                break
-
-            scanned_files += 1
-            scanned_mb += file_mb
-            progress = int(min(90, (scanned_files / max(1, settings.scan_max_files)) * 90))
-            _update_job(db, job_id, "running", "index_file", progress, f"Индексирование {rel_path}")
-
-            doc = db.execute(
-                text("SELECT id FROM documents WHERE source_id=:source_id AND relative_path=:relative_path"),
-                {"source_id": source_id, "relative_path": rel_path},
-            ).mappings().first()
-            if doc:
-                document_id = doc["id"]
-                db.execute(text("DELETE FROM chunks WHERE document_id=:document_id"), {"document_id": document_id})
-                db.execute(
-                    text("UPDATE documents SET status='queued', storage_path=:storage_path WHERE id=:id"),
-                    {"id": document_id, "storage_path": str(file_path)},
-                )
-            else:
-                document_id = db.execute(
-                    text(
-                        "INSERT INTO documents (source_id, scope, title, relative_path, storage_path, status) "
-                        "VALUES (:source_id, 'nas', :title, :relative_path, :storage_path, 'queued') RETURNING id"
-                    ),
-                    {
-                        "source_id": source_id,
-                        "title": file_path.name,
-                        "relative_path": rel_path,
-                        "storage_path": str(file_path),
-                    },
-                ).scalar_one()
-            _ingest_file(db, document_id, file_path, job_id)
-
-        _update_job(db, job_id, "completed", "done", 100)
+        indexed = sum(result["indexed"] for result in results)
+        failed = sum(result["failed"] for result in results)
+        # Итоги батчей, запущенных до появления дедлайна скана, поля deferred не содержат.
+        deferred = sum(result.get("deferred", 0) for result in results)
+        if failed and not indexed:
+            status = "failed"
+        else:
+            status = "partial_success" if failed or deferred else "completed"
+        summary = f"{discovery}; подзадач: {len(results)}, проиндексировано {indexed}, ошибок {failed}"
+        if deferred:
+            summary += f", отложено по таймауту скана {deferred}"
+        if settings.embedding_cache_enabled:
+            # Кэш подрезается один раз на скан, а не в каждой подзадаче.
+            cache = EmbeddingCache(db)
+            cache.evict()
+            summary += f"; вытеснено из кэша эмбеддингов {cache.stats.evicted}"
+        store = get_artifact_store()
+        if store is not None:
+            summary += f"; вытеснено артефактов парсинга {store.evict()}"
+        reporter.update(status, "done", 100, summary)
         db.commit()
-    except Exception as exc:
-        if job_id is not None:
-            _update_job(db, job_id, "failed", "error", 100, f"Ошибка аудита: {exc}")
-            db.commit()
-        raise
     finally:
         db.close()
 
@@ -383,3 +403,6 @@ def cleanup_expired_temp():
         db.commit()
     finally:
         db.close()
+    store = get_artifact_store()
+    if store is not None:
+        store.evict()
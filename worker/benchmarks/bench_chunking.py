@@ -0,0 +1,71 @@
+"""Бенчмарк чанкинга: прежняя нарезка по символам против `TokenChunker` на токенизаторе BGE-M3.
+
+Для каждого режима печатает скорость (чанков/с, MB/с), среднее заполнение бюджета
+`chunk_max_tokens` и долю чанков, которые эмбеддер обрежет по `embedding_max_tokens`.
+Без `--file` текст генерируется: абзацы разной длины, разбитые на страницы.
+
+    python worker/benchmarks/bench_chunking.py --file /data/sample.txt
+    python worker/benchmarks/bench_chunking.py --pages 200
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import random
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.config import settings  # noqa: E402
+from app.pipeline.chunking import TextSegment, TokenChunker, chunk_segments, get_chunk_tokenizer  # noqa: E402
+
+WORDS = "договор поставка регламент срок согласование отчет проект закупка требование хранение".split()
+
+
+def _synthetic(pages: int, seed: int = 7) -> list[TextSegment]:
+    rng = random.Random(seed)
+    segments = []
+    for page in range(1, pages + 1):
+        paragraphs = [" ".join(rng.choices(WORDS, k=rng.randint(5, 180))) + "." for _ in range(rng.randint(2, 8))]
+        segments.append(TextSegment("\n\n".join(paragraphs), str(page)))
+    return segments
+
+
+def _report(name: str, chunks: list[str], elapsed: float, megabytes: float, tokenizer, budget: int) -> None:
+    lengths = [len(ids) for ids in tokenizer(chunks, add_special_tokens=False)["input_ids"]]
+    truncated = sum(length > settings.embedding_max_tokens - 2 for length in lengths)
+    utilization = sum(min(length, budget) for length in lengths) / (len(lengths) * budget)
+    print(
+        f"{name:<12} чанков {len(chunks):>6}, {len(chunks) / elapsed:8.0f} чанков/с, {megabytes / elapsed:6.2f} MB/с, "
+        f"заполнение бюджета {utilization:.0%}, обрезается эмбеддером {truncated / len(chunks):.1%}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", type=Path)
+    parser.add_argument("--pages", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.file:
+        segments = [TextSegment(args.file.read_text(encoding="utf-8", errors="ignore"))]
+    else:
+        segments = _synthetic(args.pages)
+    megabytes = sum(len(segment.text.encode("utf-8")) for segment in segments) / (1024 * 1024)
+    tokenizer = get_chunk_tokenizer()
+    tokenizer(["прогрев"], add_special_tokens=False, return_offsets_mapping=True)
+
+    start = time.perf_counter()
+    chars, _ = chunk_segments(segments, settings.chunk_size_chars, settings.chunk_overlap_chars)
+    _report("символы", chars, time.perf_counter() - start, megabytes, tokenizer, settings.chunk_max_tokens)
+
+    chunker = TokenChunker(tokenizer)
+    start = time.perf_counter()
+    tokens = [chunk for chunk, _ in chunker.iter_chunks(segments)]
+    _report("токены", tokens, time.perf_counter() - start, megabytes, tokenizer, chunker.max_tokens)
+
+
+if __name__ == "__main__":
+    main()
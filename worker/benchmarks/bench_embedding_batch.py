@@ -0,0 +1,77 @@
+"""Микро-бенчмарк постобработки эмбеддингов на батч из 16 текстов.
+
+Сравнивает прежний путь (`.tolist()` + `_normalize` по одному вектору + f-строки)
+с матричным путем `EmbeddingBatch` (einsum pooling, векторная нормализация, адаптеры pgvector).
+ONNX-сессия не нужна: выход модели имитируется случайным тензором нужной формы.
+
+    python worker/benchmarks/bench_embedding_batch.py --batch 16 --seq 256
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.embeddings import OnnxEmbeddingModel, to_pgvector_binary, to_pgvector_text  # noqa: E402
+
+
+def _legacy(output: np.ndarray, mask: np.ndarray) -> list[str]:
+    # Копия прежней реализации OnnxEmbeddingModel + tasks._format_vector.
+    mask_f = mask.astype(np.float32)
+    summed = (output * mask_f[:, :, None]).sum(axis=1)
+    counts = np.clip(mask_f.sum(axis=1, keepdims=True), 1.0, None)
+    pooled = (summed / counts).astype(np.float32).tolist()
+    normalized = []
+    for vec in pooled:
+        array = np.array(vec, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        normalized.append(array.tolist() if norm == 0 else (array / norm).tolist())
+    return ["[" + ",".join(f"{v:.6f}" for v in vec) + "]" for vec in normalized]
+
+
+def _matrix(model: OnnxEmbeddingModel, output: np.ndarray, mask: np.ndarray, binary: bool):
+    embeddings = model._normalize(model._select_embeddings([output], {"attention_mask": mask}))
+    return to_pgvector_binary(embeddings) if binary else to_pgvector_text(embeddings)
+
+
+def _measure(name: str, fn, repeats: int) -> None:
+    fn()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeats
+    print(f"{name:<22} {elapsed * 1000:9.2f} ms/batch  peak {peak / 1024 / 1024:8.2f} MiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--seq", type=int, default=256)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    output = rng.standard_normal((args.batch, args.seq, args.dim)).astype(np.float32)
+    lengths = rng.integers(args.seq // 4, args.seq + 1, size=args.batch)
+    mask = (np.arange(args.seq)[None, :] < lengths[:, None]).astype(np.int64)
+    model = OnnxEmbeddingModel.__new__(OnnxEmbeddingModel)
+
+    _measure("legacy lists + f-str", lambda: _legacy(output, mask), args.repeats)
+    _measure("ndarray -> text", lambda: _matrix(model, output, mask, binary=False), args.repeats)
+    _measure("ndarray -> binary", lambda: _matrix(model, output, mask, binary=True), args.repeats)
+
+
+if __name__ == "__main__":
+    main()
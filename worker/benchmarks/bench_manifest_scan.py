@@ -0,0 +1,69 @@
+"""Бенчмарк скана без изменений: обход `os.scandir` + сверка с манифестом в памяти.
+
+Создает во временном каталоге дерево из N файлов, строит манифест по первому обходу
+и замеряет повторный обход со сверкой (прежний путь — `rglob` + `stat` на файл — для сравнения).
+БД не нужна: прежний скан добавлял к этому еще по одному SELECT на каждый файл.
+
+    python worker/benchmarks/bench_manifest_scan.py --files 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.pipeline.manifest import ManifestEntry, SourceManifest, is_unchanged  # noqa: E402
+from app.pipeline.scanner import iter_source_files  # noqa: E402
+
+
+def _make_tree(base: Path, files: int, per_dir: int) -> None:
+    for idx in range(files):
+        directory = base / f"d{idx // per_dir:05d}"
+        if idx % per_dir == 0:
+            directory.mkdir()
+        (directory / f"f{idx}.txt").write_bytes(b"x")
+
+
+def _rglob(base: Path) -> int:
+    count = 0
+    for path in base.rglob("*"):
+        if path.is_file() and path.suffix == ".txt":
+            path.stat()
+            count += 1
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--per-dir", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp)
+        _make_tree(base, args.files, args.per_dir)
+        entries = {
+            c.relative_path: ManifestEntry(idx, c.mtime, c.size_bytes, c.inode, False)
+            for idx, c in enumerate(iter_source_files(base, [], [], {"txt"}))
+        }
+
+        start = time.perf_counter()
+        manifest = SourceManifest(dict(entries))
+        changed = sum(
+            not is_unchanged(manifest.take(c.relative_path), c) for c in iter_source_files(base, [], [], {"txt"})
+        )
+        scan = time.perf_counter() - start
+        print(f"scandir + манифест: {scan:.2f} s, изменено {changed}, исчезло {len(manifest.missing())}")
+
+        start = time.perf_counter()
+        count = _rglob(base)
+        print(f"rglob + stat:       {time.perf_counter() - start:.2f} s ({count} файлов, без запросов к БД)")
+
+
+if __name__ == "__main__":
+    main()
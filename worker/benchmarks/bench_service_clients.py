@@ -0,0 +1,83 @@
+"""Бенчмарк HTTP-клиентов сервисов на заглушке MinerU (mineru/app/main.py).
+
+Поднимает заглушку через uvicorn на локальном порту и сравнивает прежний путь
+(новый `httpx.Client` на каждый вызов) с общим `ServiceClient` с keep-alive пулом,
+последовательно и из нескольких потоков.
+
+    python worker/benchmarks/bench_service_clients.py --calls 500 --threads 8
+"""
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import socket
+import sys
+import threading
+import time
+
+import httpx
+import uvicorn
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "worker"))
+
+from app.clients.http import ServiceClient  # noqa: E402
+
+PAYLOAD = {"file_path": "/data/doc.pdf", "pages": [[1, 2]]}
+
+
+def _start_stub() -> tuple[uvicorn.Server, str]:
+    sys.path.insert(0, str(ROOT / "mineru"))
+    from app.main import app as stub  # noqa: E402  (пакет app заглушки, не воркера)
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}/v1/parse"
+
+
+def _fresh(url: str) -> None:
+    with httpx.Client(timeout=10) as client:
+        client.post(url, json=PAYLOAD).raise_for_status()
+
+
+def _measure(name: str, call, calls: int, threads: int) -> None:
+    start = time.perf_counter()
+    if threads == 1:
+        for _ in range(calls):
+            call()
+    else:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(lambda _: call(), range(calls)))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {elapsed / calls * 1000:7.2f} ms/вызов ({calls} вызовов, потоков {threads})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    # Пакет app воркера уже импортирован; заглушке нужен свой app.
+    for module in [name for name in sys.modules if name == "app" or name.startswith("app.")]:
+        sys.modules[f"_worker_{module}"] = sys.modules.pop(module)
+    server, url = _start_stub()
+    pooled = ServiceClient(timeout=10, max_concurrency=args.threads)
+    try:
+        for threads in (1, args.threads):
+            _measure("новый httpx.Client на вызов", lambda: _fresh(url), args.calls, threads)
+            _measure("ServiceClient (keep-alive пул)", lambda: pooled.post_json(url, PAYLOAD), args.calls, threads)
+    finally:
+        pooled.close()
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()